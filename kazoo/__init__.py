@@ -6,16 +6,14 @@ from kazoo.client import KazooClient
 __all__ = ['ZooKeeperClient', 'KazooClient']
 
 
-# ZK C client likes to spew log info to STDERR. disable that unless an
-# env is present.
+# zkpython is only imported by clients using it, which disable the ZK C
+# client's logging to STDERR unless KAZOO_LOG_ENABLED is set. this does it
+# regardless.
 
 def disable_zookeeper_log():
     import zookeeper
     zookeeper.set_log_stream(open('/dev/null'))
 
-if not "KAZOO_LOG_ENABLED" in os.environ:
-    disable_zookeeper_log()
-
 def patch_extras():
     # workaround for http://code.google.com/p/gevent/issues/detail?id=112
     # gevent isn't patching threading._sleep which causes problems
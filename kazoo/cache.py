@@ -0,0 +1,86 @@
+"""Read-through cache of node values for KazooClient
+"""
+import threading
+from collections import OrderedDict
+
+
+class NodeDataCache(object):
+    """LRU cache of (value, stat) tuples keyed by path
+
+    Entries are loaded with a data watch that drops them again when the node
+    changes or is deleted, so a cached value is never older than the next
+    watch notification.
+    """
+
+    def __init__(self, max_size):
+        """
+        @param max_size: maximum number of cached nodes
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+
+        # a token per path being loaded. invalidating the path drops the
+        # token, so a load that raced with a change is not stored.
+        self._loading = {}
+
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path, fetch):
+        """Return the cached value of a node, loading it on a miss
+
+        @param path: path of node
+        @param fetch: called as fetch(path, watch) on a miss; returns
+                      (value, stat) and sets watch on the node
+        """
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                # re-insert as most recently used
+                self._entries[path] = entry
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            token = object()
+            self._loading[path] = token
+
+        try:
+            entry = fetch(path, self._watch)
+        finally:
+            with self._lock:
+                stale = self._loading.get(path) is not token
+                if not stale:
+                    del self._loading[path]
+
+        if not stale:
+            with self._lock:
+                self._entries[path] = entry
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, path):
+        """Drop a node from the cache
+        """
+        with self._lock:
+            self._entries.pop(path, None)
+            self._loading.pop(path, None)
+
+    def flush(self):
+        """Drop every node from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+            self._loading.clear()
+
+    def _watch(self, event):
+        self.invalidate(event.path)
@@ -1,10 +1,14 @@
 import logging
 from os.path import split
+from collections import deque
 import hashlib
 
 from kazoo.zkclient import ZooKeeperClient, WatchedEvent, KeeperState,\
-    EventType, NodeExistsException, NoNodeException, AclPermission
+    EventType, NodeExistsException, NoNodeException, NotEmptyException,\
+    NoAuthException, AclPermission, TransactionRequest
 from kazoo.retry import KazooRetry
+from kazoo.cache import NodeDataCache
+from kazoo.watch import WatchRegistry, WatchType
 
 log = logging.getLogger(__name__)
 
@@ -62,25 +66,86 @@ class KazooClient(object):
     Supports retries, namespacing, easier state monitoring; saves kittens.
     """
 
-    def __init__(self, hosts, namespace=None, timeout=10.0, max_retries=None, default_acl=None):
+    # default cap on outstanding requests for the *_many bulk methods
+    MAX_IN_FLIGHT = 256
+
+    def __init__(self, hosts, namespace=None, timeout=10.0, max_retries=None,
+                 default_acl=None, engine=None, sync_strategy=None,
+                 data_cache_size=None, retry=None, retry_budget=None,
+                 circuit_breaker=None, offline_queue_size=None,
+                 offline_queue_age=None, session_store=None):
+        """
+        @param hosts: comma-separated host:port list
+        @param namespace: optional path that all paths are relative to
+        @param timeout: session timeout in seconds
+        @param max_retries: maximum tries for retried operations, if no
+                            retry policy is given
+        @param default_acl: ACL for created nodes when none is given
+        @param engine: "zkpython" (default) or "python", see ZooKeeperClient
+        @param sync_strategy: sync strategy object or name, see
+                              ZooKeeperClient
+        @param data_cache_size: if set, cache up to this many node values
+                                for get() calls without a watch
+        @param retry: KazooRetry policy for retried operations
+        @param retry_budget: RetryBudget shared by every retry policy bound
+                             to this client
+        @param circuit_breaker: CircuitBreaker shared by every retry policy
+                                bound to this client
+        @param offline_queue_size: if set, hold up to this many requests
+                                   while suspended and send them on
+                                   reconnect, see OfflineQueue
+        @param offline_queue_age: seconds a request may be held, or None
+                                  for no limit
+        @param session_store: store such as FileSessionStore that keeps
+                              the session id, so a restarted process
+                              resumes its session, and its ephemeral nodes,
+                              if it hasn't expired. close() ends the
+                              session, so exit without it to hand the
+                              session over. Give locks and parties a
+                              stable identifier so they adopt the nodes
+                              they left.
+        """
         # remove any trailing slashes
         if namespace:
             namespace = namespace.rstrip('/')
         if namespace:
             validate_path(namespace)
-        self.namespace = namespace
+        self._set_namespace(namespace)
 
-        self._needs_ensure_path = bool(namespace)
+        self.session_store = session_store
+        client_id = None
+        if session_store is not None:
+            client_id = session_store.load()
 
         self.zk = ZooKeeperClient(hosts, watcher=self._session_watcher,
-            timeout=timeout)
-        self.retry = KazooRetry(max_retries)
+            timeout=timeout, client_id=client_id, engine=engine,
+            sync_strategy=sync_strategy, offline_queue_size=offline_queue_size,
+            offline_queue_age=offline_queue_age)
+        self.retry_budget = retry_budget
+        self.circuit_breaker = circuit_breaker
+        if retry is None:
+            retry = KazooRetry(max_retries)
+        self.retry = retry.with_client(self)
 
         self.state = KazooState.LOST
         self.state_listeners = set()
 
+        # namespaced paths known to exist, which ensure_path can skip, each
+        # mapped to the set of its known children. If a path is known, so
+        # are its ancestors. Paths are forgotten when deleted through this
+        # client and on session loss.
+        self._known_paths = {}
+
         self.default_acl = default_acl
 
+        if data_cache_size:
+            self.data_cache = NodeDataCache(data_cache_size)
+        else:
+            self.data_cache = None
+
+        # shares one server watch between all watchers of a path
+        self.watches = WatchRegistry()
+
     def _session_watcher(self, event):
         """called by the underlying ZK client when the connection state changes
         """
@@ -103,6 +168,17 @@ class KazooClient(object):
 
         self.state = state
 
+        if state == KazooState.LOST:
+            self._known_paths.clear()
+            self.watches.clear()
+
+        if self.session_store is not None:
+            self._store_session(state)
+
+        # watches may be missed while disconnected
+        if self.data_cache is not None and state != KazooState.CONNECTED:
+            self.data_cache.flush()
+
         listeners = list(self.state_listeners)
         for listener in listeners:
             try:
@@ -110,6 +186,15 @@ class KazooClient(object):
             except Exception:
                 log.exception("Error in connection state listener")
 
+    def _store_session(self, state):
+        try:
+            if state == KazooState.CONNECTED:
+                self.session_store.save(self.zk.client_id)
+            elif state == KazooState.LOST:
+                self.session_store.clear()
+        except Exception:
+            log.exception("Failed to store session")
+
     def _assure_namespace(self, acl=None):
         if self._needs_ensure_path:
             self.ensure_path('/', acl=acl)
@@ -131,6 +216,57 @@ class KazooClient(object):
     def client_id(self):
         return self.zk.client_id
 
+    def stats(self):
+        """Return a snapshot of the client's instrumentation
+
+        Has the figures of ZooKeeperClient.stats(), plus those of the data
+        cache, retry budget, circuit breaker and offline queue the client
+        was given.
+
+        @return: dict of figures
+        """
+        stats = self.zk.stats()
+        if self.data_cache is not None:
+            stats['data_cache'] = dict(size=len(self.data_cache),
+                hits=self.data_cache.hits, misses=self.data_cache.misses)
+        if self.retry.budget is not None:
+            stats['retry_budget'] = self.retry.budget.stats()
+        if self.retry.breaker is not None:
+            stats['circuit_breaker'] = self.retry.breaker.stats()
+        if self.zk.offline_queue is not None:
+            stats['offline_queue'] = dict(size=len(self.zk.offline_queue))
+        stats['watches'] = dict(server=len(self.watches),
+            subscribers=self.watches.subscriber_count)
+        return stats
+
+    @property
+    def connected(self):
+        return self.state == KazooState.CONNECTED
+
+    def wait_connected(self, timeout=None):
+        """Wait while the connection is suspended
+
+        @param timeout: time in seconds to wait, or None to wait forever
+        @return True once connected; False on timeout, or if the session
+                is lost
+        """
+        async_result = self.zk.get_sync_strategy().async_result()
+
+        def listener(state):
+            if state != KazooState.SUSPENDED and not async_result.ready():
+                async_result.set(state == KazooState.CONNECTED)
+
+        self.add_listener(listener)
+        try:
+            # the state may have changed before the listener was added
+            if self.state != KazooState.SUSPENDED:
+                return self.state == KazooState.CONNECTED
+            return async_result.get(timeout=timeout)
+        except self.zk.get_sync_strategy().timeout_error:
+            return False
+        finally:
+            self.remove_listener(listener)
+
     def connect(self, timeout=None):
         """Initiate connection to ZK
 
@@ -139,8 +275,10 @@ class KazooClient(object):
         self.zk.connect(timeout=timeout)
 
     def close(self):
-        """Disconnect from ZooKeeper
+        """Disconnect from ZooKeeper, ending the session
         """
+        if self.session_store is not None:
+            self.session_store.clear()
         self.zk.close()
 
     def add_auth(self, scheme, credential):
@@ -178,11 +316,12 @@ class KazooClient(object):
             # some or all of the parent path doesn't exist. if makepath is set
             # we will create it and retry. If it fails again, someone must be
             # actively deleting ZNodes and we'd best bail out.
+            parent, _ = split(path)
+            self._forget_path(parent)
+
             if not makepath:
                 raise
 
-            parent, _ = split(path)
-
             # using the inner call directly because path is already namespaced
             self._inner_ensure_path(parent, acl)
 
@@ -202,12 +341,16 @@ class KazooClient(object):
 
         path = self.namespace_path(path)
         if watch:
-            watch = self.unnamespace_watch(watch)
-        return self.zk.exists(path, watch)
+            return self._watched_call(self.zk.exists, path, WatchType.DATA,
+                watch)
+        return self.zk.exists(path)
 
     def get(self, path, watch=None):
         """Get the value of a node
 
+        Calls without a watch are served from the data cache, if the client
+        has one.
+
         @param path: path of node
         @param watch: optional watch callback to set for future changes to this path
         @return tuple (value, stat) of node
@@ -215,8 +358,21 @@ class KazooClient(object):
 
         path = self.namespace_path(path)
         if watch:
-            watch = self.unnamespace_watch(watch)
-        return self.zk.get(path, watch)
+            return self._watched_call(self.zk.get, path, WatchType.DATA,
+                watch)
+        if self.data_cache is not None:
+            return self.data_cache.get(path, self._fetch_cached)
+        return self.zk.get(path)
+
+    def _fetch_cached(self, path, watch):
+        """Load a node for the data cache
+
+        The cache is shared with our views and keyed by full path, so its
+        watch gets unstripped paths. Reloading a node whose watch has not
+        fired yet sets no new server watch.
+        """
+        return self._watched_call(self.zk.get, path, WatchType.DATA, watch,
+            strip=0)
 
     def get_children(self, path, watch=None):
         """Get a list of child nodes of a path
@@ -228,8 +384,220 @@ class KazooClient(object):
 
         path = self.namespace_path(path)
         if watch:
-            watch = self.unnamespace_watch(watch)
-        return self.zk.get_children(path, watch)
+            return self._watched_call(self.zk.get_children, path,
+                WatchType.CHILD, watch)
+        return self.zk.get_children(path)
+
+    def exists_async(self, path, watch=None):
+        """Asynchronously check if a node exists
+
+        @param path: path of node
+        @param watch: optional watch callback to set for future changes to this path
+        @return AsyncResult set with the stat of the node if it exists,
+                else None
+        @rtype AsyncResult
+        """
+        return self._watched_async(self.zk.exists_async,
+            self.namespace_path(path), WatchType.DATA, watch)
+
+    def get_async(self, path, watch=None):
+        """Asynchronously get the value of a node
+
+        @param path: path of node
+        @param watch: optional watch callback to set for future changes to this path
+        @return AsyncResult set with tuple (value, stat) of node on success
+        @rtype AsyncResult
+        """
+        return self._watched_async(self.zk.get_async,
+            self.namespace_path(path), WatchType.DATA, watch)
+
+    def get_children_async(self, path, watch=None):
+        """Asynchronously get a list of child nodes of a path
+
+        @param path: path of node to list
+        @param watch: optional watch callback to set for future changes to this path
+        @return AsyncResult set with list of child node names on success
+        @rtype AsyncResult
+        """
+        return self._watched_async(self.zk.get_children_async,
+            self.namespace_path(path), WatchType.CHILD, watch)
+
+    def remove_watch(self, path, watch, watch_type=None):
+        """Stop calling a watch callback set on a path
+
+        The server watch stays set while other callbacks use it.
+
+        @param path: path the watch was set on
+        @param watch: the watch callback
+        @param watch_type: WatchType.DATA or WatchType.CHILD, or None for
+                           both
+        @return True if the callback was watching the path
+        """
+        return self.watches.unsubscribe(self.namespace_path(path), watch,
+            watch_type, self._namespace_len)
+
+    def _watched_call(self, func, path, watch_type, watch, strip=None):
+        """Call func for a namespaced path, subscribing watch to it
+
+        A server watch is only sent with the request if none is set for the
+        path and watch type. The registry strips our namespace, or strip
+        characters if given, from the paths of the events it passes to
+        watch.
+        """
+        if strip is None:
+            strip = self._namespace_len
+        dispatch = self.watches.subscribe(path, watch_type, watch, strip)
+        try:
+            if dispatch is None:
+                return func(path)
+            return func(path, dispatch)
+        except Exception:
+            self._watch_failed(path, watch_type, watch, strip, dispatch)
+            raise
+
+    def _watched_async(self, func_async, path, watch_type, watch):
+        """Asynchronous version of _watched_call
+        """
+        if not watch:
+            return func_async(path)
+
+        strip = self._namespace_len
+        dispatch = self.watches.subscribe(path, watch_type, watch, strip)
+        if dispatch is None:
+            async_result = func_async(path)
+        else:
+            async_result = func_async(path, dispatch)
+
+        def check_watch_set(async_result):
+            if not async_result.successful():
+                self._watch_failed(path, watch_type, watch, strip, dispatch)
+
+        async_result.rawlink(check_watch_set)
+        return async_result
+
+    def _watch_failed(self, path, watch_type, watch, strip, dispatch):
+        """Unsubscribe the watch of a failed request
+
+        If the request was to set the server watch and others subscribed to
+        it meanwhile, the watch is set for them with another request.
+        """
+        if not self.watches.failed(path, watch_type, watch, strip, dispatch):
+            return
+
+        if watch_type == WatchType.DATA:
+            # exists sets a data watch even if the node is missing
+            async_result = self.zk.exists_async(path, dispatch)
+        else:
+            async_result = self.zk.get_children_async(path, dispatch)
+
+        def check_watch_set(async_result):
+            if not async_result.successful():
+                self.watches.discard(dispatch)
+        async_result.rawlink(check_watch_set)
+
+    def exists_many(self, paths, watch=None, max_in_flight=None,
+                    retry=None):
+        """Check if many nodes exist, keeping the requests in flight together
+
+        Each path is retried on its own in the face of transient ZK errors.
+
+        @param paths: iterable of node paths
+        @param watch: optional watch callback to set on every path
+        @param max_in_flight: cap on outstanding requests
+        @param retry: KazooRetry for paths that hit a transient error, the
+                      client's if not given
+        @return: dict mapping each path to its stat or None, or to the
+                 exception raised for it
+        """
+        return self._pipeline(self.zk.exists_async, self.zk.exists, paths,
+            watch, max_in_flight, WatchType.DATA, retry)
+
+    def get_many(self, paths, watch=None, max_in_flight=None,
+                 retry=None):
+        """Get the values of many nodes, keeping the requests in flight together
+
+        Each path is retried on its own in the face of transient ZK errors.
+
+        @param paths: iterable of node paths
+        @param watch: optional watch callback to set on every path
+        @param max_in_flight: cap on outstanding requests
+        @param retry: KazooRetry for paths that hit a transient error, the
+                      client's if not given
+        @return: dict mapping each path to a (value, stat) tuple, or to the
+                 exception raised for it
+        """
+        return self._pipeline(self.zk.get_async, self.zk.get, paths,
+            watch, max_in_flight, WatchType.DATA, retry)
+
+    def get_children_many(self, paths, watch=None, max_in_flight=None,
+                          retry=None):
+        """List the children of many nodes, keeping the requests in flight
+        together
+
+        Each path is retried on its own in the face of transient ZK errors.
+
+        @param paths: iterable of node paths
+        @param watch: optional watch callback to set on every path
+        @param max_in_flight: cap on outstanding requests
+        @param retry: KazooRetry for paths that hit a transient error, the
+                      client's if not given
+        @return: dict mapping each path to its list of child node names, or
+                 to the exception raised for it
+        """
+        return self._pipeline(self.zk.get_children_async,
+            self.zk.get_children, paths, watch, max_in_flight,
+            WatchType.CHILD, retry)
+
+    def _pipeline(self, func_async, func, paths, watch=None,
+                  max_in_flight=None, watch_type=None, retry=None):
+        """Issue func_async for every path with a bounded window of requests
+        in flight, falling back to retrying func for paths that hit a
+        transient error
+        """
+        if max_in_flight is None:
+            max_in_flight = self.MAX_IN_FLIGHT
+        if retry is None:
+            retry = self.retry
+
+        results = {}
+        in_flight = deque()
+        for path in paths:
+            if len(in_flight) >= max_in_flight:
+                self._pipeline_collect(in_flight.popleft(), func, watch,
+                    watch_type, retry, results)
+            zk_path = self.namespace_path(path)
+            dispatch = None
+            if watch:
+                dispatch = self.watches.subscribe(zk_path, watch_type, watch,
+                    self._namespace_len)
+            if dispatch:
+                async_result = func_async(zk_path, dispatch)
+            else:
+                async_result = func_async(zk_path)
+            in_flight.append((path, zk_path, async_result, dispatch))
+
+        while in_flight:
+            self._pipeline_collect(in_flight.popleft(), func, watch,
+                watch_type, retry, results)
+        return results
+
+    def _pipeline_collect(self, request, func, watch, watch_type, retry,
+                          results):
+        path, zk_path, async_result, dispatch = request
+        try:
+            try:
+                result = async_result.get()
+            except retry.ALLOWED_EX:
+                if dispatch:
+                    result = retry(func, zk_path, dispatch)
+                else:
+                    result = retry(func, zk_path)
+        except Exception, e:
+            if watch:
+                self._watch_failed(zk_path, watch_type, watch,
+                    self._namespace_len, dispatch)
+            result = e
+        results[path] = result
 
     def set(self, path, data, version=-1):
         """Set the value of a node
@@ -246,7 +614,11 @@ class KazooClient(object):
         self._assure_namespace()
 
         path = self.namespace_path(path)
-        return self.zk.set(path, data, version)
+        try:
+            return self.zk.set(path, data, version)
+        finally:
+            if self.data_cache is not None:
+                self.data_cache.invalidate(path)
 
     def delete(self, path, version=-1):
         """Delete a node
@@ -255,16 +627,36 @@ class KazooClient(object):
         @param version: version of node to delete, or -1 for any
         """
         path = self.namespace_path(path)
-        return self.zk.delete(path, version)
+        self._forget_path(path)
+        try:
+            return self.zk.delete(path, version)
+        finally:
+            if self.data_cache is not None:
+                self.data_cache.invalidate(path)
+
+    def transaction(self):
+        """Create a transaction to commit several operations atomically
+
+        Paths are relative to the client's namespace. See TransactionRequest
+        for the results of committing it.
+
+        @return: a TransactionRequest
+        """
+        self._assure_namespace()
+        return KazooTransactionRequest(self)
 
     def ensure_path(self, path, acl=None):
         """Recursively create a path if it doesn't exist
+
+        Paths already ensured by this client cost no round trips. Otherwise
+        the deepest node is created first and the parents only on
+        NoNodeException.
         """
         path = self.namespace_path(path)
         self._inner_ensure_path(path, acl)
 
     def _inner_ensure_path(self, path, acl):
-        if self.zk.exists(path):
+        if path in self._known_paths or path == "/":
             return
 
         if acl is None and self.default_acl:
@@ -272,35 +664,145 @@ class KazooClient(object):
 
         parent, node = split(path)
 
-        if parent != "/":
+        try:
+            self._create_if_missing(path, acl)
+        except NoNodeException:
+            # the parent is missing, even if we thought we knew better
+            self._forget_path(parent)
             self._inner_ensure_path(parent, acl)
+            self._create_if_missing(path, acl)
+
+        known = self._known_paths
+        child = None
+        while path != "/":
+            if path in known:
+                if child is not None:
+                    known[path].add(child)
+                break
+            known[path] = set([child]) if child is not None else set()
+            child, path = path, split(path)[0]
+
+    def _create_if_missing(self, path, acl):
         try:
             self.zk.create(path, "", acl=acl)
         except NodeExistsException:
             # someone else created the node. how sweet!
             pass
+        except NoAuthException:
+            # we may not be allowed to create a node that already exists
+            if not self.zk.exists(path):
+                raise
 
-    def recursive_delete(self, path):
-        """Recursively delete a ZNode and all of its children
+    def _forget_path(self, path):
+        """Drop a namespaced path and its descendants from the known paths
         """
-        try:
-            children = self.get_children(path)
-        except NoNodeException:
+        known = self._known_paths
+        children = known.pop(path, None)
+        if children is None:
+            # known paths always have known ancestors
             return
 
-        if children:
-            for child in children:
-                self.recursive_delete(path + "/" + child)
-        try:
-            self.delete(path)
-        except NoNodeException:
-            pass
+        parent = known.get(split(path)[0])
+        if parent is not None:
+            parent.discard(path)
+
+        descendants = list(children)
+        while descendants:
+            descendants.extend(known.pop(descendants.pop(), ()))
+
+    def recursive_delete(self, path, max_in_flight=None, progress=None):
+        """Recursively delete a ZNode and all of its children
+
+        The tree is listed a level at a time and deleted bottom-up, with up
+        to max_in_flight requests outstanding. Nodes deleted by someone else
+        meanwhile are skipped; nodes that gain children meanwhile are listed
+        and deleted again.
+
+        @param path: path of node to delete
+        @param max_in_flight: cap on outstanding requests
+        @param progress: optional callback called as progress(deleted, total)
+                         after each level is deleted. deleted counts the
+                         nodes we removed. total is the number of nodes
+                         listed, less those deleted by someone else.
+        """
+        self._forget_path(self.namespace_path(path))
+        self._recursive_delete(path, max_in_flight, progress, [0, 0])
+
+    def _recursive_delete(self, path, max_in_flight, progress, counts):
+        """
+        @param counts: [deleted, total] shared by the calls that delete
+                       the tree again
+        """
+        levels = []
+        level = [path]
+        while level:
+            listing = self.get_children_many(level,
+                max_in_flight=max_in_flight)
+            existing = []
+            next_level = []
+            for parent in level:
+                children = listing[parent]
+                if isinstance(children, NoNodeException):
+                    continue
+                if isinstance(children, Exception):
+                    raise children
+                existing.append(parent)
+                parent = parent.rstrip('/')
+                next_level.extend(parent + "/" + child for child in children)
+            levels.append(existing)
+            level = next_level
+
+        counts[1] += sum(len(level) for level in levels)
+        for level in reversed(levels):
+            results = self._pipeline(self.zk.delete_async, self.zk.delete,
+                level, max_in_flight=max_in_flight)
+            if self.data_cache is not None:
+                # like delete(), so a get() right after sees the nodes gone
+                for node in level:
+                    self.data_cache.invalidate(self.namespace_path(node))
+            not_empty = []
+            for node, result in results.iteritems():
+                if isinstance(result, NotEmptyException):
+                    not_empty.append(node)
+                elif isinstance(result, NoNodeException):
+                    counts[1] -= 1
+                elif isinstance(result, Exception):
+                    raise result
+                else:
+                    counts[0] += 1
+            if progress:
+                progress(counts[0], counts[1])
+
+            for node in not_empty:
+                # a child was added since we listed this node. it is counted
+                # again when listed again
+                counts[1] -= 1
+                self._recursive_delete(node, max_in_flight, progress, counts)
 
     def with_retry(self, func, *args, **kwargs):
         """Run a method repeatedly in the face of transient ZK errors
         """
         return self.retry(func, *args, **kwargs)
 
+    def chroot(self, path):
+        """Return a view of this client with paths relative to path
+
+        The view shares this client's connection, state, listeners, retry
+        policy, watches and caches, so any number of views cost a single
+        session. Only paths and watch events are rewritten.
+
+        @param path: path the view is rooted at, relative to this client's
+                     namespace
+        @rtype KazooClient
+        """
+        return _KazooChroot(self, self.namespace_path(path))
+
+    def _set_namespace(self, namespace):
+        self.namespace = namespace or None
+        self._needs_ensure_path = bool(namespace)
+        # length of the prefix unnamespace_path strips
+        self._namespace_len = len(namespace) if namespace else 0
+
     def namespace_path(self, path):
         if not self.namespace:
             return path
@@ -313,9 +815,12 @@ class KazooClient(object):
         if not self.namespace:
             return path
         if path.startswith(self.namespace):
-            return path[len(self.namespace):]
+            return path[self._namespace_len:] or '/'
 
     def unnamespace_watch(self, watch):
+        if not self.namespace:
+            return watch
+
         def fixed_watch(event):
             if event.path:
                 # make a new event with the fixed path
@@ -326,6 +831,60 @@ class KazooClient(object):
 
         return fixed_watch
 
+class _KazooChroot(KazooClient):
+    """View of a KazooClient rooted at a path, made by KazooClient.chroot()
+
+    Its attributes are those of the client it was made from, so the
+    connection, watch registry, caches and listener set are shared
+    objects. Its namespace is the full path from the root of ZooKeeper,
+    joined once here, so views of views cost no more per call than a
+    single namespace.
+    """
+
+    def __init__(self, client, namespace):
+        """
+        @type client KazooClient
+        @param namespace: namespaced path the view is rooted at
+        """
+        self.__dict__.update(client.__dict__)
+        # the client that owns the connection, and receives its events
+        self._root = getattr(client, '_root', client)
+        self.__dict__.pop('state', None)
+
+        namespace = namespace.rstrip('/')
+        if namespace:
+            validate_path(namespace)
+        self._set_namespace(namespace)
+
+    @property
+    def state(self):
+        return self._root.state
+
+    def connect(self, timeout=None):
+        """Connect the shared client, unless it has a session already
+
+        @param timeout: time in seconds to wait for connection to succeed
+        """
+        if self._root.state == KazooState.LOST:
+            self._root.connect(timeout)
+
+    def close(self):
+        """Do nothing, as the connection belongs to the client the view was
+        made from
+        """
+
+class KazooTransactionRequest(TransactionRequest):
+    """Transaction with paths relative to a KazooClient's namespace
+    """
+
+    def __init__(self, client):
+        """
+        @type client KazooClient
+        """
+        TransactionRequest.__init__(self, client.zk, client.default_acl)
+        self._namespace_path = client.namespace_path
+        self._unnamespace_path = client.unnamespace_path
+
 def validate_path(path):
     if not path.startswith('/'):
         raise ValueError("invalid path '%s'. must start with /" % path)
@@ -0,0 +1,497 @@
+"""Pure-Python ZooKeeper connection engine
+
+An alternative to the zkpython C binding. The connection runs its socket loop
+on the sync strategy's own event loop (a greenlet under gevent, a daemon
+thread otherwise), so completions and watches are delivered without a hop
+from a foreign OS thread.
+
+PythonBinding mirrors the subset of the zkpython module API used by
+ZooKeeperClient, so the engine can sit behind the existing *_async methods.
+"""
+import errno
+import fcntl
+import itertools
+import logging
+import os
+import random
+import socket
+import select
+import time
+from collections import deque
+
+from kazoo import protocol
+from kazoo.protocol import Reader, frame, ConnectRequest, Create, Delete,\
+    Exists, GetData, SetData, GetChildren, Ping, Auth, SetWatches, Close,\
+    Transaction, WatcherEvent
+
+log = logging.getLogger(__name__)
+
+_RECV_SIZE = 65536
+_MAX_RECONNECT_DELAY = 2.0
+
+
+class ConnectionDropped(Exception):
+    """Raised internally when the socket to the server is lost
+    """
+
+
+class SessionExpired(Exception):
+    """Raised internally when the server refuses to resume our session
+    """
+
+
+def collect_hosts(hosts):
+    """Parse a ZooKeeper host string into a list of (host, port) tuples
+    """
+    result = []
+    for host_port in hosts.split(","):
+        host_port = host_port.strip()
+        if not host_port:
+            continue
+        host, _, port = host_port.partition(":")
+        result.append((host, int(port or 2181)))
+    random.shuffle(result)
+    return result
+
+
+def _pipe():
+    r, w = os.pipe()
+    fcntl.fcntl(r, fcntl.F_SETFL, os.O_NONBLOCK)
+    fcntl.fcntl(w, fcntl.F_SETFL, os.O_NONBLOCK)
+    return r, w
+
+
+class Connection(object):
+    """A ZooKeeper session driven by a non-blocking socket loop
+
+    Requests may be submitted from any thread. Everything else -- framing,
+    xid tracking, pings, watch bookkeeping and reconnects -- happens in the
+    loop spawned on the sync strategy.
+    """
+
+    def __init__(self, sync, hosts, watcher, timeout, client_id=None):
+        """
+        @param sync: sync strategy whose loop runs the connection
+        @param hosts: comma-separated host:port list
+        @param watcher: session watcher called as (handle, type, state, path)
+        @param timeout: requested session timeout in milliseconds
+        @param client_id: optional (session_id, passwd) to resume
+        """
+        self._sync = sync
+        self._hosts = collect_hosts(hosts)
+        if not self._hosts:
+            raise ValueError("no hosts in '%s'" % hosts)
+        self._watcher = watcher
+        self._session_timeout = timeout
+
+        if client_id:
+            self._session_id, self._session_passwd = client_id
+        else:
+            self._session_id, self._session_passwd = 0, "\0" * 16
+        self._last_zxid = 0
+
+        self.state = protocol.CONNECTING_STATE
+        self._closing = False
+        self._closed = False
+
+        self._xids = itertools.count(1)
+
+        # (xid, request, callback, watcher) waiting to be written. appended
+        # from any thread, drained only by the loop.
+        self._outbox = deque()
+
+        # written requests waiting for a reply, keyed by xid
+        self._pending = {}
+
+        # auth is replayed on every reconnect; callbacks are waiting on the
+        # in-order replies, which all share AUTH_XID
+        self._auth_data = []
+        self._auth_callbacks = deque()
+
+        self._data_watchers = {}
+        self._exist_watchers = {}
+        self._child_watchers = {}
+
+        self._wake_read, self._wake_write = _pipe()
+
+        self._sync.spawn(self._run)
+
+    @property
+    def client_id(self):
+        return self._session_id, self._session_passwd
+
+    def submit(self, request, callback, watcher=None):
+        """Queue a request for the server
+
+        @param request: a kazoo.protocol request
+        @param callback: called as (code, *reply) when the reply arrives
+        @param watcher: optional watcher registered on a successful reply
+        """
+        self._enqueue((self._xids.next(), request, callback, watcher))
+
+    def add_auth(self, scheme, credential, callback):
+        self._enqueue((protocol.AUTH_XID, Auth(0, scheme, credential),
+                       callback, None))
+
+    def _enqueue(self, entry):
+        if self._closed or self.state in (protocol.EXPIRED_SESSION_STATE,
+                                          protocol.AUTH_FAILED_STATE):
+            entry[2](protocol.INVALIDSTATE)
+            return
+        self._outbox.append(entry)
+        if self._closed:
+            # lost a race with the loop shutting down
+            self._fail_outstanding(protocol.INVALIDSTATE)
+        else:
+            self._wake()
+
+    def close(self, timeout=None):
+        """Close the session, waiting for the server to acknowledge
+        """
+        if self._closing:
+            return
+        if self.state != protocol.CONNECTED_STATE:
+            self._closing = True
+            self._wake()
+            return
+
+        async_result = self._sync.async_result()
+        def callback(code, *args):
+            async_result.set(code)
+        self.submit(Close(), callback)
+        if timeout is None:
+            timeout = self._session_timeout / 1000.0
+        try:
+            async_result.get(timeout=timeout)
+        except self._sync.timeout_error:
+            log.warning("Timed out closing ZooKeeper session")
+        self._closing = True
+        self._wake()
+
+    def __del__(self):
+        for fd in ("_wake_read", "_wake_write"):
+            if getattr(self, fd, None) is not None:
+                try:
+                    os.close(getattr(self, fd))
+                except Exception:
+                    pass
+
+    def _wake(self):
+        try:
+            os.write(self._wake_write, '\0')
+        except EnvironmentError, e:
+            # a full pipe means a wakeup is already pending
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def _run(self):
+        hosts = itertools.cycle(self._hosts)
+        delay = 0.0
+        try:
+            while not self._closing:
+                if delay:
+                    self._sync.sleep(delay)
+                host, port = hosts.next()
+                try:
+                    self._connect(host, port)
+                except SessionExpired:
+                    log.warning("ZooKeeper session 0x%x has expired",
+                        self._session_id)
+                    self._set_state(protocol.EXPIRED_SESSION_STATE)
+                    break
+                except (ConnectionDropped, socket.error, select.error,
+                        EnvironmentError), e:
+                    log.warning("Connection to %s:%s dropped: %s",
+                        host, port, e)
+                    if self.state == protocol.CONNECTED_STATE:
+                        delay = 0.0
+                        self._set_state(protocol.CONNECTING_STATE)
+                    # don't hammer the ensemble, but try the next host quickly
+                    delay = min(max(delay * 2, 0.05) * random.uniform(1, 1.5),
+                                _MAX_RECONNECT_DELAY)
+                    self._fail_outstanding(protocol.CONNECTIONLOSS)
+        except Exception:
+            log.exception("Unexpected error in ZooKeeper connection loop")
+        finally:
+            self._closed = True
+            self._fail_outstanding(protocol.CLOSING
+                if self._closing else protocol.SESSIONEXPIRED)
+
+    def _connect(self, host, port):
+        read_timeout = self._session_timeout * 2.0 / 3.0 / 1000.0
+        sock = self._sync.create_connection((host, port), read_timeout)
+        try:
+            request = ConnectRequest(0, self._last_zxid,
+                self._session_timeout, self._session_id, self._session_passwd)
+            sock.sendall(frame(None, request))
+            reader = Reader(self._read_frame(sock))
+            _, negotiated, session_id, passwd = \
+                ConnectRequest.deserialize(reader)
+            if negotiated <= 0:
+                raise SessionExpired()
+
+            self._session_id = session_id
+            self._session_passwd = passwd
+            self._session_timeout = negotiated
+            log.debug("Connected to %s:%s with session 0x%x", host, port,
+                session_id)
+
+            self._replay_session()
+            self._set_state(protocol.CONNECTED_STATE)
+            self._io_loop(sock)
+        finally:
+            sock.close()
+
+    def _read_frame(self, sock):
+        header = self._read_exact(sock, 4)
+        return self._read_exact(sock, Reader(header).read_int())
+
+    def _read_exact(self, sock, count):
+        chunks = []
+        while count:
+            data = sock.recv(count)
+            if not data:
+                raise ConnectionDropped("socket closed by server")
+            chunks.append(data)
+            count -= len(data)
+        return ''.join(chunks)
+
+    def _replay_session(self):
+        """Re-send auth and watches ahead of anything queued while offline
+        """
+        replay = [(protocol.AUTH_XID, Auth(0, scheme, credential), None, None)
+                  for scheme, credential in self._auth_data]
+        if self._data_watchers or self._exist_watchers or \
+           self._child_watchers:
+            request = SetWatches(self._last_zxid, self._data_watchers.keys(),
+                self._exist_watchers.keys(), self._child_watchers.keys())
+            replay.append((protocol.SET_WATCHES_XID, request, None, None))
+        self._outbox.extendleft(reversed(replay))
+
+    def _io_loop(self, sock):
+        sock.setblocking(0)
+        timeout = self._session_timeout / 1000.0
+        read_timeout = timeout * 2.0 / 3.0
+        ping_interval = timeout / 3.0
+
+        inbuf = ''
+        outbuf = ''
+        last_send = last_recv = time.time()
+
+        while True:
+            while self._outbox:
+                xid, request, callback, watcher = self._outbox.popleft()
+                if xid == protocol.AUTH_XID:
+                    if callback is None:
+                        callback = _ignore
+                    else:
+                        self._auth_data.append(
+                            (request.scheme, request.auth))
+                    self._auth_callbacks.append(callback)
+                elif xid > 0:
+                    self._pending[xid] = (request, callback, watcher)
+                outbuf += frame(xid, request)
+
+            if self._closing:
+                return
+
+            now = time.time()
+            if not outbuf and now - last_send >= ping_interval:
+                outbuf = frame(protocol.PING_XID, Ping())
+
+            wait = max(0.0, min(last_send + ping_interval,
+                                last_recv + read_timeout) - now)
+            if outbuf:
+                wlist = [sock]
+            else:
+                wlist = []
+            rlist, wlist, _ = self._sync.select([sock, self._wake_read],
+                wlist, [], wait)
+
+            if self._wake_read in rlist:
+                try:
+                    os.read(self._wake_read, _RECV_SIZE)
+                except EnvironmentError:
+                    pass
+
+            now = time.time()
+            if wlist:
+                sent = sock.send(outbuf)
+                outbuf = outbuf[sent:]
+                last_send = now
+
+            if sock in rlist:
+                data = sock.recv(_RECV_SIZE)
+                if not data:
+                    raise ConnectionDropped("socket closed by server")
+                last_recv = now
+                inbuf = self._read_replies(inbuf + data)
+            elif now - last_recv >= read_timeout:
+                raise ConnectionDropped("no reply from server in %.1fs" %
+                                        read_timeout)
+
+    def _read_replies(self, data):
+        """Process every complete frame in data, returning the remainder
+        """
+        offset = 0
+        end = len(data)
+        while end - offset >= 4:
+            length = Reader(data, offset).read_int()
+            if end - offset - 4 < length:
+                break
+            start = offset + 4
+            offset = start + length
+            self._read_reply(Reader(data[start:offset]))
+        return data[offset:]
+
+    def _read_reply(self, reader):
+        xid, zxid, code = reader.read_reply_header()
+        if zxid > 0:
+            self._last_zxid = zxid
+
+        if xid == protocol.WATCH_XID:
+            self._dispatch_watch(WatcherEvent.deserialize(reader))
+        elif xid == protocol.PING_XID or xid == protocol.SET_WATCHES_XID:
+            pass
+        elif xid == protocol.AUTH_XID:
+            callback = self._auth_callbacks.popleft()
+            if code == protocol.AUTHFAILED:
+                self._set_state(protocol.AUTH_FAILED_STATE)
+                self._closing = True
+            self._call(callback, code)
+        else:
+            try:
+                request, callback, watcher = self._pending.pop(xid)
+            except KeyError:
+                raise ConnectionDropped("reply for unknown xid %d" % xid)
+
+            if code == protocol.OK or (getattr(request, "deserialize_errors",
+                    False) and reader.offset < len(reader.data)):
+                reply = request.deserialize(reader)
+            else:
+                reply = ()
+
+            if watcher:
+                self._register_watcher(request, code, watcher)
+
+            self._call(callback, code, *reply)
+
+            if request.type == Close.type:
+                self._closing = True
+
+    def _register_watcher(self, request, code, watcher):
+        if request.type == GetChildren.type:
+            watchers = self._child_watchers
+        elif request.type == GetData.type:
+            watchers = self._data_watchers
+        elif code == protocol.NONODE:
+            watchers = self._exist_watchers
+        else:
+            watchers = self._data_watchers
+
+        if code == protocol.OK or (code == protocol.NONODE and
+                                   request.type == Exists.type):
+            watchers.setdefault(request.path, []).append(watcher)
+
+    def _dispatch_watch(self, event):
+        path = event.path
+        if event.type == protocol.CREATED_EVENT:
+            sources = (self._exist_watchers,)
+        elif event.type == protocol.CHANGED_EVENT:
+            sources = (self._data_watchers, self._exist_watchers)
+        elif event.type == protocol.DELETED_EVENT:
+            sources = (self._data_watchers, self._exist_watchers,
+                       self._child_watchers)
+        elif event.type == protocol.CHILD_EVENT:
+            sources = (self._child_watchers,)
+        else:
+            sources = ()
+
+        for watchers in sources:
+            for watcher in watchers.pop(path, ()):
+                self._call(watcher, self, event.type, event.state, path)
+
+    def _set_state(self, state):
+        self.state = state
+        if self._watcher:
+            self._call(self._watcher, self, protocol.SESSION_EVENT, state, "")
+
+    def _fail_outstanding(self, code):
+        pending = self._pending.values()
+        self._pending.clear()
+        callbacks = [callback for _, callback, _ in pending]
+        callbacks.extend(self._auth_callbacks)
+        self._auth_callbacks.clear()
+        while self._outbox:
+            xid, _, callback, _ = self._outbox.popleft()
+            if callback:
+                callbacks.append(callback)
+        for callback in callbacks:
+            self._call(callback, code)
+
+    def _call(self, fun, *args):
+        try:
+            fun(*args)
+        except Exception:
+            log.exception("Exception in kazoo connection callback")
+
+
+def _ignore(*args):
+    pass
+
+
+class PythonBinding(object):
+    """Stands in for the zkpython module, backed by Connection
+
+    Handles returned by init() are Connection objects and callbacks receive
+    the same arguments zkpython would give them.
+    """
+
+    def __init__(self, sync):
+        self._sync = sync
+
+    def init(self, hosts, watcher, timeout, client_id=None):
+        return Connection(self._sync, hosts, watcher, timeout, client_id)
+
+    def client_id(self, handle):
+        return handle.client_id
+
+    def close(self, handle):
+        handle.close()
+        return protocol.OK
+
+    def add_auth(self, handle, scheme, credential, callback):
+        handle.add_auth(scheme, credential, _completion(handle, callback))
+
+    def acreate(self, handle, path, value, acl, flags, callback):
+        handle.submit(Create(path, value, acl, flags),
+            _completion(handle, callback))
+
+    def aexists(self, handle, path, watcher, callback):
+        def completion(code, stat=None):
+            callback(handle, code, stat)
+        handle.submit(Exists(path, watcher is not None), completion, watcher)
+
+    def aget(self, handle, path, watcher, callback):
+        handle.submit(GetData(path, watcher is not None),
+            _completion(handle, callback), watcher)
+
+    def aget_children(self, handle, path, watcher, callback):
+        handle.submit(GetChildren(path, watcher is not None),
+            _completion(handle, callback), watcher)
+
+    def aset(self, handle, path, data, version, callback):
+        handle.submit(SetData(path, data, version),
+            _completion(handle, callback))
+
+    def adelete(self, handle, path, version, callback):
+        handle.submit(Delete(path, version), _completion(handle, callback))
+
+    def amulti(self, handle, operations, callback):
+        handle.submit(Transaction(operations), _completion(handle, callback))
+
+
+def _completion(handle, callback):
+    def completion(code, *args):
+        callback(handle, code, *args)
+    return completion
@@ -1,11 +1,86 @@
-from zookeeper import SystemErrorException, RuntimeInconsistencyException,\
-    DataInconsistencyException, ConnectionLossException,\
-    MarshallingErrorException,UnimplementedException,OperationTimeoutException,\
-    BadArgumentsException,ApiErrorException, NoNodeException, NoAuthException,\
-    BadVersionException,NoChildrenForEphemeralsException,NodeExistsException,\
-    InvalidACLException, AuthFailedException, NotEmptyException,\
-    SessionExpiredException, InvalidCallbackException
+class ZooKeeperException(Exception):
+    """Base class of the errors ZooKeeper reports
+    """
+
+class SystemErrorException(ZooKeeperException):
+    pass
+
+class RuntimeInconsistencyException(ZooKeeperException):
+    pass
+
+class DataInconsistencyException(ZooKeeperException):
+    pass
+
+class ConnectionLossException(ZooKeeperException):
+    pass
+
+class MarshallingErrorException(ZooKeeperException):
+    pass
+
+class UnimplementedException(ZooKeeperException):
+    pass
+
+class OperationTimeoutException(ZooKeeperException):
+    pass
+
+class BadArgumentsException(ZooKeeperException):
+    pass
+
+class InvalidStateException(ZooKeeperException):
+    pass
+
+class ApiErrorException(ZooKeeperException):
+    pass
+
+class NoNodeException(ZooKeeperException):
+    pass
+
+class NoAuthException(ZooKeeperException):
+    pass
+
+class BadVersionException(ZooKeeperException):
+    pass
+
+class NoChildrenForEphemeralsException(ZooKeeperException):
+    pass
+
+class NodeExistsException(ZooKeeperException):
+    pass
+
+class NotEmptyException(ZooKeeperException):
+    pass
+
+class SessionExpiredException(ZooKeeperException):
+    pass
+
+class InvalidCallbackException(ZooKeeperException):
+    pass
+
+class InvalidACLException(ZooKeeperException):
+    pass
+
+class AuthFailedException(ZooKeeperException):
+    pass
+
+class ClosingException(ZooKeeperException):
+    pass
+
+class NothingException(ZooKeeperException):
+    pass
+
+class SessionMovedException(ZooKeeperException):
+    pass
 
 class CancelledError(Exception):
     """Raised when a process is cancelled by another thread
     """
+
+class RolledBackException(Exception):
+    """Result of a transaction operation that was rolled back because another
+    operation in the same transaction failed
+    """
+
+class CircuitOpenException(Exception):
+    """Raised instead of trying an operation while the circuit breaker has
+    stopped calls to a failing ensemble
+    """
@@ -0,0 +1,171 @@
+"""Holds requests made while the connection is suspended
+"""
+import threading
+import time
+from collections import deque
+
+from kazoo import protocol
+import kazoo.sync.util
+# the thread module as the binding's threads see it, even under gevent
+realthread = kazoo.sync.util.get_realthread()
+
+
+class OfflineQueue(object):
+    """Wraps a ZooKeeper binding, queueing requests while suspended
+
+    While the connection is suspended, asynchronous requests are held
+    instead of failing with ConnectionLossException. When it comes back
+    they are all sent at once, in the order they were made. If the
+    session is lost instead, they fail with SessionExpiredException.
+
+    Requests that don't fit in max_size, or that wait longer than
+    max_age seconds, fail with ConnectionLossException. So do requests made
+    on the binding's callback thread, which is where callbacks run under
+    the threading strategy: a blocking call there would wait forever for
+    the reconnection that same thread has to report.
+
+    The queue follows the session through session_event(), which the
+    binding calls before anyone else hears of the new state.
+    """
+
+    # binding calls that are queued. the last argument of each is its
+    # completion callback.
+    REQUESTS = frozenset(['add_auth', 'acreate', 'adelete', 'aexists',
+                          'aget', 'aget_children', 'aset', 'amulti'])
+
+    def __init__(self, binding, sync, max_size=1000, max_age=None):
+        """
+        @param binding: the zkpython binding, or one like it
+        @param sync: sync strategy to wait for aged requests with
+        @param max_size: most requests to hold
+        @param max_age: seconds a request may be held, or None for no limit
+        """
+        self.binding = binding
+        self.sync = sync
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self.suspended = False
+        # ident of the thread the binding reports session events on
+        self._callback_thread = None
+
+        # (time queued, binding call name, args)
+        self._requests = deque()
+        self._reaping = False
+        # reentrant, as failing a request runs its callbacks, which may
+        # make more requests
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._requests)
+
+    def __getattr__(self, name):
+        attr = getattr(self.binding, name)
+        if name not in self.REQUESTS:
+            return attr
+
+        def request(*args):
+            with self._lock:
+                if not self.suspended:
+                    return attr(*args)
+                if len(self._requests) < self.max_size and \
+                   realthread.get_ident() != self._callback_thread:
+                    self._requests.append((time.time(), name, args))
+                    self._start_reaping()
+                    return protocol.OK
+            _fail(args, protocol.CONNECTIONLOSS)
+            return protocol.OK
+        return request
+
+    def session_event(self, state):
+        """Suspend, resume or fail the queue for a new session state
+
+        Must be called on the thread the binding reports it on.
+
+        @param state: ZooKeeper session state
+        """
+        self._callback_thread = realthread.get_ident()
+        if state == protocol.CONNECTING_STATE:
+            self.suspend()
+        elif state == protocol.CONNECTED_STATE:
+            self.resume()
+        elif state in (protocol.EXPIRED_SESSION_STATE,
+                       protocol.AUTH_FAILED_STATE):
+            self.fail_all()
+
+    def suspend(self):
+        """Start holding requests
+        """
+        with self._lock:
+            self.suspended = True
+
+    def resume(self):
+        """Send the held requests, and stop holding new ones
+        """
+        with self._lock:
+            self.suspended = False
+            expired = self._expire()
+            requests = self._requests
+            self._requests = deque()
+
+            # still under the lock, so new requests go out after these
+            for _, name, args in requests:
+                getattr(self.binding, name)(*args)
+
+        for args in expired:
+            _fail(args, protocol.CONNECTIONLOSS)
+
+    def fail_all(self, code=protocol.SESSIONEXPIRED):
+        """Fail the held requests, and stop holding new ones
+
+        @param code: ZooKeeper error code to fail them with
+        """
+        with self._lock:
+            self.suspended = False
+            requests = self._requests
+            self._requests = deque()
+
+        for _, _, args in requests:
+            _fail(args, code)
+
+    def _expire(self):
+        """Drop the requests older than max_age
+
+        @return: the args of the dropped requests
+        """
+        expired = []
+        if self.max_age is None:
+            return expired
+        cutoff = time.time() - self.max_age
+        requests = self._requests
+        while requests and requests[0][0] <= cutoff:
+            expired.append(requests.popleft()[2])
+        return expired
+
+    def _start_reaping(self):
+        if self.max_age is not None and not self._reaping:
+            self._reaping = True
+            self.sync.spawn(self._reap)
+
+    def _reap(self):
+        """Fail requests as they age, while any are held
+        """
+        while True:
+            with self._lock:
+                expired = self._expire()
+                if self._requests:
+                    wait = self._requests[0][0] + self.max_age - time.time()
+                else:
+                    self._reaping = False
+                    wait = None
+
+            for args in expired:
+                _fail(args, protocol.CONNECTIONLOSS)
+            if wait is None:
+                return
+            self.sync.sleep(max(wait, 0))
+
+
+def _fail(args, code):
+    handle, callback = args[0], args[-1]
+    callback(handle, code, None)
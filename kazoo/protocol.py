@@ -0,0 +1,415 @@
+"""Jute serialization of the ZooKeeper wire protocol
+
+Used by the pure-Python connection engine in kazoo.connection. Constant values
+match those of the ZooKeeper C client so results can be fed through the same
+callbacks as zkpython's.
+"""
+import struct
+from collections import namedtuple
+
+# error codes
+OK = 0
+SYSTEMERROR = -1
+RUNTIMEINCONSISTENCY = -2
+DATAINCONSISTENCY = -3
+CONNECTIONLOSS = -4
+MARSHALLINGERROR = -5
+UNIMPLEMENTED = -6
+OPERATIONTIMEOUT = -7
+BADARGUMENTS = -8
+INVALIDSTATE = -9
+APIERROR = -100
+NONODE = -101
+NOAUTH = -102
+BADVERSION = -103
+NOCHILDRENFOREPHEMERALS = -108
+NODEEXISTS = -110
+NOTEMPTY = -111
+SESSIONEXPIRED = -112
+INVALIDCALLBACK = -113
+INVALIDACL = -114
+AUTHFAILED = -115
+CLOSING = -116
+NOTHING = -117
+SESSIONMOVED = -118
+
+# session states
+CONNECTING_STATE = 1
+ASSOCIATING_STATE = 2
+CONNECTED_STATE = 3
+EXPIRED_SESSION_STATE = -112
+AUTH_FAILED_STATE = -113
+
+# watch event types
+CREATED_EVENT = 1
+DELETED_EVENT = 2
+CHANGED_EVENT = 3
+CHILD_EVENT = 4
+SESSION_EVENT = -1
+NOTWATCHING_EVENT = -2
+
+# create flags
+EPHEMERAL = 1
+SEQUENCE = 2
+
+# acl permissions
+PERM_READ = 1
+PERM_WRITE = 2
+PERM_CREATE = 4
+PERM_DELETE = 8
+PERM_ADMIN = 16
+PERM_ALL = 31
+
+# reserved xids
+WATCH_XID = -1
+PING_XID = -2
+AUTH_XID = -4
+SET_WATCHES_XID = -8
+
+STAT_FIELDS = ('czxid', 'mzxid', 'ctime', 'mtime', 'version', 'cversion',
+               'aversion', 'ephemeralOwner', 'dataLength', 'numChildren',
+               'pzxid')
+
+# messages of the C client's zerror()
+_ERROR_MESSAGES = {
+    OK: "ok",
+    SYSTEMERROR: "system error",
+    RUNTIMEINCONSISTENCY: "run time inconsistency",
+    DATAINCONSISTENCY: "data inconsistency",
+    CONNECTIONLOSS: "connection loss",
+    MARSHALLINGERROR: "marshalling error",
+    UNIMPLEMENTED: "unimplemented",
+    OPERATIONTIMEOUT: "operation timeout",
+    BADARGUMENTS: "bad arguments",
+    INVALIDSTATE: "invalid zhandle state",
+    APIERROR: "api error",
+    NONODE: "no node",
+    NOAUTH: "not authenticated",
+    BADVERSION: "bad version",
+    NOCHILDRENFOREPHEMERALS: "no children for ephemerals",
+    NODEEXISTS: "node exists",
+    NOTEMPTY: "not empty",
+    SESSIONEXPIRED: "session expired",
+    INVALIDCALLBACK: "invalid callback",
+    INVALIDACL: "invalid acl",
+    AUTHFAILED: "authentication failed",
+    CLOSING: "zookeeper is closing",
+    NOTHING: "(not error) no server responses to process",
+    SESSIONMOVED: "session moved to another server, so operation is ignored",
+}
+
+
+def zerror(code):
+    """Return the message for an error code, like the C client's zerror()
+    """
+    return _ERROR_MESSAGES.get(code, "unknown error")
+
+
+_int = struct.Struct('!i')
+_long = struct.Struct('!q')
+_bool = struct.Struct('!?')
+_stat = struct.Struct('!qqqqiiiqiiq')
+_reply_header = struct.Struct('!iqi')
+_multi_header = struct.Struct('!i?i')
+
+
+class Reader(object):
+    """Reads jute-encoded values from a received frame
+    """
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def _unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def read_int(self):
+        return self._unpack(_int)[0]
+
+    def read_long(self):
+        return self._unpack(_long)[0]
+
+    def read_bool(self):
+        return self._unpack(_bool)[0]
+
+    def read_buffer(self):
+        length = self.read_int()
+        if length < 0:
+            return None
+        start = self.offset
+        self.offset += length
+        return self.data[start:self.offset]
+
+    read_string = read_buffer
+
+    def read_vector(self, read_item):
+        count = self.read_int()
+        if count < 0:
+            return None
+        return [read_item() for _ in xrange(count)]
+
+    def read_stat(self):
+        return dict(zip(STAT_FIELDS, self._unpack(_stat)))
+
+    def read_reply_header(self):
+        return self._unpack(_reply_header)
+
+    def read_multi_header(self):
+        return self._unpack(_multi_header)
+
+
+class Writer(object):
+    """Accumulates jute-encoded values for an outgoing frame
+    """
+    def __init__(self):
+        self.parts = []
+
+    def write_int(self, value):
+        self.parts.append(_int.pack(value))
+
+    def write_long(self, value):
+        self.parts.append(_long.pack(value))
+
+    def write_bool(self, value):
+        self.parts.append(_bool.pack(value))
+
+    def write_buffer(self, value):
+        if value is None:
+            self.write_int(-1)
+        else:
+            self.write_int(len(value))
+            self.parts.append(value)
+
+    def write_string(self, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        self.write_buffer(value)
+
+    def write_vector(self, items, write_item):
+        if items is None:
+            self.write_int(-1)
+            return
+        self.write_int(len(items))
+        for item in items:
+            write_item(item)
+
+    def write_acl(self, acl):
+        self.write_int(acl['perms'])
+        self.write_string(acl['scheme'])
+        self.write_string(acl['id'])
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+
+def frame(xid, request):
+    """Serialize a request with its header into a length-prefixed frame
+    """
+    writer = Writer()
+    if xid is not None:
+        writer.write_int(xid)
+        writer.write_int(request.type)
+    request.serialize(writer)
+    data = writer.getvalue()
+    return _int.pack(len(data)) + data
+
+
+# Requests. Each knows its op type, how to write its body and how to read
+# the body of a successful reply. Replies are returned as a tuple of the
+# arguments zkpython would pass to the completion callback.
+
+class ConnectRequest(namedtuple('ConnectRequest', ('protocol_version',
+        'last_zxid_seen', 'timeout', 'session_id', 'passwd'))):
+    type = None
+
+    def serialize(self, w):
+        w.write_int(self.protocol_version)
+        w.write_long(self.last_zxid_seen)
+        w.write_int(self.timeout)
+        w.write_long(self.session_id)
+        w.write_buffer(self.passwd)
+
+    @classmethod
+    def deserialize(cls, r):
+        protocol_version = r.read_int()
+        timeout = r.read_int()
+        session_id = r.read_long()
+        passwd = r.read_buffer()
+        return protocol_version, timeout, session_id, passwd
+
+
+class Create(namedtuple('Create', ('path', 'data', 'acl', 'flags'))):
+    type = 1
+
+    def serialize(self, w):
+        w.write_string(self.path)
+        w.write_buffer(self.data)
+        w.write_vector(self.acl, w.write_acl)
+        w.write_int(self.flags)
+
+    @classmethod
+    def deserialize(cls, r):
+        return (r.read_string(),)
+
+
+class Delete(namedtuple('Delete', ('path', 'version'))):
+    type = 2
+
+    def serialize(self, w):
+        w.write_string(self.path)
+        w.write_int(self.version)
+
+    @classmethod
+    def deserialize(cls, r):
+        return ()
+
+
+class Exists(namedtuple('Exists', ('path', 'watch'))):
+    type = 3
+
+    def serialize(self, w):
+        w.write_string(self.path)
+        w.write_bool(self.watch)
+
+    @classmethod
+    def deserialize(cls, r):
+        return (r.read_stat(),)
+
+
+class GetData(namedtuple('GetData', ('path', 'watch'))):
+    type = 4
+
+    def serialize(self, w):
+        w.write_string(self.path)
+        w.write_bool(self.watch)
+
+    @classmethod
+    def deserialize(cls, r):
+        data = r.read_buffer()
+        return data, r.read_stat()
+
+
+class SetData(namedtuple('SetData', ('path', 'data', 'version'))):
+    type = 5
+
+    def serialize(self, w):
+        w.write_string(self.path)
+        w.write_buffer(self.data)
+        w.write_int(self.version)
+
+    @classmethod
+    def deserialize(cls, r):
+        return (r.read_stat(),)
+
+
+class GetChildren(namedtuple('GetChildren', ('path', 'watch'))):
+    type = 8
+
+    def serialize(self, w):
+        w.write_string(self.path)
+        w.write_bool(self.watch)
+
+    @classmethod
+    def deserialize(cls, r):
+        return (r.read_vector(r.read_string),)
+
+
+class CheckVersion(namedtuple('CheckVersion', ('path', 'version'))):
+    type = 13
+
+    def serialize(self, w):
+        w.write_string(self.path)
+        w.write_int(self.version)
+
+    @classmethod
+    def deserialize(cls, r):
+        return ()
+
+
+class ErrorResult(namedtuple('ErrorResult', ('code',))):
+    """Result of one operation in a failed transaction
+    """
+    type = -1
+
+    @classmethod
+    def deserialize(cls, r):
+        return (cls(r.read_int()),)
+
+
+class Transaction(namedtuple('Transaction', ('operations',))):
+    """Several operations applied atomically by the multi op
+
+    The reply is a list with one entry per operation: the created path,
+    the new stat, True for delete and check, or an ErrorResult.
+    """
+    type = 14
+
+    # a failed transaction still carries per-operation results
+    deserialize_errors = True
+
+    _results = dict((op.type, op) for op in (Create, Delete, SetData,
+                                             CheckVersion, ErrorResult))
+
+    def serialize(self, w):
+        for op in self.operations:
+            w.parts.append(_multi_header.pack(op.type, False, -1))
+            op.serialize(w)
+        w.parts.append(_multi_header.pack(-1, True, -1))
+
+    @classmethod
+    def deserialize(cls, r):
+        results = []
+        while True:
+            op_type, done, _ = r.read_multi_header()
+            if done:
+                break
+            reply = cls._results[op_type].deserialize(r)
+            results.append(reply[0] if reply else True)
+        return (results,)
+
+
+class Ping(namedtuple('Ping', ())):
+    type = 11
+
+    def serialize(self, w):
+        pass
+
+
+class Auth(namedtuple('Auth', ('auth_type', 'scheme', 'auth'))):
+    type = 100
+
+    def serialize(self, w):
+        w.write_int(self.auth_type)
+        w.write_string(self.scheme)
+        w.write_buffer(self.auth)
+
+
+class SetWatches(namedtuple('SetWatches', ('relative_zxid', 'data_watches',
+        'exist_watches', 'child_watches'))):
+    type = 101
+
+    def serialize(self, w):
+        w.write_long(self.relative_zxid)
+        w.write_vector(self.data_watches, w.write_string)
+        w.write_vector(self.exist_watches, w.write_string)
+        w.write_vector(self.child_watches, w.write_string)
+
+
+class Close(namedtuple('Close', ())):
+    type = -11
+
+    def serialize(self, w):
+        pass
+
+    @classmethod
+    def deserialize(cls, r):
+        return ()
+
+
+class WatcherEvent(namedtuple('WatcherEvent', ('type', 'state', 'path'))):
+
+    @classmethod
+    def deserialize(cls, r):
+        return cls(r.read_int(), r.read_int(), r.read_string())
@@ -0,0 +1,177 @@
+import time
+import uuid
+
+from kazoo.recipe.lock import Waiter
+from kazoo.exceptions import NodeExistsException, NoNodeException
+
+
+def _deadline(timeout):
+    if timeout is None:
+        return None
+    return time.time() + timeout
+
+
+class Barrier(object):
+    """Holds waiters back while its node exists
+    """
+
+    def __init__(self, client, path):
+        """
+        @type client KazooClient
+        """
+        self.client = client
+        self.path = path
+        self._waiter = Waiter()
+
+    def create(self):
+        """Raise the barrier
+        """
+        try:
+            self.client.retry(self.client.create, self.path, "",
+                makepath=True)
+        except NodeExistsException:
+            pass
+
+    def remove(self):
+        """Lift the barrier, releasing every waiter
+
+        @return False if the barrier was not raised
+        """
+        try:
+            self.client.retry(self.client.delete, self.path)
+        except NoNodeException:
+            return False
+        return True
+
+    def wait(self, timeout=None):
+        """Wait until the barrier is lifted
+
+        @param timeout: seconds to wait, or None to wait forever
+        @return True if the barrier was lifted, False on timeout
+        """
+        deadline = _deadline(timeout)
+        waiter = self._waiter
+        while True:
+            changes = waiter.changes
+            if not self.client.retry(self.client.exists, self.path,
+                                     waiter.watch):
+                return True
+            if not waiter.wait(changes, deadline):
+                return False
+
+
+class DoubleBarrier(object):
+    """Lets num_clients participants start and finish a phase together
+
+    enter() returns once num_clients participants have entered; the last
+    to arrive creates a ready node that every waiter watches, so all are
+    released by one notification. leave() returns once all of them have
+    left. Participants are ephemeral nodes, so ones that die are not
+    waited for.
+    """
+
+    _READY_NODE = "ready"
+
+    def __init__(self, client, path, num_clients, identifier=None):
+        """
+        @type client KazooClient
+        @param num_clients: number of participants to wait for
+        @param identifier: name of our participant node, unique per barrier
+        """
+        self.client = client
+        self.path = path
+        self.num_clients = num_clients
+
+        self.node = identifier or uuid.uuid4().hex
+        self.create_path = self.path + "/" + self.node
+        self.ready_path = self.path + "/" + self._READY_NODE
+
+        self.participating = False
+        self._waiter = Waiter()
+
+    def enter(self, timeout=None):
+        """Enter the barrier, waiting for the other participants
+
+        @param timeout: seconds to wait, or None to wait forever
+        @return True once everyone has entered, False on timeout, in which
+                case we have left again
+        """
+        deadline = _deadline(timeout)
+        self.client.retry(self._inner_enter)
+        self.participating = True
+
+        waiter = self._waiter
+        while True:
+            changes = waiter.changes
+            if self.client.retry(self.client.exists, self.ready_path,
+                                 waiter.watch):
+                return True
+
+            if len(self._participants()) >= self.num_clients:
+                try:
+                    self.client.retry(self.client.create, self.ready_path, "")
+                except NodeExistsException:
+                    pass
+                return True
+
+            if not waiter.wait(changes, deadline):
+                self._delete_node()
+                return False
+
+    def _inner_enter(self):
+        try:
+            self.client.create(self.create_path, "", ephemeral=True,
+                makepath=True)
+        except NodeExistsException:
+            # we may be retrying after our create succeeded
+            pass
+
+    def leave(self, timeout=None):
+        """Leave the barrier, waiting for the other participants to leave
+
+        @param timeout: seconds to wait, or None to wait forever
+        @return True once everyone has left, False on timeout
+        """
+        deadline = _deadline(timeout)
+        waiter = self._waiter
+        while True:
+            changes = waiter.changes
+            participants = sorted(self._participants())
+            if not participants:
+                break
+
+            if participants == [self.node]:
+                self._delete_node()
+                break
+
+            # the lowest participant leaves last, after the highest. the
+            # others leave at once and wait for the lowest, so each of us
+            # watches one node.
+            if participants[0] == self.node:
+                watched = participants[-1]
+            else:
+                if self.node in participants:
+                    self._delete_node()
+                watched = participants[0]
+
+            if self.client.retry(self.client.exists,
+                                 self.path + "/" + watched, waiter.watch):
+                if not waiter.wait(changes, deadline):
+                    return False
+
+        try:
+            self.client.retry(self.client.delete, self.ready_path)
+        except NoNodeException:
+            pass
+        return True
+
+    def _participants(self):
+        children = self.client.retry(self.client.get_children, self.path)
+        return [child for child in children if child != self._READY_NODE]
+
+    def _delete_node(self):
+        try:
+            self.client.retry(self.client.delete, self.create_path)
+        except NoNodeException:
+            pass
+        self.participating = False
@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+
+from kazoo.exceptions import BadVersionException, NoNodeException,\
+    NodeExistsException
+
+log = logging.getLogger(__name__)
+
+class ZooCounter(object):
+    """Integer counter stored in a node, updated by compare-and-set
+
+    Each add() reads the node and writes it back with the version it read,
+    trying again if someone else wrote in between.
+
+    Every write stores a token unique to it next to the value, and the node
+    keeps the tokens of its RECENT_WRITES latest writes. A write retried
+    after its reply was lost finds its token and is not applied again, so
+    totals stay exact unless RECENT_WRITES other writes land between a
+    lost reply and its retry.
+
+    In aggregating mode (flush_interval or flush_threshold given) add()
+    only records the delta locally. Deltas are written as one update every
+    flush_interval seconds, or once they add up to flush_threshold, so
+    totals stay exact while ZooKeeper sees far fewer writes. Call close()
+    to write what is left. A failed flush is retried by the next one, so
+    the RECENT_WRITES limit applies to the writes made meanwhile: with many
+    writers and a long flush_interval, raise RECENT_WRITES to match.
+    """
+
+    # tokens of the latest writes kept in the node
+    RECENT_WRITES = 20
+
+    def __init__(self, client, path, default=0, flush_interval=None,
+                 flush_threshold=None):
+        """
+        @type client KazooClient
+        @param default: value of the counter when its node doesn't exist
+        @param flush_interval: seconds between writes of buffered deltas
+        @param flush_threshold: write buffered deltas once their sum reaches
+                                this magnitude
+        """
+        self.client = client
+        self.path = path
+        self.default = default
+
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.aggregating = bool(flush_interval or flush_threshold)
+
+        # local deltas not yet written, in aggregating mode
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        # held while writing, so flushes don't race each other
+        self._flush_lock = threading.Lock()
+        # (delta, token) of the flush being written, or of one that failed
+        # and may have been written
+        self._unconfirmed = None
+        # bumped whenever a delta moves to or from _unconfirmed, under
+        # _pending_lock
+        self._generation = 0
+
+        self._closed = False
+        if flush_interval:
+            self.client.zk.get_sync_strategy().spawn(self._flush_loop)
+
+    @property
+    def value(self):
+        """The current value, including deltas not yet written
+        """
+        while True:
+            with self._pending_lock:
+                pending = self._pending
+                unconfirmed = self._unconfirmed
+                generation = self._generation
+            value, tokens, _ = self.client.retry(self._inner_get)
+            with self._pending_lock:
+                if self._generation == generation:
+                    break
+            # a flush moved deltas while we read. read again
+
+        if unconfirmed is not None and unconfirmed[1] not in tokens:
+            # a flush in progress, or a failed one, that didn't reach the
+            # node
+            value += unconfirmed[0]
+        return value + pending
+
+    def add(self, delta=1):
+        """Add delta to the counter
+
+        @return the new value, or None in aggregating mode, where it is not
+                known until the delta is written
+        """
+        if not self.aggregating:
+            return self.client.retry(self._inner_add, delta, _token())
+
+        with self._pending_lock:
+            self._pending += delta
+            pending = self._pending
+        if self.flush_threshold and abs(pending) >= self.flush_threshold:
+            self.flush()
+        return None
+
+    def flush(self):
+        """Write the buffered deltas now
+
+        @return the new value
+        """
+        with self._flush_lock:
+            if self._unconfirmed is not None:
+                # written again with the same token, so it is applied once
+                self.client.retry(self._inner_add, *self._unconfirmed)
+                self._confirm()
+
+            with self._pending_lock:
+                delta, self._pending = self._pending, 0
+                # counted by value until the node has its token. if the
+                # write fails, it is kept for the next flush.
+                self._unconfirmed = (delta, _token())
+                self._generation += 1
+            new_value = self.client.retry(self._inner_add, *self._unconfirmed)
+            self._confirm()
+            return new_value
+
+    def _confirm(self):
+        with self._pending_lock:
+            self._unconfirmed = None
+            self._generation += 1
+
+    def close(self):
+        """Stop the flush timer and write the buffered deltas
+        """
+        self._closed = True
+        if self.aggregating:
+            self.flush()
+
+    def _flush_loop(self):
+        sync = self.client.zk.get_sync_strategy()
+        while True:
+            sync.sleep(self.flush_interval)
+            if self._closed:
+                return
+            if not self._pending and self._unconfirmed is None:
+                continue
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Failed to flush counter %s", self.path)
+
+    def _inner_get(self):
+        """Return the value, the tokens of recent writes and the stat
+        """
+        try:
+            data, stat = self.client.get(self.path)
+        except NoNodeException:
+            return self.default, [], None
+        fields = data.split()
+        return int(fields[0]), fields[1:], stat
+
+    def _inner_add(self, delta, token):
+        while True:
+            value, tokens, stat = self._inner_get()
+            if token in tokens:
+                # an earlier try was written, but its reply was lost
+                return value
+            new_value = value + delta
+            if not delta:
+                return new_value
+
+            tokens = [token] + tokens[:self.RECENT_WRITES - 1]
+            data = " ".join([str(new_value)] + tokens)
+            try:
+                if stat is None:
+                    self.client.create(self.path, data, makepath=True)
+                else:
+                    self.client.set(self.path, data,
+                        version=stat['version'])
+            except (BadVersionException, NodeExistsException):
+                # someone else wrote first. try again with their value
+                continue
+            return new_value
+
+
+def _token():
+    return os.urandom(8).encode('hex')
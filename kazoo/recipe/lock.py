@@ -1,17 +1,71 @@
 import threading
+import time
 import uuid
+from functools import partial
+
+from kazoo.retry import ForceRetryError, BackoffTimer
+from kazoo.exceptions import CancelledError, NoNodeException
+
+
+class Waiter(object):
+    """Sleeps until a watch fires, without missing ones that fire early
+
+    Watches fire on the client's callback thread, which must never wait on
+    us, so nodes are read outside the condition. The change count is taken
+    before reading; wait() returns at once if a watch fired since.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.changes = 0
+
+    def watch(self, event):
+        with self.condition:
+            self.changes += 1
+            self.condition.notify_all()
+
+    def wait(self, changes, deadline):
+        """Wait for a watch to fire
+
+        @param changes: value of changes before the nodes were read
+        @param deadline: time.time() to give up at, or None
+        @return False if the deadline passed, else True
+        """
+        with self.condition:
+            if self.changes != changes:
+                return True
+            if deadline is None:
+                self.condition.wait()
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            self.condition.wait(remaining)
+            return True
 
-from kazoo.retry import ForceRetryError
-from zookeeper import NoNodeException
-from kazoo.exceptions import CancelledError
 
 class ZooLock(object):
     _LOCK_NAME = '_lock_'
 
-    def __init__(self, client, path, contender_name=None):
+    # names of every kind of contender node that may share our lock path
+    _CONTENDER_NAMES = (_LOCK_NAME,)
+
+    def __init__(self, client, path, contender_name=None, identifier=None):
         """
         @type client KazooClient
+        @param identifier: name for our contender node, unique among the
+                           lock's contenders and stable across restarts.
+                           With a client that resumes its session, it lets
+                           a restarted process adopt the node it left,
+                           instead of queueing behind it. Random if not
+                           given. It must not contain '/' or the names
+                           that mark the kind of a contender.
         """
+        if identifier is not None:
+            for name in ("/",) + self._CONTENDER_NAMES:
+                if name in identifier:
+                    raise ValueError("identifier must not contain '%s'" %
+                                     name)
         self.client = client
         self.path = path
 
@@ -25,43 +79,103 @@ class ZooLock(object):
         # create request to succeed on the server, but for a failure to
         # prevent us from getting back the full path name. We prefix our
         # lock name with a uuid and can check for its presence on retry.
-        self.prefix = uuid.uuid4().hex + self._LOCK_NAME
+        self.prefix = (identifier or uuid.uuid4().hex) + self._LOCK_NAME
         self.create_path = self.path + "/" + self.prefix
 
-        self.create_tried = False
+        # with a stable identifier, a node of ours may be left by a previous
+        # process sharing our session, so look before creating one
+        self.create_tried = identifier is not None
+        self._identifier = identifier
 
         self.is_acquired = False
 
         self.assured_path = False
 
         self.cancelled = False
+        # whether a blocking acquire() is in progress
+        self._acquiring = False
+
+        # result of a pending acquire_async()
+        self._async_result = None
+        # bumped by each acquire, so cleanups left from earlier ones stop
+        self._attempt = 0
+        # tries of the pending acquire_async(), and when it started
+        self._async_tries = 0
+        self._async_started = None
+        # space out retries of acquire_async() and its cleanup
+        sync = client.zk.get_sync_strategy()
+        self._backoff = BackoffTimer(client.retry, sync)
+        self._cleanup_backoff = BackoffTimer(client.retry, sync)
 
     def cancel(self):
         """Cancel a pending lock acquire
+
+        Does nothing to a later acquire if none is pending.
         """
         with self.condition:
-            self.cancelled = True
-            self.condition.notify_all()
-
-    def acquire(self):
-        """Acquire the mutex, blocking until it is obtained
+            if self._acquiring:
+                self.cancelled = True
+                self.condition.notify_all()
+
+        async_result = self._async_result
+        if async_result is not None and not async_result.ready():
+            async_result.set_exception(CancelledError())
+            self._cleanup_async()
+
+    def acquire(self, blocking=True, timeout=None):
+        """Acquire the mutex
+
+        If the lock can't be obtained in time, our contender node is removed
+        again before returning. Retries on connection errors are bound by the
+        same time, so a non-blocking or timed acquire also returns False if
+        ZooKeeper can't be reached in time.
+
+        @param blocking: if False, give up at once if the lock is held
+        @param timeout: seconds to wait for the lock, or None to wait forever
+        @return True if the lock was acquired, else False
         """
+        retry = self.client.retry
+        deadline = None
+        if not blocking:
+            retry = retry.within(0)
+        elif timeout is not None:
+            deadline = time.time() + timeout
+            # don't retry for longer than the caller waits
+            retry = retry.within(timeout)
+
+        self._attempt += 1
+        with self.condition:
+            self._acquiring = True
         try:
-            self.client.retry(self._inner_acquire)
-
-            self.is_acquired = True
-
+            try:
+                acquired = retry(self._inner_acquire, blocking, deadline)
+            except retry.ALLOWED_EX:
+                if retry is self.client.retry:
+                    raise
+                # out of time before the lock could be looked at
+                acquired = False
         except Exception:
             # if we did ultimately fail, attempt to clean up
             self._best_effort_cleanup()
-            self.cancelled = False
             raise
+        finally:
+            with self.condition:
+                self._acquiring = False
+                self.cancelled = False
 
-    def _inner_acquire(self):
+        if acquired:
+            self.is_acquired = True
+        else:
+            self._best_effort_cleanup()
+            self.create_tried = self._identifier is not None
+        return acquired
+
+    def _inner_acquire(self, blocking=True, deadline=None):
 
         # make sure our election parent node exists
         if not self.assured_path:
             self.client.ensure_path(self.path)
+            self.assured_path = True
 
         node = None
         if self.create_tried:
@@ -70,8 +184,13 @@ class ZooLock(object):
             self.create_tried = True
 
         if not node:
-            node = self.client.create(self.create_path, self.data,
-                ephemeral=True, sequence=True)
+            try:
+                node = self.client.create(self.create_path, self.data,
+                    ephemeral=True, sequence=True)
+            except NoNodeException:
+                # our parent node was deleted out from under us
+                self.assured_path = False
+                raise ForceRetryError()
             # strip off path to node
             node = node[len(self.path)+1:]
 
@@ -93,34 +212,284 @@ class ZooLock(object):
                 # node was removed
                 raise ForceRetryError()
 
-            #noinspection PySimplifyBooleanCheck
-            if our_index == 0:
+            predecessor = self._predecessor(children, our_index)
+            if predecessor is None:
                 # we have the lock
                 return True
 
+            if not blocking:
+                return False
+
             # otherwise we are in the mix. watch predecessor and bide our time
-            predecessor = self.path + "/" + children[our_index-1]
+            predecessor = self.path + "/" + predecessor
             with self.condition:
                 if self.client.exists(predecessor, self._watch_predecessor):
-                    self.condition.wait()
+                    if deadline is None:
+                        self.condition.wait()
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            return False
+                        self.condition.wait(remaining)
+
+    def _predecessor(self, children, our_index):
+        """Return the contender we have to wait for, or None if we hold the
+        lock
+
+        @param children: sorted contender nodes
+        @param our_index: index of our node in children
+        """
+        if our_index == 0:
+            return None
+        return children[our_index-1]
 
     def _watch_predecessor(self, event):
         with self.condition:
             self.condition.notify_all()
 
+    def acquire_async(self):
+        """Asynchronously acquire the mutex
+
+        No thread waits for the lock: the result is set from the predecessor
+        watch once we hold it. cancel() fails it with CancelledError.
+        Connection errors are retried, spaced and limited like the client's
+        retries, before it fails.
+
+        @return AsyncResult set with True once the lock is acquired
+        @rtype AsyncResult
+        """
+        async_result = self.client.zk.get_sync_strategy().async_result()
+        self._async_result = async_result
+        self._attempt += 1
+        self._async_tries = 1
+        self._async_started = time.time()
+
+        # make sure our election parent node exists
+        if not self.assured_path:
+            self.client.ensure_path(self.path)
+            self.assured_path = True
+
+        if self._identifier is not None:
+            node = self.client.retry(self._find_node)
+            if node:
+                # left by a previous process sharing our session
+                self.node = node
+                self._async_check(async_result)
+                return async_result
+        elif self.create_tried:
+            # an earlier acquire we couldn't clean up after may have left
+            # our node
+            self._async_find(async_result)
+            return async_result
+
+        self._async_create(async_result)
+        return async_result
+
+    def _async_create(self, async_result):
+        self.create_tried = True
+        create = self.client.zk.create_async(
+            self.client.namespace_path(self.create_path), self.data,
+            acl=self.client.default_acl, ephemeral=True, sequence=True)
+        create.rawlink(partial(self._async_created, async_result))
+
+    def _async_created(self, async_result, create):
+        if async_result.ready():
+            # cancelled while creating
+            self._cleanup_async()
+            return
+        try:
+            node = create.get()
+        except Exception, e:
+            if isinstance(e, NoNodeException):
+                self.assured_path = False
+            # the create may have succeeded, so look for our node before
+            # creating another
+            self._async_retry(async_result, e, self._async_find)
+            return
+
+        self.node = self.client.unnamespace_path(node)[len(self.path)+1:]
+        self._async_check(async_result)
+
+    def _async_find(self, async_result):
+        children = self.client.zk.get_children_async(
+            self.client.namespace_path(self.path))
+        children.rawlink(partial(self._async_found, async_result))
+
+    def _async_found(self, async_result, children):
+        if async_result.ready():
+            return
+        try:
+            children = children.get()
+        except Exception, e:
+            self._async_retry(async_result, e, self._async_find)
+            return
+
+        for child in children:
+            if child.startswith(self.prefix):
+                # only we create nodes with our prefix in this session, and
+                # acquire_async() deleted any that another session left
+                self.node = child
+                self._async_check(async_result)
+                return
+        self._async_create(async_result)
+
+    def _async_check(self, async_result, event=None):
+        if async_result.ready():
+            return
+        children = self.client.zk.get_children_async(
+            self.client.namespace_path(self.path))
+        children.rawlink(partial(self._async_children, async_result))
+
+    def _async_children(self, async_result, children):
+        if async_result.ready():
+            return
+        try:
+            children = self._sort_children(children.get())
+            our_index = children.index(self.node)
+        except ValueError:
+            # our ephemeral node is gone with the session
+            self._async_failed(async_result,
+                NoNodeException("lock node was removed"))
+            return
+        except Exception, e:
+            self._async_retry(async_result, e, self._async_check)
+            return
+        self._backoff.reset()
+
+        predecessor = self._predecessor(children, our_index)
+        if predecessor is None:
+            self.is_acquired = True
+            async_result.set(True)
+            return
+
+        predecessor = self.client.namespace_path(
+            self.path + "/" + predecessor)
+        exists = self.client.zk.exists_async(predecessor,
+            partial(self._async_check, async_result))
+        exists.rawlink(partial(self._async_predecessor, async_result))
+
+    def _async_predecessor(self, async_result, exists):
+        try:
+            stat = exists.get()
+        except Exception, e:
+            self._async_retry(async_result, e, self._async_check)
+            return
+
+        # if the predecessor went away before the watch was set, look again
+        if stat is None:
+            self._async_check(async_result)
+
+    def _async_retry(self, async_result, exc, func):
+        """Call func(async_result) again after a connection error, or fail
+        with exc if it isn't one or the client's retries would give up
+        """
+        if async_result.ready():
+            return
+        if isinstance(exc, self.client.retry.CONNECTION_EX) and \
+           self._may_retry(self._async_tries, self._async_started):
+            self._async_tries += 1
+            self._backoff.schedule(
+                partial(self._async_retried, async_result, func))
+        else:
+            self._async_failed(async_result, exc)
+
+    def _async_retried(self, async_result, func):
+        if not async_result.ready():
+            func(async_result)
+
+    def _may_retry(self, tries, started):
+        """Return whether the client's retry policy allows another try
+        """
+        retry = self.client.retry
+        if retry.max_tries and tries >= retry.max_tries:
+            return False
+        if retry.deadline is not None and \
+           time.time() - started >= retry.deadline:
+            return False
+        return True
+
+    def _async_failed(self, async_result, exc):
+        if not async_result.ready():
+            async_result.set_exception(exc)
+        # if our node can't be removed now, the next acquire looks for it
+        self.create_tried = True
+        self._cleanup_async()
+
+    def _cleanup_async(self, attempt=None, tries=1, started=None):
+        """Remove our contender node without blocking
+
+        Connection errors are retried like the client's retries, until
+        another acquire is started.
+        """
+        if attempt is None:
+            attempt = self._attempt
+            started = time.time()
+        if attempt != self._attempt:
+            return
+        zk = self.client.zk
+
+        def failed(e):
+            if isinstance(e, self.client.retry.CONNECTION_EX) and \
+               self._may_retry(tries, started):
+                self._cleanup_backoff.schedule(partial(self._cleanup_async,
+                    attempt, tries + 1, started))
+
+        def deleted(delete):
+            try:
+                delete.get()
+            except NoNodeException:
+                pass
+            except Exception, e:
+                failed(e)
+
+        def delete_ours(children):
+            try:
+                children = children.get()
+            except Exception, e:
+                failed(e)
+                return
+            if attempt != self._attempt:
+                return
+            for child in children:
+                if child.startswith(self.prefix):
+                    zk.delete_async(self.client.namespace_path(
+                        self.path + "/" + child)).rawlink(deleted)
+
+        children = zk.get_children_async(
+            self.client.namespace_path(self.path))
+        children.rawlink(delete_ours)
+
     def _get_sorted_children(self):
-        children = self.client.get_children(self.path)
+        return self._sort_children(self.client.get_children(self.path))
 
-        # can't just sort directly: the node names are prefixed by uuids
-        lockname = self._LOCK_NAME
-        children.sort(key=lambda c: c[c.find(lockname) + len(lockname):])
+    def _sort_children(self, children):
+        # can't just sort directly: the node names are prefixed by uuids or
+        # identifiers, so sort on the sequence number that ends them
+        children.sort(key=_sequence)
         return children
 
     def _find_node(self):
+        """Return our contender node, if our session has one
+
+        A node with our prefix may belong to another session, such as one a
+        restarted process did not resume. It goes away with that session,
+        letting another contender in while we think we hold the lock, so it
+        is deleted rather than adopted.
+        """
         children = self.client.get_children(self.path)
         for child in children:
-            if child.startswith(self.prefix):
+            if not child.startswith(self.prefix):
+                continue
+            path = self.path + "/" + child
+            stat = self.client.exists(path)
+            if stat is None:
+                continue
+            if stat['ephemeralOwner'] == self.client.client_id[0]:
                 return child
+            try:
+                self.client.delete(path)
+            except NoNodeException:
+                pass
         return None
 
     def _best_effort_cleanup(self):
@@ -155,6 +524,7 @@ class ZooLock(object):
         # make sure our election parent node exists
         if not self.assured_path:
             self.client.ensure_path(self.path)
+            self.assured_path = True
 
         children = self._get_sorted_children()
 
@@ -174,4 +544,52 @@ class ZooLock(object):
         self.release()
 
 
-  
\ No newline at end of file
+class ZooWriteLock(ZooLock):
+    """Exclusive half of a ZooReadWriteLock
+    """
+    _LOCK_NAME = '_write_'
+    _CONTENDER_NAMES = ('_read_', '_write_')
+
+
+class ZooReadLock(ZooLock):
+    """Shared half of a ZooReadWriteLock
+
+    Readers only wait for the nearest writer queued ahead of them, so
+    readers queued together hold the lock at the same time.
+    """
+    _LOCK_NAME = '_read_'
+    _CONTENDER_NAMES = ('_read_', '_write_')
+
+    def _predecessor(self, children, our_index):
+        for child in reversed(children[:our_index]):
+            # the identifier before the kind may contain anything
+            if child[:-10].endswith(ZooWriteLock._LOCK_NAME):
+                return child
+        return None
+
+
+class ZooReadWriteLock(object):
+    """Lock shared by readers and exclusive to a writer
+
+    Both halves use the same sequential-node queue under path. A writer
+    waits for its immediate predecessor; a reader waits for the nearest
+    writer before it. Each contender watches a single node, so releases
+    don't wake a herd.
+    """
+
+    def __init__(self, client, path, contender_name=None, identifier=None):
+        """
+        @type client KazooClient
+        @param identifier: stable name for our contender nodes, see ZooLock
+        """
+        self.client = client
+        self.path = path
+
+        self.read_lock = ZooReadLock(client, path, contender_name, identifier)
+        self.write_lock = ZooWriteLock(client, path, contender_name,
+            identifier)
+
+
+def _sequence(name):
+    return name[-10:]
+
@@ -1,28 +1,77 @@
+import logging
+import threading
 import uuid
+from functools import partial
 
+from kazoo.client import KazooState
+from kazoo.zkclient import EventType
+from kazoo.retry import ForceRetryError, BackoffTimer
+from kazoo.watch import WatchType
 from kazoo.exceptions import NodeExistsException, NoNodeException
 
+log = logging.getLogger(__name__)
+
+class _MembershipDelta(object):
+    """Members joined and left in one listing, reported once the data of
+    every joined member has been read
+    """
+    def __init__(self, left, pending):
+        self.joined = {}
+        self.left = left
+        self.pending = pending
+
 class ZooParty(object):
     """Simple pool of participating processes
+
+    By default every membership query goes to ZooKeeper. After
+    start_watching(), membership is kept in memory by a children watch, only
+    newly joined members are read, and listeners are told of joins and
+    leaves.
     """
 
     _NODE_NAME = "__party__"
 
-    def __init__(self, client, path, data=None):
+    def __init__(self, client, path, data=None, identifier=None):
         """
         @type client KazooClient
+        @param identifier: name for our member node, unique in the party and
+                           stable across restarts. With a client that
+                           resumes its session, it lets a restarted process
+                           adopt the node it left, instead of being listed
+                           twice. Random if not given.
         """
+        if identifier is not None and "/" in identifier:
+            raise ValueError("identifier must not contain '/'")
         self.client = client
         self.path = path
 
         self.data = str(data or "")
 
-        self.node = uuid.uuid4().hex + self._NODE_NAME
+        self.node = (identifier or uuid.uuid4().hex) + self._NODE_NAME
         self.create_path = self.path + "/" + self.node
 
         self.ensured_path = False
         self.participating = False
 
+        self.watching = False
+        self._listeners = set()
+
+        # guards the membership below, which callbacks update from
+        # whichever thread they run on
+        self._lock = threading.Lock()
+        # node name -> data of members, while watching
+        self._members = {}
+        # member node names in the latest listing
+        self._children = set()
+        # member node names whose data is being read
+        self._fetching = set()
+        # set once the session, and so our watch, is lost
+        self._needs_refresh = False
+        self._ready = None
+        # spaces out refreshes after failed reads
+        self._backoff = BackoffTimer(client.retry,
+            client.zk.get_sync_strategy())
+
     def join(self):
         """Join the party
         """
@@ -39,7 +88,20 @@ class ZooParty(object):
             self.participating = True
         except NodeExistsException:
             # node was already created, perhaps we are recovering from a
-            # suspended connection
+            # suspended connection, or a previous process sharing our
+            # session left it. make sure it has our data.
+            stat = self.client.exists(self.create_path)
+            if stat is None:
+                raise ForceRetryError()
+            if stat['ephemeralOwner'] != self.client.client_id[0]:
+                # left by another session, and gone when that session is.
+                # replace it with a node of our own
+                try:
+                    self.client.delete(self.create_path)
+                except NoNodeException:
+                    pass
+                raise ForceRetryError()
+            self.client.set(self.create_path, self.data)
             self.participating = True
 
     def leave(self):
@@ -59,6 +121,10 @@ class ZooParty(object):
         """
         Get a list of participating clients' data values
         """
+        if self.watching:
+            with self._lock:
+                return self._members.values()
+
         if not self.ensured_path:
             # make sure our election parent node exists
             self.client.ensure_path(self.path)
@@ -77,6 +143,10 @@ class ZooParty(object):
     def get_participant_count(self):
         """Return a count of participating clients
         """
+        if self.watching:
+            with self._lock:
+                return len(self._members)
+
         if not self.ensured_path:
             # make sure our election parent node exists
             self.client.ensure_path(self.path)
@@ -87,8 +157,203 @@ class ZooParty(object):
         children = self.client.retry(self.client.get_children, self.path)
         return filter(lambda child: self._NODE_NAME in child, children)
 
+    def add_listener(self, listener):
+        """Add a function to be called with membership changes while watching
+
+        It is called as listener(joined, left), where both are dicts of
+        member node name to data, on the client's callback thread. It must
+        not block.
+        """
+        if not (listener and callable(listener)):
+            raise ValueError("listener must be callable")
+        self._listeners.add(listener)
+
+    def remove_listener(self, listener):
+        """Remove a listener function
+        """
+        self._listeners.discard(listener)
+
+    def start_watching(self, timeout=None):
+        """Keep the membership in memory, updated by a children watch
+
+        Returns once the current members have been read. If they can't be,
+        or the timeout passes first, watching is stopped again and the error
+        is raised, so the call can be retried.
 
+        @param timeout: time in seconds to wait for the first listing
+        """
+        if self.watching:
+            return
+        if not self.ensured_path:
+            self.client.ensure_path(self.path)
+            self.ensured_path = True
+
+        sync = self.client.zk.get_sync_strategy()
+        self._ready = sync.async_result()
+        self.watching = True
+        self.client.add_listener(self._session_listener)
+        self._refresh()
+        try:
+            self._ready.get(timeout=timeout)
+        except (Exception, sync.timeout_error):
+            # gevent's Timeout is not an Exception
+            self.stop_watching()
+            raise
+
+    def stop_watching(self):
+        """Go back to querying ZooKeeper for the membership
+        """
+        with self._lock:
+            self.watching = False
+            self._members = {}
+            self._children = set()
+            self._fetching.clear()
+        self.client.remove_listener(self._session_listener)
+        self.client.remove_watch(self.path, self._children_watch,
+            WatchType.CHILD)
+        self.client.remove_watch(self.path, self._exists_watch,
+            WatchType.DATA)
 
+    def _session_listener(self, state):
+        if state == KazooState.LOST:
+            # our watch is gone with the session
+            self._needs_refresh = True
+        elif state == KazooState.CONNECTED and self._needs_refresh:
+            self._needs_refresh = False
+            self._refresh()
 
+    def _refresh(self):
+        if not self.watching:
+            return
+        async_result = self.client.get_children_async(self.path,
+            watch=self._children_watch)
+        async_result.rawlink(self._children_listed)
 
-  
\ No newline at end of file
+    def _refresh_later(self):
+        """Refresh after a failed read, whatever the connection does
+        """
+        self._backoff.schedule(self._refresh)
+
+    def _children_watch(self, event):
+        if not self.watching:
+            return
+        if event.type == EventType.CHILD:
+            self._refresh()
+        elif event.type == EventType.DELETED:
+            self._party_deleted()
+
+    def _party_deleted(self):
+        """Report every member as left, and wait for the party node to be
+        created again, as our children watch went with it
+        """
+        with self._lock:
+            if not self.watching:
+                return
+            left, self._members = self._members, {}
+            self._children = set()
+        self._report(_MembershipDelta(left, 0))
+        self._await_party()
+
+    def _await_party(self):
+        if not self.watching:
+            return
+        async_result = self.client.exists_async(self.path,
+            watch=self._exists_watch)
+        async_result.rawlink(self._party_checked)
+
+    def _party_checked(self, async_result):
+        if not self.watching:
+            return
+        try:
+            stat = async_result.get()
+        except Exception, e:
+            log.warning("Checking for the party node failed: %r", e)
+            self._backoff.schedule(self._await_party)
+            return
+
+        self._backoff.reset()
+        if stat is not None:
+            # created again before our watch was set
+            self._refresh()
+
+    def _exists_watch(self, event):
+        if self.watching and event.type == EventType.CREATED:
+            self._refresh()
+
+    def _children_listed(self, async_result):
+        if not self.watching:
+            return
+        try:
+            children = async_result.get()
+        except Exception, e:
+            if not self._ready.ready():
+                # start_watching() stops watching and raises this
+                self._ready.set_exception(e)
+                return
+            if isinstance(e, NoNodeException):
+                self._party_deleted()
+                return
+            log.warning("Listing party members failed: %r", e)
+            self._refresh_later()
+            return
+
+        self._backoff.reset()
+        children = set(filter(lambda child: self._NODE_NAME in child,
+                              children))
+        with self._lock:
+            if not self.watching:
+                return
+            self._children = children
+
+            left = {}
+            for name in list(self._members):
+                if name not in children:
+                    left[name] = self._members.pop(name)
+
+            joined = children - set(self._members) - self._fetching
+            self._fetching.update(joined)
+        delta = _MembershipDelta(left, len(joined))
+        if not joined:
+            self._report(delta)
+            return
+
+        # read only the new members, all at once
+        for name in joined:
+            async_result = self.client.get_async(self.path + "/" + name)
+            async_result.rawlink(partial(self._member_read, name, delta))
+
+    def _member_read(self, name, delta, async_result):
+        read = False
+        try:
+            data, _ = async_result.get()
+            read = True
+        except NoNodeException:
+            # left before we could read it
+            pass
+        except Exception, e:
+            log.warning("Reading party member %s failed: %r", name, e)
+            # read by the next listing
+            self._refresh_later()
+
+        with self._lock:
+            if not self.watching:
+                return
+            self._fetching.discard(name)
+            if read and name in self._children:
+                self._members[name] = data
+                delta.joined[name] = data
+            delta.pending -= 1
+            done = not delta.pending
+        if done:
+            self._report(delta)
+
+    def _report(self, delta):
+        if not self._ready.ready():
+            self._ready.set()
+        if not (delta.joined or delta.left):
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(delta.joined, delta.left)
+            except Exception:
+                log.exception("Error in party listener")
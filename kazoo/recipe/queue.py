@@ -0,0 +1,275 @@
+import time
+import uuid
+from collections import deque
+
+from kazoo.retry import KazooRetry
+from kazoo.recipe.lock import Waiter
+from kazoo.exceptions import NoNodeException, UnimplementedException,\
+    RolledBackException
+
+class ZooQueue(object):
+    """FIFO queue of values, shared by any number of producers and consumers
+
+    Items are persistent sequential nodes under path. Producers can enqueue
+    a batch in one transaction. Consumers keep a sorted listing of the queue
+    and claim several items per two round trips: the reads of a batch are
+    pipelined, then the deletes, and an item belongs to whoever deletes it.
+    Consumers waiting on an empty queue sleep on a children watch.
+
+    If the reply to a delete is lost, the item is checked for once the
+    connection is back. It is returned if it is gone, so an item is never
+    lost, but may rarely be returned to two consumers.
+
+    Item names are entry-<tag>-<sequence>, where the tag is unique to the
+    put that made them. A put retried after a connection loss looks for
+    its tag to find the items that were created, and only creates the
+    rest, so no value is enqueued twice. Items are ordered by sequence.
+    """
+
+    _ENTRY_NAME = "entry-"
+
+    # operations per put_all transaction
+    PUT_BATCH_SIZE = 500
+
+    def __init__(self, client, path):
+        """
+        @type client KazooClient
+        """
+        self.client = client
+        self.path = path
+
+        # sorted names of items from our last listing, oldest first. other
+        # consumers may have claimed some of them since.
+        self._listing = deque()
+
+        self._waiter = Waiter()
+
+        self.assured_path = False
+
+    def _assure_path(self):
+        if not self.assured_path:
+            self.client.ensure_path(self.path)
+            self.assured_path = True
+
+    def put(self, value):
+        """Add a value to the end of the queue
+        """
+        self._assure_path()
+        self._put_items([value], self._create_pipelined)
+
+    def put_all(self, values):
+        """Add several values to the end of the queue, in order
+
+        Each PUT_BATCH_SIZE values are added atomically by one transaction.
+        With an engine that has no transactions, the creates are pipelined
+        instead.
+        """
+        self._assure_path()
+        values = list(values)
+        for start in xrange(0, len(values), self.PUT_BATCH_SIZE):
+            batch = values[start:start + self.PUT_BATCH_SIZE]
+            try:
+                self._put_items(batch, self._create_transaction)
+            except UnimplementedException:
+                self._put_items(batch, self._create_pipelined)
+
+    def _put_items(self, values, create):
+        """Enqueue values with create, retrying without duplicates
+
+        @param create: called with a list of (name prefix, value) to create
+        """
+        tag = uuid.uuid4().hex
+        items = [(self._ENTRY_NAME + "%s%04d-" % (tag, i), value)
+                 for i, value in enumerate(values)]
+        tries = []
+
+        def inner_put():
+            pending = items
+            if tries:
+                # the last try may have created items before the connection
+                # was lost
+                pending = self._uncreated(items, tag)
+            tries.append(None)
+            if pending:
+                create(pending)
+
+        self.client.retry(inner_put)
+
+    def _uncreated(self, items, tag):
+        tagged = self._ENTRY_NAME + tag
+        created = set(child[:-10] for child in
+                      self.client.get_children(self.path)
+                      if child.startswith(tagged))
+        return [item for item in items if item[0] not in created]
+
+    def _create_transaction(self, items):
+        transaction = self.client.transaction()
+        for prefix, value in items:
+            transaction.create(self.path + "/" + prefix, value, sequence=True)
+        for result in transaction.commit():
+            if isinstance(result, Exception) and \
+               not isinstance(result, RolledBackException):
+                raise result
+
+    def _create_pipelined(self, items):
+        # one session serves requests in order, so the items stay in order.
+        # once one fails to be sent, so do all after it.
+        requests = [self.client.zk.create_async(
+                        self.client.namespace_path(self.path + "/" + prefix),
+                        value, acl=self.client.default_acl, sequence=True)
+                    for prefix, value in items]
+        error = None
+        for async_result in requests:
+            try:
+                async_result.get()
+            except Exception, e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def get(self, block=True, timeout=None):
+        """Remove and return the value at the front of the queue
+
+        @param block: if False, return at once if the queue is empty
+        @param timeout: seconds to wait for an item, or None to wait forever
+        @return the value, or None if the queue stayed empty
+        """
+        values = self.get_batch(1, block, timeout)
+        if values:
+            return values[0]
+        return None
+
+    def get_batch(self, max_items, block=True, timeout=None):
+        """Remove and return up to max_items values from the front of the
+        queue
+
+        The items are claimed together, in one pipelined round trip when
+        nobody else is consuming them.
+
+        Without block or with a timeout, it also returns an empty list if
+        ZooKeeper can't be reached in time.
+
+        @param max_items: most values to return
+        @param block: if False, return at once if the queue is empty
+        @param timeout: seconds to wait for an item, or None to wait forever
+        @return list of values, oldest first; empty if the queue stayed
+                empty
+        """
+        retry = self.client.retry
+        deadline = None
+        if not block:
+            retry = retry.within(0)
+        elif timeout is not None:
+            deadline = time.time() + timeout
+
+        self._assure_path()
+        waiter = self._waiter
+        while True:
+            if deadline is not None:
+                # don't retry for longer than the caller waits
+                retry = self.client.retry.within(deadline - time.time())
+            changes = waiter.changes
+            try:
+                if not self._listing:
+                    retry(self._list)
+                values = self._claim(max_items, retry)
+            except retry.ALLOWED_EX:
+                if retry is self.client.retry:
+                    raise
+                if deadline is None or time.time() >= deadline:
+                    # out of time before the queue could be read
+                    return []
+                continue
+            if values:
+                return values
+
+            if self._listing:
+                # everything we tried had been claimed by others
+                continue
+            if not block or not waiter.wait(changes, deadline):
+                return []
+
+    def __len__(self):
+        """Return the number of items in the queue
+        """
+        self._assure_path()
+        return len(self._entries(self.client.retry(self.client.get_children,
+            self.path)))
+
+    def _list(self):
+        children = self.client.get_children(self.path, self._waiter.watch)
+        self._listing = deque(sorted(self._entries(children),
+                                     key=_sequence))
+
+    def _entries(self, children):
+        return filter(lambda c: c.startswith(self._ENTRY_NAME), children)
+
+    def _claim(self, max_items, retry):
+        """Read and delete up to max_items listed items
+
+        The reads are pipelined, then the deletes of the items read, so we
+        hold an item's value before it can be deleted.
+
+        @param retry: KazooRetry to check on items with
+        @return the values of the items we deleted, in order
+        """
+        zk = self.client.zk
+        reads = []
+        while self._listing and len(reads) < max_items:
+            path = self.path + "/" + self._listing.popleft()
+            reads.append((path,
+                          zk.get_async(self.client.namespace_path(path))))
+
+        read = []
+        error = None
+        for path, get_result in reads:
+            try:
+                value, _ = get_result.get()
+            except NoNodeException:
+                # claimed by another consumer
+                continue
+            except Exception, e:
+                error = error or e
+                self._listing.clear()
+                continue
+            read.append((path, value))
+
+        deletes = [(path, value, zk.delete_async(
+                        self.client.namespace_path(path)))
+                   for path, value in read]
+        values = []
+        # items whose delete reply was lost, which we may or may not own
+        unsure = []
+        for path, value, delete_result in deletes:
+            try:
+                delete_result.get()
+            except NoNodeException:
+                # claimed by another consumer since we read it
+                continue
+            except KazooRetry.CONNECTION_EX:
+                unsure.append(path)
+            except Exception, e:
+                error = error or e
+                self._listing.clear()
+                continue
+            values.append((path, value))
+
+        if unsure:
+            # an item that is gone was deleted by us, unless another
+            # consumer deleted it at the same time, in which case it is
+            # returned by both. one still there stays queued. if we can't
+            # tell, return it rather than risk losing it.
+            self._listing.clear()
+            exists = self.client.exists_many(unsure, retry=retry)
+            queued = set(path for path in unsure if exists[path] and
+                         not isinstance(exists[path], Exception))
+            values = [(path, value) for path, value in values
+                      if path not in queued]
+
+        if error is not None and not values:
+            raise error
+        return [value for path, value in values]
+
+
+def _sequence(name):
+    return name[-10:]
@@ -0,0 +1,244 @@
+import time
+import uuid
+
+from kazoo.retry import ForceRetryError
+from kazoo.recipe.lock import Waiter
+from kazoo.exceptions import NoNodeException
+
+class ZooSemaphore(object):
+    """Lease up to max_leases holders at once
+
+    Each acquisition is an ephemeral sequential node that records how many
+    leases it asks for. Contenders are served in order: a contender holds
+    its leases once those asked for by everyone ahead of it, plus its own,
+    fit within max_leases. Waiting contenders sleep on a children watch.
+    """
+
+    _LEASE_NAME = '_lease_'
+
+    def __init__(self, client, path, max_leases, holder_name=None):
+        """
+        @type client KazooClient
+        @param max_leases: number of leases shared by all holders
+        @param holder_name: data written to our node, see get_holders()
+        """
+        if max_leases < 1:
+            raise ValueError("max_leases must be at least 1")
+
+        self.client = client
+        self.path = path
+        self.max_leases = max_leases
+
+        self.data = str(holder_name or "")
+
+        self._waiter = Waiter()
+
+        self.prefix = None
+        self.create_path = None
+        self.create_tried = False
+
+        self.node = None
+        self.leases = 0
+        self.is_acquired = False
+
+        self.assured_path = False
+
+    def acquire(self, leases=1, blocking=True, timeout=None):
+        """Acquire leases
+
+        If they can't be obtained in time, our contender node is removed
+        again before returning. As with ZooLock, a non-blocking or timed
+        acquire also returns False if ZooKeeper can't be reached in time.
+
+        @param leases: number of leases to hold at once
+        @param blocking: if False, give up at once if the leases are taken
+        @param timeout: seconds to wait for the leases, or None to wait
+                        forever
+        @return True if the leases were acquired, else False
+        """
+        if not 1 <= leases <= self.max_leases:
+            raise ValueError("leases must be between 1 and %d" %
+                             self.max_leases)
+        if self.is_acquired:
+            raise ValueError("leases are already held")
+
+        retry = self.client.retry
+        deadline = None
+        if not blocking:
+            retry = retry.within(0)
+        elif timeout is not None:
+            deadline = time.time() + timeout
+            # don't retry for longer than the caller waits
+            retry = retry.within(timeout)
+
+        # the uuid lets a retry find a node whose create reply was lost.
+        # the lease count is part of the name, so contenders can be weighed
+        # from a single listing.
+        self.prefix = "%s-%d%s" % (uuid.uuid4().hex, leases, self._LEASE_NAME)
+        self.create_path = self.path + "/" + self.prefix
+        self.create_tried = False
+
+        try:
+            try:
+                acquired = retry(self._inner_acquire, blocking, deadline)
+            except retry.ALLOWED_EX:
+                if retry is self.client.retry:
+                    raise
+                # out of time before the leases could be looked at
+                acquired = False
+        except Exception:
+            # if we did ultimately fail, attempt to clean up
+            self._best_effort_cleanup()
+            raise
+
+        if acquired:
+            self.is_acquired = True
+            self.leases = leases
+        else:
+            self._best_effort_cleanup()
+        return acquired
+
+    def _inner_acquire(self, blocking, deadline):
+
+        # make sure our parent node exists
+        if not self.assured_path:
+            self.client.ensure_path(self.path)
+            self.assured_path = True
+
+        node = None
+        if self.create_tried:
+            node = self._find_node()
+        else:
+            self.create_tried = True
+
+        if not node:
+            try:
+                node = self.client.create(self.create_path, self.data,
+                    ephemeral=True, sequence=True)
+            except NoNodeException:
+                # our parent node was deleted out from under us
+                self.assured_path = False
+                raise ForceRetryError()
+            # strip off path to node
+            node = node[len(self.path)+1:]
+
+        self.node = node
+
+        waiter = self._waiter
+        while True:
+            changes = waiter.changes
+            children = self._get_sorted_children(waiter.watch)
+
+            try:
+                holders = self._holders(children, node)
+            except ValueError:
+                # our ephemeral node is gone, probably with our session
+                raise ForceRetryError()
+
+            if node in holders:
+                return True
+
+            if not blocking or not waiter.wait(changes, deadline):
+                return False
+
+    def _holders(self, children, until=None):
+        """Return the contenders holding leases, in order
+
+        @param children: sorted contender nodes
+        @param until: stop after this node; ValueError if it is missing
+        """
+        holders = []
+        taken = 0
+        for child in children:
+            taken += self._lease_count(child)
+            if taken > self.max_leases:
+                break
+            holders.append(child)
+            if child == until:
+                return holders
+
+        if until is not None and until not in children:
+            raise ValueError("%s is not a contender" % until)
+        return holders
+
+    def _lease_count(self, child):
+        name = child[:child.find(self._LEASE_NAME)]
+        return int(name.rsplit("-", 1)[1])
+
+    def _get_sorted_children(self, watch=None):
+        children = self.client.get_children(self.path, watch)
+
+        # can't just sort directly: the node names are prefixed by uuids
+        leasename = self._LEASE_NAME
+        children = filter(lambda c: leasename in c, children)
+        children.sort(key=lambda c: c[c.find(leasename) + len(leasename):])
+        return children
+
+    def _find_node(self):
+        children = self.client.get_children(self.path)
+        for child in children:
+            if child.startswith(self.prefix):
+                return child
+        return None
+
+    def _best_effort_cleanup(self):
+        try:
+
+            node = self._find_node()
+            if node:
+                self.client.delete(self.path + "/" + node)
+
+        except Exception:
+            pass
+
+    def release(self):
+        """Release our leases immediately
+        """
+        return self.client.retry(self._inner_release)
+
+    def _inner_release(self):
+        if not self.is_acquired:
+            return False
+
+        try:
+            self.client.delete(self.path + "/" + self.node)
+        except NoNodeException:
+            pass
+
+        self.is_acquired = False
+        self.node = None
+        self.leases = 0
+
+        return True
+
+    def get_holders(self):
+        """Return the holder names of the current lease holders, in order
+
+        Costs one listing and one pipelined read of the holders' nodes.
+        """
+        # make sure our parent node exists
+        if not self.assured_path:
+            self.client.ensure_path(self.path)
+            self.assured_path = True
+
+        paths = [self.path + "/" + child
+                 for child in self._holders(self._get_sorted_children())]
+
+        results = self.client.get_many(paths)
+
+        holders = []
+        for path in paths:
+            result = results[path]
+            if isinstance(result, NoNodeException):
+                # released meanwhile
+                continue
+            if isinstance(result, Exception):
+                raise result
+            holders.append(result[0])
+        return holders
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
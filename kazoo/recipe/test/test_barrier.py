@@ -0,0 +1,81 @@
+import unittest
+import uuid
+import threading
+
+from kazoo.recipe.barrier import Barrier, DoubleBarrier
+from kazoo.test import get_client_or_skip
+
+class BarrierTests(unittest.TestCase):
+    def setUp(self):
+        self._c = get_client_or_skip()
+        self._c.connect()
+        self.path = "/" + uuid.uuid4().hex
+
+    def tearDown(self):
+        if self.path:
+            try:
+                self._c.recursive_delete(self.path)
+            except Exception:
+                pass
+        if self._c:
+            self._c.close()
+
+    def test_barrier(self):
+        barrier = Barrier(self._c, self.path + "/barrier")
+        self.assertTrue(barrier.wait(timeout=0))
+
+        barrier.create()
+        self.assertFalse(barrier.wait(timeout=0.1))
+
+        released = threading.Event()
+        def wait():
+            if barrier.wait(timeout=5):
+                released.set()
+        thread = threading.Thread(target=wait)
+        thread.start()
+
+        self.assertTrue(barrier.remove())
+        thread.join()
+        self.assertTrue(released.is_set())
+        self.assertFalse(barrier.remove())
+
+    def test_double_barrier(self):
+        count = 4
+        barriers = [DoubleBarrier(self._c, self.path, count)
+                    for _ in range(count)]
+
+        # a lone participant times out and leaves
+        self.assertFalse(barriers[0].enter(timeout=0.1))
+        self.assertFalse(barriers[0].participating)
+
+        entered = []
+        left = []
+        # (entered, left before entering, left, entered before leaving) of
+        # each participant, or its exception
+        results = []
+        lock = threading.Lock()
+        def participate(barrier):
+            try:
+                did_enter = barrier.enter(timeout=5)
+                with lock:
+                    entered.append(barrier)
+                    left_before = len(left)
+                did_leave = barrier.leave(timeout=5)
+                with lock:
+                    entered_before = len(entered)
+                    left.append(barrier)
+                results.append((did_enter, left_before, did_leave,
+                                entered_before))
+            except Exception, e:
+                results.append(e)
+
+        threads = [threading.Thread(target=participate, args=(barrier,))
+                   for barrier in barriers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # nobody left before everyone entered
+        self.assertEqual(results, [(True, 0, True, count)] * count)
+        self.assertEqual(self._c.get_children(self.path), [])
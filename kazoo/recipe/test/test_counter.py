@@ -0,0 +1,122 @@
+import unittest
+import uuid
+import threading
+
+from kazoo.exceptions import ConnectionLossException
+from kazoo.recipe.counter import ZooCounter
+from kazoo.test import get_client_or_skip
+
+class ZooCounterTests(unittest.TestCase):
+    def setUp(self):
+        self._c = get_client_or_skip()
+        self._c.connect()
+        self.path = "/" + uuid.uuid4().hex
+
+    def tearDown(self):
+        if self.path:
+            try:
+                self._c.recursive_delete(self.path)
+            except Exception:
+                pass
+        if self._c:
+            self._c.close()
+
+    def test_counter(self):
+        counter = ZooCounter(self._c, self.path + "/count", default=10)
+        self.assertEqual(counter.value, 10)
+        self.assertEqual(counter.add(), 11)
+        self.assertEqual(counter.add(-3), 8)
+        self.assertEqual(counter.value, 8)
+
+    def test_counter_contention(self):
+        counters = [ZooCounter(self._c, self.path) for _ in range(5)]
+
+        def add(counter):
+            for _ in range(20):
+                counter.add()
+
+        threads = [threading.Thread(target=add, args=(counter,))
+                   for counter in counters]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(counters[0].value, 100)
+
+    def test_aggregating_counter(self):
+        counter = ZooCounter(self._c, self.path, flush_threshold=10)
+        reader = ZooCounter(self._c, self.path)
+
+        for _ in range(9):
+            self.assertEqual(counter.add(), None)
+        self.assertEqual(reader.value, 0)
+        self.assertEqual(counter.value, 9)
+
+        # reaching the threshold writes the total
+        counter.add()
+        self.assertEqual(reader.value, 10)
+
+        counter.add(5)
+        counter.close()
+        self.assertEqual(reader.value, 15)
+
+    def _lose_set_reply(self, exception, written=True):
+        # the next set is written, unless written is False, but its reply
+        # is lost
+        client_set = self._c.set
+        def set_once(*args, **kwargs):
+            del self._c.set
+            if written:
+                client_set(*args, **kwargs)
+            raise exception
+        self._c.set = set_once
+
+    def test_lost_reply(self):
+        counter = ZooCounter(self._c, self.path)
+        counter.add()
+
+        self._lose_set_reply(ConnectionLossException())
+        self.assertEqual(counter.add(5), 6)
+        self.assertEqual(counter.value, 6)
+
+    def test_aggregating_lost_reply(self):
+        counter = ZooCounter(self._c, self.path, flush_threshold=100)
+        counter.add()
+        counter.flush()
+
+        # a failure the retry gives up on keeps the delta for the next flush
+        counter.add(5)
+        self._lose_set_reply(ValueError())
+        self.assertRaises(ValueError, counter.flush)
+        self.assertEqual(counter.value, 6)
+        counter.add(2)
+        counter.flush()
+        self.assertEqual(counter.value, 8)
+
+        # a failed flush that wasn't written is still counted
+        counter.add(3)
+        self._lose_set_reply(ValueError(), written=False)
+        self.assertRaises(ValueError, counter.flush)
+        self.assertEqual(counter.value, 11)
+        counter.flush()
+        self.assertEqual(ZooCounter(self._c, self.path).value, 11)
+
+    def test_value_during_flush(self):
+        counter = ZooCounter(self._c, self.path, flush_threshold=100)
+        counter.add()
+        counter.flush()
+
+        # read the value while the next flush is being written
+        values = []
+        client_set = self._c.set
+        def set_once(*args, **kwargs):
+            del self._c.set
+            values.append(counter.value)
+            return client_set(*args, **kwargs)
+        self._c.set = set_once
+
+        counter.add(5)
+        self.assertEqual(counter.flush(), 6)
+        self.assertEqual(values, [6])
+        self.assertEqual(counter.value, 6)
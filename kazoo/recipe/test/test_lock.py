@@ -3,8 +3,8 @@ import uuid
 import threading
 import time
 
-from kazoo.recipe.lock import ZooLock
-from kazoo.exceptions import CancelledError
+from kazoo.recipe.lock import ZooLock, ZooReadWriteLock
+from kazoo.exceptions import CancelledError, ConnectionLossException
 from kazoo.test import get_client_or_skip, until_timeout
 
 class ZooLockTests(unittest.TestCase):
@@ -157,6 +157,145 @@ class ZooLockTests(unittest.TestCase):
         event1.set()
         thread1.join()
 
+    def test_lock_nonblocking(self):
+        lock1 = ZooLock(self._c, self.lockpath, "one")
+        lock2 = ZooLock(self._c, self.lockpath, "two")
+
+        self.assertTrue(lock1.acquire(blocking=False))
+        self.assertFalse(lock2.acquire(blocking=False))
+        self.assertEqual(lock1.get_contenders(), ["one"])
+
+        lock1.release()
+        self.assertTrue(lock2.acquire(blocking=False))
+        lock2.release()
+
+    def test_lock_timeout(self):
+        lock1 = ZooLock(self._c, self.lockpath, "one")
+        lock2 = ZooLock(self._c, self.lockpath, "two")
+        lock1.acquire()
+
+        start = time.time()
+        self.assertFalse(lock2.acquire(timeout=0.2))
+        self.assertTrue(time.time() - start >= 0.2)
+
+        # the timed out contender is gone
+        self.assertEqual(lock1.get_contenders(), ["one"])
+
+        lock1.release()
+        self.assertTrue(lock2.acquire(timeout=5))
+        lock2.release()
+
+    def test_lock_async(self):
+        lock1 = ZooLock(self._c, self.lockpath, "one")
+        lock2 = ZooLock(self._c, self.lockpath, "two")
+        lock3 = ZooLock(self._c, self.lockpath, "three")
+        lock1.acquire()
+
+        result2 = lock2.acquire_async()
+        result3 = lock3.acquire_async()
+        for _ in until_timeout(5):
+            if len(lock1.get_contenders()) == 3:
+                break
+        self.assertFalse(result2.ready())
+
+        # cancelled contenders drop out of line
+        lock3.cancel()
+        self.assertRaises(CancelledError, result3.get)
+        for _ in until_timeout(5):
+            if len(lock1.get_contenders()) == 2:
+                break
+
+        lock1.release()
+        self.assertTrue(result2.get(timeout=5))
+        self.assertTrue(lock2.is_acquired)
+        lock2.release()
+
+        # cancelling the async acquire leaves later ones alone
+        self.assertTrue(lock3.acquire(timeout=5))
+        lock3.release()
+
+    def test_lock_async_lost_reply(self):
+        lock1 = ZooLock(self._c, self.lockpath, "one")
+        lock2 = ZooLock(self._c, self.lockpath, "two")
+        lock1.acquire()
+
+        # our node is created, but the reply is lost
+        zk = self._c.zk
+        def create_async(*args, **kwargs):
+            del zk.create_async
+            zk.create(*args, **kwargs)
+            async_result = zk.get_sync_strategy().async_result()
+            async_result.set_exception(ConnectionLossException())
+            return async_result
+        zk.create_async = create_async
+
+        result = lock2.acquire_async()
+        for _ in until_timeout(5):
+            if len(lock1.get_contenders()) == 2:
+                break
+        time.sleep(0.5)
+        # the node was found rather than created again
+        self.assertEqual(len(lock1.get_contenders()), 2)
+        self.assertFalse(result.ready())
+
+        lock1.release()
+        self.assertTrue(result.get(timeout=5))
+        lock2.release()
+
+    def test_cancel_without_acquire(self):
+        lock = ZooLock(self._c, self.lockpath, "one")
+        lock.cancel()
+        self.assertTrue(lock.acquire(timeout=5))
+        lock.release()
+
+    def test_read_write_lock(self):
+        reader1 = ZooReadWriteLock(self._c, self.lockpath, "reader1")
+        reader2 = ZooReadWriteLock(self._c, self.lockpath, "reader2")
+        writer = ZooReadWriteLock(self._c, self.lockpath, "writer")
+        reader3 = ZooReadWriteLock(self._c, self.lockpath, "reader3")
+
+        # readers share the lock
+        self.assertTrue(reader1.read_lock.acquire(blocking=False))
+        self.assertTrue(reader2.read_lock.acquire(blocking=False))
+
+        # a writer queues behind them, and later readers behind the writer
+        write = writer.write_lock.acquire_async()
+        read = reader3.read_lock.acquire_async()
+        for _ in until_timeout(5):
+            if len(reader1.read_lock.get_contenders()) == 4:
+                break
+        self.assertFalse(write.ready())
+
+        reader1.read_lock.release()
+        self.assertFalse(write.ready())
+        reader2.read_lock.release()
+        self.assertTrue(write.get(timeout=5))
+        self.assertFalse(read.ready())
+
+        writer.write_lock.release()
+        self.assertTrue(read.get(timeout=5))
+        reader3.read_lock.release()
+
+    def test_read_lock_identifier(self):
+        # a reader's node ends a_write_read_<sequence>
+        reader1 = ZooReadWriteLock(self._c, self.lockpath, "reader1",
+            identifier="a_write")
+        reader2 = ZooReadWriteLock(self._c, self.lockpath, "reader2")
+
+        self.assertTrue(reader1.read_lock.acquire(blocking=False))
+        self.assertTrue(reader2.read_lock.acquire(blocking=False))
+        reader1.read_lock.release()
+        reader2.read_lock.release()
+
+    def test_identifier_validation(self):
+        self.assertRaises(ValueError, ZooLock, self._c, self.lockpath,
+            identifier="a/b")
+        self.assertRaises(ValueError, ZooLock, self._c, self.lockpath,
+            identifier="x_lock_1")
+        self.assertRaises(ValueError, ZooReadWriteLock, self._c,
+            self.lockpath, identifier="svc_write_a")
+        ZooLock(self._c, self.lockpath, identifier="svc_write_a")
+
     def _thread_lock_acquire_til_event(self, name, lock, event):
         try:
             with lock:
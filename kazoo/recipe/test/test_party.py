@@ -1,8 +1,9 @@
 import unittest
 import uuid
 
+from kazoo.exceptions import NoNodeException, NoAuthException
 from kazoo.recipe.party import ZooParty
-from kazoo.test import get_client_or_skip
+from kazoo.test import get_client_or_skip, wait_for
 
 class ZooPartyTests(unittest.TestCase):
     def setUp(self):
@@ -43,4 +44,81 @@ class ZooPartyTests(unittest.TestCase):
             self.assertEqual(set(party.get_participants()), participants)
             self.assertEqual(party.get_participant_count(), len(participants))
 
-  
\ No newline at end of file
+    def test_watching_party(self):
+        parties = [ZooParty(self._c, self.path, "p%s" % i)
+                   for i in range(5)]
+
+        watcher = ZooParty(self._c, self.path)
+        changes = []
+        def listener(joined, left):
+            changes.append((sorted(joined.values()), sorted(left.values())))
+        watcher.add_listener(listener)
+
+        parties[0].join()
+        watcher.start_watching(timeout=5)
+        self.assertEqual(watcher.get_participants(), ["p0"])
+
+        for party in parties[1:]:
+            party.join()
+        wait_for(lambda: watcher.get_participant_count() == 5)
+        self.assertEqual(set(watcher.get_participants()),
+                         set(party.data for party in parties))
+
+        parties[0].leave()
+        wait_for(lambda: watcher.get_participant_count() == 4)
+        self.assertEqual(changes[-1], ([], ["p0"]))
+
+        joined = sum((change[0] for change in changes), [])
+        self.assertEqual(sorted(joined), ["p0", "p1", "p2", "p3", "p4"])
+
+        watcher.stop_watching()
+        self.assertEqual(watcher.get_participant_count(), 4)
+
+    def test_watching_missing_party(self):
+        party = ZooParty(self._c, self.path)
+        # as if the party node was deleted after it was ensured
+        party.ensured_path = True
+        self.assertRaises(NoNodeException, party.start_watching, 5)
+        self.assertFalse(party.watching)
+
+        self._c.ensure_path(self.path)
+        party.start_watching(5)
+        self.assertTrue(party.watching)
+        self.assertEqual(party.get_participant_count(), 0)
+        party.stop_watching()
+
+    def test_watching_deleted_party(self):
+        party = ZooParty(self._c, self.path, "p0")
+        watcher = ZooParty(self._c, self.path)
+        party.join()
+        watcher.start_watching(5)
+        self.assertEqual(watcher.get_participants(), ["p0"])
+
+        party.leave()
+        self._c.delete(self.path)
+        wait_for(lambda: watcher.get_participant_count() == 0)
+
+        # membership follows the party once it is back
+        party.ensured_path = False
+        party.join()
+        wait_for(lambda: watcher.get_participants() == ["p0"])
+        watcher.stop_watching()
+
+    def test_watching_read_failure(self):
+        party = ZooParty(self._c, self.path, "p0")
+        watcher = ZooParty(self._c, self.path)
+        watcher.start_watching(5)
+
+        # the first read of the new member fails while we stay connected
+        def get_async(*args, **kwargs):
+            del self._c.get_async
+            async_result = self._c.zk.get_sync_strategy().async_result()
+            async_result.set_exception(NoAuthException())
+            return async_result
+        self._c.get_async = get_async
+
+        party.join()
+        wait_for(lambda: watcher.get_participants() == ["p0"])
+        # refreshing doesn't set another server watch
+        self.assertEqual(len(self._c.watches), 1)
+        watcher.stop_watching()
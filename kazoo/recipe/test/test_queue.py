@@ -0,0 +1,117 @@
+import time
+import unittest
+import uuid
+import threading
+
+from kazoo.exceptions import ConnectionLossException
+from kazoo.recipe.queue import ZooQueue
+from kazoo.test import get_client_or_skip
+
+class ZooQueueTests(unittest.TestCase):
+    def setUp(self):
+        self._c = get_client_or_skip()
+        self._c.connect()
+        self.path = "/" + uuid.uuid4().hex
+
+    def tearDown(self):
+        if self.path:
+            try:
+                self._c.recursive_delete(self.path)
+            except Exception:
+                pass
+        if self._c:
+            self._c.close()
+
+    def test_queue(self):
+        queue = ZooQueue(self._c, self.path)
+        self.assertEqual(queue.get(block=False), None)
+
+        queue.put("one")
+        queue.put_all(["two", "three", "four"])
+        self.assertEqual(len(queue), 4)
+
+        self.assertEqual(queue.get(), "one")
+        self.assertEqual(queue.get_batch(2), ["two", "three"])
+        self.assertEqual(queue.get_batch(5, block=False), ["four"])
+        self.assertEqual(queue.get_batch(5, timeout=0.1), [])
+
+    def test_put_lost_reply(self):
+        queue = ZooQueue(self._c, self.path)
+        creates = [queue._create_transaction, queue._create_pipelined]
+
+        # the items are created, but the replies are lost
+        def lose_reply(create):
+            def create_once(items):
+                create(items)
+                if create in creates:
+                    creates.remove(create)
+                    raise ConnectionLossException()
+            return create_once
+        queue._create_transaction = lose_reply(queue._create_transaction)
+        queue._create_pipelined = lose_reply(queue._create_pipelined)
+
+        queue.put("one")
+        queue.put_all(["two", "three"])
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.get_batch(5), ["one", "two", "three"])
+
+    def test_get_lost_reply(self):
+        queue = ZooQueue(self._c, self.path)
+        queue.put_all(["one", "two"])
+
+        # the first item is deleted, but the reply is lost
+        zk = self._c.zk
+        def delete_async(path, version=-1):
+            del zk.delete_async
+            zk.delete(path, version)
+            async_result = zk.get_sync_strategy().async_result()
+            async_result.set_exception(ConnectionLossException())
+            return async_result
+        zk.delete_async = delete_async
+
+        self.assertEqual(queue.get_batch(5), ["one", "two"])
+        self.assertEqual(len(queue), 0)
+
+    def test_get_disconnected(self):
+        queue = ZooQueue(self._c, self.path)
+        queue.put("one")
+
+        # fail requests as if the connection were lost
+        def disconnected(*args, **kwargs):
+            raise ConnectionLossException()
+        self._c.get_children = disconnected
+        try:
+            start = time.time()
+            self.assertEqual(queue.get(block=False), None)
+            self.assertEqual(queue.get_batch(5, timeout=0.2), [])
+            self.assertTrue(time.time() - start < 1)
+        finally:
+            del self._c.get_children
+        self.assertEqual(queue.get(), "one")
+
+    def test_queue_consumers(self):
+        producer = ZooQueue(self._c, self.path)
+        consumers = [ZooQueue(self._c, self.path) for _ in range(3)]
+        values = [str(i) for i in range(100)]
+
+        claimed = []
+        lock = threading.Lock()
+        def consume(queue):
+            while True:
+                batch = queue.get_batch(7, timeout=1)
+                if not batch:
+                    return
+                with lock:
+                    claimed.extend(batch)
+
+        threads = [threading.Thread(target=consume, args=(consumer,))
+                   for consumer in consumers]
+        for thread in threads:
+            thread.start()
+
+        # waiting consumers wake up for new items
+        producer.put_all(values)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(claimed), sorted(values))
@@ -0,0 +1,63 @@
+import time
+import unittest
+import uuid
+
+from kazoo.exceptions import ConnectionLossException
+from kazoo.recipe.semaphore import ZooSemaphore
+from kazoo.test import get_client_or_skip
+
+class ZooSemaphoreTests(unittest.TestCase):
+    def setUp(self):
+        self._c = get_client_or_skip()
+        self._c.connect()
+        self.path = "/" + uuid.uuid4().hex
+
+    def tearDown(self):
+        if self.path:
+            try:
+                self._c.recursive_delete(self.path)
+            except Exception:
+                pass
+        if self._c:
+            self._c.close()
+
+    def test_semaphore(self):
+        sems = [ZooSemaphore(self._c, self.path, 2, "s%s" % i)
+                for i in range(4)]
+
+        self.assertTrue(sems[0].acquire())
+        self.assertTrue(sems[1].acquire(blocking=False))
+        self.assertFalse(sems[2].acquire(blocking=False))
+        self.assertFalse(sems[2].acquire(timeout=0.1))
+        self.assertEqual(sems[0].get_holders(), ["s0", "s1"])
+
+        sems[0].release()
+        self.assertTrue(sems[2].acquire(timeout=5))
+        self.assertEqual(sems[0].get_holders(), ["s1", "s2"])
+
+        # several leases at once wait for all of them
+        self.assertFalse(sems[3].acquire(leases=2, blocking=False))
+        sems[1].release()
+        self.assertFalse(sems[3].acquire(leases=2, blocking=False))
+        sems[2].release()
+        self.assertTrue(sems[3].acquire(leases=2, timeout=5))
+        self.assertEqual(sems[0].get_holders(), ["s3"])
+        sems[3].release()
+
+        self.assertRaises(ValueError, sems[0].acquire, 3)
+
+    def test_acquire_disconnected(self):
+        sem = ZooSemaphore(self._c, self.path, 1)
+
+        # fail requests as if the connection were lost
+        def disconnected(*args, **kwargs):
+            raise ConnectionLossException()
+        self._c.ensure_path = disconnected
+        try:
+            start = time.time()
+            self.assertFalse(sem.acquire(blocking=False))
+            self.assertFalse(sem.acquire(timeout=0.2))
+            self.assertTrue(time.time() - start < 1)
+        finally:
+            del self._c.ensure_path
+        self.assertFalse(sem.is_acquired)
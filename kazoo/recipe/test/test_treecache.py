@@ -0,0 +1,82 @@
+import unittest
+import uuid
+
+from kazoo.exceptions import NoAuthException
+from kazoo.recipe.treecache import TreeCache, TreeEventType
+from kazoo.test import get_client_or_skip, wait_for
+
+class TreeCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._c = get_client_or_skip()
+        self._c.connect()
+        self.path = "/" + uuid.uuid4().hex
+
+    def tearDown(self):
+        if self.path:
+            try:
+                self._c.recursive_delete(self.path)
+            except Exception:
+                pass
+        if self._c:
+            self._c.close()
+
+    def test_tree_cache(self):
+        self._c.create(self.path + "/a/b", "b", makepath=True)
+        self._c.create(self.path + "/c", "c")
+
+        events = []
+        def listener(event):
+            events.append(event)
+
+        cache = TreeCache(self._c, self.path)
+        cache.add_listener(listener)
+        cache.start(timeout=5)
+
+        self.assertEqual(events[-1].type, TreeEventType.INITIALIZED)
+        self.assertEqual(list(cache.walk()), [self.path, self.path + "/a",
+            self.path + "/a/b", self.path + "/c"])
+        self.assertEqual(cache.get(self.path + "/a/b")[0], "b")
+        self.assertEqual(sorted(cache.get_children(self.path)), ["a", "c"])
+
+        # additions, updates and removals all show up
+        self._c.create(self.path + "/a/d", "d")
+        self._c.set(self.path + "/c", "c2")
+        self._c.recursive_delete(self.path + "/a/b")
+        wait_for(lambda: cache.get(self.path + "/c")[0] == "c2" and
+            sorted(cache.get_children(self.path + "/a")) == ["d"])
+        self.assertEqual(cache.get(self.path + "/a/d")[0], "d")
+        self.assertEqual(cache.get(self.path + "/a/b"), None)
+
+        types = [event.type for event in events]
+        self.assertTrue(TreeEventType.NODE_ADDED in types)
+        self.assertTrue(TreeEventType.NODE_UPDATED in types)
+        self.assertTrue(TreeEventType.NODE_REMOVED in types)
+
+        # the root can go away and come back
+        self._c.recursive_delete(self.path)
+        wait_for(lambda: cache.get(self.path) is None)
+        self.assertEqual(list(cache.walk()), [])
+
+        self._c.create(self.path + "/e", "e", makepath=True)
+        wait_for(lambda: cache.get(self.path + "/e") is not None)
+
+        cache.close()
+
+    def test_read_failure(self):
+        self._c.ensure_path(self.path)
+        cache = TreeCache(self._c, self.path)
+        cache.start(timeout=5)
+
+        # the first read of the new node fails while we stay connected
+        def get_async(*args, **kwargs):
+            del self._c.get_async
+            async_result = self._c.zk.get_sync_strategy().async_result()
+            async_result.set_exception(NoAuthException())
+            return async_result
+        self._c.get_async = get_async
+
+        self._c.create(self.path + "/a", "a")
+        wait_for(lambda: cache.get(self.path + "/a") is not None)
+        # a data and a children watch per node, each set once
+        self.assertEqual(len(self._c.watches), 4)
+        cache.close()
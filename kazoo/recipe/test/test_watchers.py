@@ -0,0 +1,89 @@
+import unittest
+import uuid
+
+from kazoo.exceptions import NoAuthException
+from kazoo.recipe.watchers import DataWatch, ChildrenWatch
+from kazoo.test import get_client_or_skip, wait_for
+
+class WatchersTests(unittest.TestCase):
+    def setUp(self):
+        self._c = get_client_or_skip()
+        self._c.connect()
+        self.path = "/" + uuid.uuid4().hex
+
+    def tearDown(self):
+        if self.path:
+            try:
+                self._c.recursive_delete(self.path)
+            except Exception:
+                pass
+        if self._c:
+            self._c.close()
+
+    def test_data_watch(self):
+        values = []
+        def changed(data, stat):
+            values.append(data)
+
+        watch = DataWatch(self._c, self.path, changed)
+        wait_for(lambda: values == [None])
+
+        self._c.create(self.path, "one")
+        wait_for(lambda: values[-1:] == ["one"])
+
+        # the latest value is always delivered, and only once
+        for i in range(10):
+            self._c.set(self.path, str(i))
+        wait_for(lambda: values[-1:] == ["9"])
+        self.assertEqual(len(values), len(set(values)))
+
+        self._c.delete(self.path)
+        wait_for(lambda: values[-1:] == [None])
+
+        watch.stop()
+        self._c.create(self.path, "two")
+        self.assertEqual(values[-1], None)
+
+    def test_data_watch_read_failure(self):
+        self._c.create(self.path, "one")
+
+        # the first read fails while we stay connected
+        def get_async(*args, **kwargs):
+            del self._c.get_async
+            async_result = self._c.zk.get_sync_strategy().async_result()
+            async_result.set_exception(NoAuthException())
+            return async_result
+        self._c.get_async = get_async
+
+        values = []
+        watch = DataWatch(self._c, self.path,
+                          lambda data, stat: values.append(data))
+        wait_for(lambda: values == ["one"])
+        watch.stop()
+
+    def test_children_watch(self):
+        children = []
+        def changed(names):
+            children.append(names)
+            if "stop" in names:
+                return False
+
+        self._c.create(self.path, "")
+        ChildrenWatch(self._c, self.path, changed)
+        wait_for(lambda: children == [[]])
+
+        self._c.create(self.path + "/a", "")
+        self._c.create(self.path + "/b", "")
+        wait_for(lambda: children[-1:] == [["a", "b"]])
+
+        # unchanged listings are not delivered again
+        self._c.set(self.path, "data")
+        self._c.delete(self.path + "/a")
+        wait_for(lambda: children[-1:] == [["b"]])
+        self.assertEqual(len(children), len(set(map(tuple, children))))
+
+        # returning False stops the watch
+        self._c.create(self.path + "/stop", "")
+        wait_for(lambda: children[-1:] == [["b", "stop"]])
+        self._c.create(self.path + "/c", "")
+        self.assertEqual(children[-1], ["b", "stop"])
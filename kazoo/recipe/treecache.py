@@ -0,0 +1,374 @@
+"""Live local mirror of a ZooKeeper subtree
+"""
+import logging
+import threading
+from collections import namedtuple
+from functools import partial
+
+from kazoo.client import KazooState
+from kazoo.retry import BackoffTimer
+from kazoo.zkclient import EventType
+from kazoo.exceptions import NoNodeException
+
+log = logging.getLogger(__name__)
+
+
+class TreeEventType(object):
+    NODE_ADDED = "NODE_ADDED"
+    NODE_UPDATED = "NODE_UPDATED"
+    NODE_REMOVED = "NODE_REMOVED"
+    INITIALIZED = "INITIALIZED"
+
+
+class TreeEvent(namedtuple('TreeEvent', ('type', 'path', 'data', 'stat'))):
+    """A change to a cached tree
+
+    INITIALIZED events carry no path, data or stat.
+    """
+
+
+class _TreeNode(object):
+    __slots__ = ('data', 'stat', 'children', 'generation')
+
+    def __init__(self, generation):
+        self.data = None
+        self.stat = None
+        self.children = set()
+        self.generation = generation
+
+
+class TreeCache(object):
+    """Mirror of a subtree, kept current by watches
+
+    Starting the cache reads the whole tree with pipelined requests, setting
+    a data and a children watch on every node. After that, each watch
+    re-reads only what changed, and reads are answered from memory.
+
+    Failed requests are sent again after a backoff, or at once on
+    reconnect. When the session is lost the whole tree is read again on
+    reconnect, and the differences are reported to listeners like any other
+    change.
+
+    Listeners are called with a TreeEvent on the client's callback thread,
+    so they must not block.
+    """
+
+    def __init__(self, client, path):
+        """
+        @type client KazooClient
+        @param path: root of the subtree to mirror
+        """
+        self.client = client
+        self.path = path.rstrip('/') or '/'
+
+        self._nodes = {}
+        self._listeners = set()
+
+        # bumped on every full reload, so replies to requests made for an
+        # earlier session are ignored
+        self._generation = 0
+
+        # paths with a full node read outstanding
+        self._loading = set()
+
+        # (method, path) of requests to send again
+        self._failed = []
+        self._failed_lock = threading.Lock()
+        self._backoff = BackoffTimer(client.retry,
+            client.zk.get_sync_strategy())
+
+        self._outstanding = 0
+        self._outstanding_lock = threading.Lock()
+
+        self._session_lost = False
+        self._started = None
+        self._closed = False
+
+    def add_listener(self, listener):
+        """Add a function to be called with a TreeEvent for each change
+        """
+        if not (listener and callable(listener)):
+            raise ValueError("listener must be callable")
+        self._listeners.add(listener)
+
+    def remove_listener(self, listener):
+        """Remove a listener function
+        """
+        self._listeners.discard(listener)
+
+    def start_async(self):
+        """Asynchronously load the tree and start following changes
+
+        @return AsyncResult set once the initial load completes
+        @rtype AsyncResult
+        """
+        if self._started is not None:
+            raise ValueError("TreeCache was already started")
+        self._started = self.client.zk.get_sync_strategy().async_result()
+        self.client.add_listener(self._session_listener)
+
+        # hold a request slot until the first reads are sent, so replies
+        # can't finish the load early
+        self._begin_request()
+        self._fetch(self.path)
+        self._end_request()
+        return self._started
+
+    def start(self, timeout=None):
+        """Load the tree and start following changes
+
+        @param timeout: time in seconds to wait for the initial load
+        """
+        self.start_async().get(timeout=timeout)
+
+    def close(self):
+        """Stop following changes and drop the cached tree
+        """
+        self._closed = True
+        self.client.remove_listener(self._session_listener)
+        self._nodes.clear()
+
+    def get(self, path):
+        """Get a cached node
+
+        @param path: path of node
+        @return tuple (value, stat) of node, or None if it is not cached
+        """
+        node = self._nodes.get(self._normalize(path))
+        if node is None or node.stat is None:
+            return None
+        return node.data, node.stat
+
+    def get_children(self, path):
+        """Get the names of a cached node's children
+
+        @param path: path of node
+        @return list of child node names, or None if it is not cached
+        """
+        node = self._nodes.get(self._normalize(path))
+        if node is None:
+            return None
+        return list(node.children)
+
+    def walk(self, path=None):
+        """Iterate over the paths of a cached subtree, parents first
+
+        @param path: root of the walk, defaults to the cache's root
+        """
+        path = self._normalize(path or self.path)
+        node = self._nodes.get(path)
+        if node is None:
+            return
+
+        yield path
+        prefix = path.rstrip('/') + '/'
+        for name in sorted(node.children):
+            for child_path in self.walk(prefix + name):
+                yield child_path
+
+    def _normalize(self, path):
+        return path.rstrip('/') or '/'
+
+    def _join(self, path, name):
+        return path.rstrip('/') + '/' + name
+
+    def _split(self, path):
+        parent_path, name = path.rsplit('/', 1)
+        return parent_path or '/', name
+
+    def _notify(self, event):
+        for listener in list(self._listeners):
+            try:
+                listener(event)
+            except Exception:
+                log.exception("Error in TreeCache listener")
+
+    def _begin_request(self):
+        with self._outstanding_lock:
+            self._outstanding += 1
+
+    def _end_request(self):
+        with self._outstanding_lock:
+            self._outstanding -= 1
+            done = not self._outstanding and not self._started.ready()
+        if done:
+            self._started.set()
+            self._notify(TreeEvent(TreeEventType.INITIALIZED, None, None,
+                                   None))
+
+    def _request(self, method, path, async_result, callback):
+        self._begin_request()
+        async_result.rawlink(partial(self._completed, method, path,
+            self._generation, callback))
+
+    def _completed(self, method, path, generation, callback, async_result):
+        try:
+            if self._closed or generation != self._generation:
+                return
+
+            exc = async_result.exception
+            if exc is not None and not isinstance(exc, NoNodeException):
+                log.warning("TreeCache read of %s failed: %r", path, exc)
+                with self._failed_lock:
+                    self._failed.append((method, path))
+                self._backoff.schedule(self._retry_failed)
+                return
+
+            self._backoff.reset()
+            callback(path, async_result)
+        except Exception:
+            log.exception("Error updating TreeCache")
+        finally:
+            self._end_request()
+
+    def _session_listener(self, state):
+        if state == KazooState.LOST:
+            self._session_lost = True
+        elif state == KazooState.CONNECTED:
+            if self._session_lost:
+                self._session_lost = False
+                self._resync()
+            else:
+                self._retry_failed()
+
+    def _retry_failed(self):
+        if self._closed:
+            return
+        with self._failed_lock:
+            failed, self._failed = self._failed, []
+        for method, path in failed:
+            method(path)
+
+    def _resync(self):
+        """Read the whole tree again, after the watches were lost
+        """
+        self._generation += 1
+        self._loading.clear()
+        with self._failed_lock:
+            self._failed = []
+        self._fetch(self.path)
+
+    def _fetch(self, path):
+        """Read a node's data and children, setting watches on both
+        """
+        if path in self._loading:
+            return
+        self._loading.add(path)
+        self._get_data(path)
+        self._get_children(path)
+
+    # the watches are shared through the client's registry, which gives
+    # them event paths relative to the client's namespace, like ours
+
+    def _get_data(self, path):
+        self._request(self._get_data, path,
+            self.client.get_async(path, watch=self._data_watch),
+            self._data_loaded)
+
+    def _get_children(self, path):
+        self._request(self._get_children, path,
+            self.client.get_children_async(path, watch=self._children_watch),
+            self._children_loaded)
+
+    def _watch_root(self, path):
+        self._request(self._watch_root, path,
+            self.client.exists_async(path, watch=self._root_watch),
+            self._root_checked)
+
+    def _data_watch(self, event):
+        if self._closed:
+            return
+        if event.type == EventType.DELETED:
+            self._removed(event.path)
+        elif event.type == EventType.CHANGED:
+            self._get_data(event.path)
+
+    def _children_watch(self, event):
+        if self._closed:
+            return
+        if event.type == EventType.CHILD:
+            self._get_children(event.path)
+
+    def _root_watch(self, event):
+        if self._closed:
+            return
+        if event.type == EventType.CREATED:
+            self._fetch(event.path)
+
+    def _root_checked(self, path, async_result):
+        if async_result.get() is not None:
+            self._fetch(path)
+
+    def _data_loaded(self, path, async_result):
+        self._loading.discard(path)
+        try:
+            data, stat = async_result.get()
+        except NoNodeException:
+            self._removed(path)
+            return
+
+        node = self._nodes.get(path)
+        if node is None:
+            if path != self.path:
+                parent_path, name = self._split(path)
+                parent = self._nodes.get(parent_path)
+                if parent is None or name not in parent.children:
+                    # removed from its parent while we were reading it
+                    return
+            node = self._nodes[path] = _TreeNode(self._generation)
+            event_type = TreeEventType.NODE_ADDED
+        elif node.stat is not None and node.stat['mzxid'] == stat['mzxid']:
+            node.generation = self._generation
+            return
+        else:
+            event_type = TreeEventType.NODE_UPDATED
+
+        node.data, node.stat = data, stat
+        node.generation = self._generation
+        self._notify(TreeEvent(event_type, path, data, stat))
+
+    def _children_loaded(self, path, async_result):
+        try:
+            children = set(async_result.get())
+        except NoNodeException:
+            # the data read of this node handles the removal
+            return
+
+        node = self._nodes.get(path)
+        if node is None:
+            return
+
+        for name in node.children - children:
+            self._prune(self._join(path, name))
+        node.children = children
+
+        for name in children:
+            child_path = self._join(path, name)
+            child = self._nodes.get(child_path)
+            if child is None or child.generation != self._generation:
+                self._fetch(child_path)
+
+    def _removed(self, path):
+        self._prune(path)
+        if path == self.path:
+            # wait for the root to be created again
+            self._watch_root(path)
+
+    def _prune(self, path):
+        """Drop a node and its descendants, deepest first
+        """
+        node = self._nodes.pop(path, None)
+        if node is None:
+            return
+
+        if path != self.path:
+            parent_path, name = self._split(path)
+            parent = self._nodes.get(parent_path)
+            if parent is not None:
+                parent.children.discard(name)
+
+        for name in list(node.children):
+            self._prune(self._join(path, name))
+
+        self._notify(TreeEvent(TreeEventType.NODE_REMOVED, path, node.data,
+                               node.stat))
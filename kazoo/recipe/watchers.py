@@ -0,0 +1,202 @@
+"""Watches that re-arm themselves and deliver only the latest state
+"""
+import logging
+
+from kazoo.client import KazooState
+from kazoo.retry import BackoffTimer
+from kazoo.exceptions import NoNodeException
+
+log = logging.getLogger(__name__)
+
+
+class _Watcher(object):
+    """Mixin that keeps a watch on a node set, calling func with its state
+    on changes
+
+    At most one read is outstanding. Events that arrive during a read make
+    us read again once it completes, instead of delivering the state that
+    read found, so func sees the latest state rather than every step.
+    Failed reads are sent again after a backoff, and watches lost with the
+    session are set again on reconnect.
+
+    func runs on the client's callback thread and must not block. If it
+    returns False, watching stops.
+
+    Classes using it provide:
+
+    _read() sends the read of the node, watched by _watch, and returns its
+    AsyncResult.
+
+    _handle(async_result) gets the read's result, and calls func through
+    _call() if it differs from what was delivered last.
+
+    _deliver_missing() calls func through _call() with the state of a
+    missing node, unless that was delivered last.
+    """
+
+    def __init__(self, client, path, func):
+        """
+        @type client KazooClient
+        """
+        self.client = client
+        self.path = path
+        self.func = func
+
+        self.stopped = False
+
+        self._reading = False
+        self._stale = False
+        self._needs_refresh = False
+        self._backoff = BackoffTimer(client.retry,
+            client.zk.get_sync_strategy())
+
+        self.client.add_listener(self._session_listener)
+        self._refresh()
+
+    def stop(self):
+        """Stop watching
+        """
+        self.stopped = True
+        self.client.remove_listener(self._session_listener)
+        self.client.remove_watch(self.path, self._watch)
+
+    def _watch(self, event):
+        self._refresh()
+
+    def _session_listener(self, state):
+        if state == KazooState.LOST:
+            # our watches are gone with the session
+            self._needs_refresh = True
+        elif state == KazooState.CONNECTED and self._needs_refresh:
+            self._needs_refresh = False
+            self._refresh()
+
+    def _refresh(self):
+        if self.stopped:
+            return
+        if self._reading:
+            self._stale = True
+            return
+        self._reading = True
+        self._stale = False
+        self._read().rawlink(self._read_done)
+
+    def _read_done(self, async_result):
+        self._reading = False
+        if self.stopped:
+            return
+        if self._stale:
+            # changed again while we were reading
+            self._refresh()
+            return
+
+        try:
+            self._handle(async_result)
+        except NoNodeException:
+            self._missing()
+        except Exception, e:
+            log.warning("Reading %s for watch failed: %r", self.path, e)
+            self._backoff.schedule(self._refresh)
+        else:
+            self._backoff.reset()
+
+    def _missing(self):
+        """Watch for the node to be created
+        """
+        self._reading = True
+        self.client.exists_async(self.path, self._watch).rawlink(
+            self._exists_done)
+
+    def _exists_done(self, async_result):
+        self._reading = False
+        if self.stopped:
+            return
+        try:
+            stat = async_result.get()
+        except Exception, e:
+            log.warning("Checking %s for watch failed: %r", self.path, e)
+            self._backoff.schedule(self._refresh)
+            return
+
+        if self._stale or stat is not None:
+            # created before our watch was set
+            self._refresh()
+        else:
+            self._deliver_missing()
+
+    def _call(self, *args):
+        try:
+            if self.func(*args) is False:
+                self.stop()
+        except Exception:
+            log.exception("Error in watch function")
+
+
+class DataWatch(_Watcher):
+    """Calls func(data, stat) with the value of a node whenever it changes
+
+    func is called once with the current value, and then for each new
+    version of the node. While the node doesn't exist, it is called once
+    with (None, None).
+    """
+
+    _NOT_DELIVERED = object()
+
+    def __init__(self, client, path, func):
+        """
+        @type client KazooClient
+        @param func: called as func(data, stat)
+        """
+        # mzxid of the last version delivered, or None if it was missing
+        self._last_mzxid = self._NOT_DELIVERED
+        _Watcher.__init__(self, client, path, func)
+
+    def _read(self):
+        return self.client.get_async(self.path, self._watch)
+
+    def _handle(self, async_result):
+        data, stat = async_result.get()
+        if stat['mzxid'] == self._last_mzxid:
+            return
+        self._last_mzxid = stat['mzxid']
+        self._call(data, stat)
+
+    def _deliver_missing(self):
+        if self._last_mzxid is None:
+            return
+        self._last_mzxid = None
+        self._call(None, None)
+
+
+class ChildrenWatch(_Watcher):
+    """Calls func(children) with the child names of a node whenever they
+    change
+
+    func is called once with the current children, and then for each
+    change to them. While the node doesn't exist, it is called once with
+    an empty list.
+    """
+
+    def __init__(self, client, path, func):
+        """
+        @type client KazooClient
+        @param func: called as func(children)
+        """
+        self._last_children = None
+        _Watcher.__init__(self, client, path, func)
+
+    def _read(self):
+        return self.client.get_children_async(self.path, self._watch)
+
+    def _handle(self, async_result):
+        children = sorted(async_result.get())
+        if children == self._last_children:
+            return
+        self._last_children = children
+        self._call(children)
+
+    def _deliver_missing(self):
+        if self._last_children == []:
+            return
+        self._last_children = []
+        self._call([])
@@ -1,5 +1,13 @@
-from zookeeper import ConnectionLossException, OperationTimeoutException, \
-    SessionExpiredException, SessionMovedException
+import copy
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+from kazoo.exceptions import ConnectionLossException,\
+    OperationTimeoutException, SessionExpiredException, SessionMovedException,\
+    CircuitOpenException
 
 
 class ForceRetryError(Exception):
@@ -8,26 +16,374 @@ class ForceRetryError(Exception):
 
 class KazooRetry(object):
     """Helper for retrying a method in the face of specific exceptions
+
+    Tries are spaced by an exponential backoff with jitter, so a fleet of
+    clients doesn't retry in lockstep while the ensemble recovers.
     """
 
-    ALLOWED_EX = (ConnectionLossException, OperationTimeoutException,
-        SessionMovedException, SessionExpiredException, ForceRetryError)
+    # errors that mean the ensemble could not be reached, which count as
+    # failures for the circuit breaker
+    CONNECTION_EX = (ConnectionLossException, OperationTimeoutException,
+        SessionMovedException, SessionExpiredException)
+    ALLOWED_EX = CONNECTION_EX + (ForceRetryError,)
 
-    def __init__(self, max_tries=None):
+    def __init__(self, max_tries=None, delay=0.1, backoff=2, max_delay=60.0,
+                 jitter=0.5, deadline=None, sleep_func=None,
+                 wait_connected=False, budget=None, breaker=None):
+        """
+        @param max_tries: give up after this many tries, or None to keep on
+        @param delay: seconds to wait before the first retry
+        @param backoff: factor the delay grows by after each retry
+        @param max_delay: cap on the delay between tries
+        @param jitter: fraction of each delay that is random, from 0 to 1
+        @param deadline: give up once this many seconds have passed since
+                         the first try, or None for no limit
+        @param sleep_func: function to sleep with. A KazooClient uses its
+                           sync strategy's by default, so gevent callers
+                           don't block the hub.
+        @param wait_connected: while the client's connection is suspended,
+                               wait for it to come back instead of sleeping
+                               through the backoff
+        @param budget: RetryBudget that every retry draws from. Share one
+                       between policies to cap retries client-wide.
+        @param breaker: CircuitBreaker that fails calls fast while the
+                        ensemble is failing
+        """
         self.max_tries = max_tries
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.sleep_func = sleep_func
+        self.wait_connected = wait_connected
+        self.budget = budget
+        self.breaker = breaker
+
+        # KazooClient whose connection wait_connected waits for
+        self.client = None
+
+    def with_client(self, client):
+        """Return a copy of this policy bound to a KazooClient
+
+        The copy uses the client's retry budget and circuit breaker unless
+        this policy has its own.
+        """
+        retry = copy.copy(self)
+        retry.client = client
+        if retry.budget is None:
+            retry.budget = getattr(client, 'retry_budget', None)
+        if retry.breaker is None:
+            retry.breaker = getattr(client, 'circuit_breaker', None)
+        if retry.sleep_func is None:
+            retry.sleep_func = client.zk.get_sync_strategy().sleep
+        return retry
+
+    def within(self, seconds):
+        """Return a copy of this policy that gives up once seconds have
+        passed, or at its own deadline if that is sooner
+
+        With no time at all, func is tried once.
+
+        @param seconds: time the tries may take
+        """
+        retry = copy.copy(self)
+        seconds = max(seconds, 0)
+        if retry.deadline is None or seconds < retry.deadline:
+            retry.deadline = seconds
+        return retry
 
     def run(self, func, *args, **kwargs):
         self(func, *args, **kwargs)
 
     def __call__(self, func, *args, **kwargs):
         tries = 1
+        delay = self.delay
+        stop_time = None
+        if self.deadline is not None:
+            stop_time = time.time() + self.deadline
 
+        breaker = self.breaker
         while True:
-            try:
-                return func(*args, **kwargs)
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenException()
 
-            except self.ALLOWED_EX:
-                if self.max_tries and tries == self.max_tries:
+            # the ensemble answered, even if with an error, unless the try
+            # fails with a connection error
+            succeeded = None
+            try:
+                try:
+                    result = func(*args, **kwargs)
+                except self.CONNECTION_EX:
+                    succeeded = False
+                    raise
+                except Exception:
+                    succeeded = True
                     raise
-                tries += 1
+                succeeded = True
+            except self.ALLOWED_EX:
+                exc_info = sys.exc_info()
+            else:
+                return result
+            finally:
+                if breaker is not None:
+                    if succeeded is None:
+                        # interrupted, so no outcome. don't hold on to a
+                        # half-open probe slot.
+                        breaker.release()
+                    else:
+                        breaker.record(succeeded)
+
+            if self.max_tries and tries == self.max_tries:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            tries += 1
+
+            if self.budget is not None and not self.budget.acquire():
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if not self._wait(delay, stop_time):
+                raise exc_info[0], exc_info[1], exc_info[2]
+            delay = min(delay * self.backoff, self.max_delay)
+
+    def _wait(self, delay, stop_time):
+        """Wait before the next try
+
+        @return False if the deadline would pass first
+        """
+        sleep = delay * (1 - self.jitter * random.random())
+        remaining = None
+        if stop_time is not None:
+            remaining = stop_time - time.time()
+            if remaining <= sleep:
+                return False
+
+        client = self.client
+        if self.wait_connected and client is not None and \
+           not client.connected:
+            # no point trying before the connection is back
+            return client.wait_connected(remaining)
+
+        (self.sleep_func or time.sleep)(sleep)
+        return True
+
+
+class BackoffTimer(object):
+    """Schedules work that failed on a callback, spaced like a retry policy
+
+    Callbacks can't sleep through a retry. Recipes that keep state current
+    from them schedule the failed work here instead: it runs after the
+    policy's next delay, through the sync strategy's dispatch_callback()
+    from a task it spawned. Under the threading strategy that is the
+    task's own thread, so the work may run alongside other callbacks and
+    must lock any state it shares with them. The delay grows with each
+    failure until reset() is called after a success.
+    """
+
+    def __init__(self, retry, sync):
+        """
+        @type retry KazooRetry
+        @param sync: sync strategy to sleep and call back with
+        """
+        self.retry = retry
+        self.sync = sync
+
+        self._delay = None
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def schedule(self, func):
+        """Call func after the next delay, unless a call is already
+        scheduled
+
+        @return False if one was
+        """
+        retry = self.retry
+        with self._lock:
+            if self._scheduled:
+                return False
+            self._scheduled = True
+            delay = self._delay or retry.delay
+            self._delay = min(delay * retry.backoff, retry.max_delay)
+
+        def call():
+            self.sync.sleep(delay * (1 - retry.jitter * random.random()))
+            with self._lock:
+                self._scheduled = False
+            self.sync.dispatch_callback(func)
+        self.sync.spawn(call)
+        return True
+
+    def reset(self):
+        """Go back to the shortest delay
+        """
+        with self._lock:
+            self._delay = None
+
+
+class RetryBudget(object):
+    """Token bucket that caps how often retries may happen
+
+    Tokens refill at rate per second, up to burst. Each retry takes one;
+    when none are left the operation fails with its last error instead of
+    retrying.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        @param rate: retries allowed per second, on average
+        @param burst: most retries allowed at once, defaults to rate
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+
+        self.granted = 0
+        self.denied = 0
+
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token for one retry
+
+        @return False if the budget is spent
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                self.denied += 1
+                return False
+            self._tokens -= 1
+            self.granted += 1
+            return True
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def stats(self):
+        """Return a dict of the bucket's counters
+        """
+        with self._lock:
+            self._refill()
+            return dict(tokens=self._tokens, granted=self.granted,
+                        denied=self.denied)
+
+
+class CircuitBreaker(object):
+    """Fails calls fast while the ensemble is failing
+
+    Outcomes of recent tries are kept for window seconds. Once at least
+    min_calls were seen and the share that failed reaches
+    failure_threshold, the circuit opens and calls fail with
+    CircuitOpenException. After reset_timeout seconds it half-opens and
+    lets probe_calls tries through: a success closes it, a failure opens it
+    again.
+    """
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self, failure_threshold=0.5, min_calls=20, window=10.0,
+                 reset_timeout=5.0, probe_calls=1):
+        """
+        @param failure_threshold: share of failed tries that opens the
+                                  circuit, from 0 to 1
+        @param min_calls: tries needed in the window before it can open
+        @param window: seconds of outcomes to consider
+        @param reset_timeout: seconds to stay open before probing
+        @param probe_calls: tries let through at once while half-open
+        """
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.probe_calls = probe_calls
+
+        self.state = self.CLOSED
+        self.opened = 0
+        self.rejected = 0
+
+        # (time, succeeded) of tries in the window
+        self._outcomes = deque()
+        self._failures = 0
+        self._opened_at = None
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return whether a try may go ahead
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.time() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probes = 0
+
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.probe_calls:
+                    self.rejected += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, succeeded):
+        """Record the outcome of a try
+        """
+        with self._lock:
+            now = time.time()
+            if self.state == self.HALF_OPEN:
+                if succeeded:
+                    self._close()
+                else:
+                    self._open(now)
+                return
+
+            self._outcomes.append((now, succeeded))
+            if not succeeded:
+                self._failures += 1
+            self._expire(now)
+
+            count = len(self._outcomes)
+            if self.state == self.CLOSED and count >= self.min_calls and \
+               self._failures >= self.failure_threshold * count:
+                self._open(now)
+
+    def release(self):
+        """Give back a try that ended without an outcome
+
+        Frees its probe slot while half-open, so the circuit can't be left
+        half-open with every probe taken.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def _expire(self, now):
+        outcomes = self._outcomes
+        while outcomes and now - outcomes[0][0] > self.window:
+            if not outcomes.popleft()[1]:
+                self._failures -= 1
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.opened += 1
+        self._opened_at = now
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._outcomes.clear()
+        self._failures = 0
 
+    def stats(self):
+        """Return a dict of the breaker's state and counters
+        """
+        with self._lock:
+            self._expire(time.time())
+            return dict(state=self.state, calls=len(self._outcomes),
+                        failures=self._failures, opened=self.opened,
+                        rejected=self.rejected)
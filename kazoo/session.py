@@ -0,0 +1,73 @@
+"""Storage of session ids, so a restarted process can resume its session
+"""
+import json
+import logging
+import os
+import tempfile
+
+log = logging.getLogger(__name__)
+
+
+class FileSessionStore(object):
+    """Keeps a client's (session_id, passwd) in a file
+
+    The file is replaced atomically on every write, so a process that dies
+    mid-write leaves the previous session behind rather than a torn file.
+    It is only readable by its owner, as the password lets anyone take the
+    session over.
+    """
+
+    def __init__(self, path):
+        """
+        @param path: file to keep the session in
+        """
+        self.path = path
+        self._saved = None
+
+    def load(self):
+        """Return the stored (session_id, passwd), or None if there is none
+        """
+        try:
+            with open(self.path) as f:
+                session = json.load(f)
+            client_id = (session['session_id'],
+                         session['passwd'].decode('hex'))
+        except IOError:
+            return None
+        except Exception, e:
+            log.warning("Ignoring unreadable session file %s: %r",
+                        self.path, e)
+            return None
+        self._saved = client_id
+        return client_id
+
+    def save(self, client_id):
+        """Store a (session_id, passwd)
+        """
+        client_id = tuple(client_id)
+        if client_id == self._saved:
+            return
+
+        session = dict(session_id=client_id[0],
+                       passwd=client_id[1].encode('hex'))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.session')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(session, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(temp_path, self.path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+        self._saved = client_id
+
+    def clear(self):
+        """Forget the stored session
+        """
+        self._saved = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
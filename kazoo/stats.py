@@ -0,0 +1,113 @@
+"""Cheap always-on instrumentation of ZooKeeper requests
+"""
+import threading
+import time
+from bisect import bisect_left
+
+
+class LatencyHistogram(object):
+    """Counts of latencies in exponentially sized buckets
+
+    Bucket i counts latencies up to BOUNDS[i] seconds, from 100us doubling
+    up to about 13s; the last bucket counts anything slower. Recording is a
+    bisect and a few additions. It is not locked, so callers recording from
+    several threads must serialize.
+    """
+
+    BOUNDS = tuple(0.0001 * 2 ** i for i in xrange(18))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding a percentile
+
+        @param fraction: the percentile, from 0 to 1
+        @return latency in seconds, or None if nothing was recorded
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if i < len(self.BOUNDS):
+                    return min(self.BOUNDS[i], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        """Return a dict summarizing the histogram
+        """
+        return dict(count=self.count, total=self.total, max=self.max,
+                    mean=self.total / self.count if self.count else None,
+                    p50=self.percentile(0.5), p90=self.percentile(0.9),
+                    p99=self.percentile(0.99))
+
+
+class ClientStats(object):
+    """Request latencies, in-flight counts, errors and watch events of a
+    ZooKeeperClient
+    """
+
+    def __init__(self):
+        # op name -> LatencyHistogram
+        self.latency = {}
+        # op name -> requests awaiting completion
+        self.in_flight = {}
+        # exception class name -> count
+        self.errors = {}
+        self.watch_events = 0
+
+        self._lock = threading.Lock()
+
+    def started(self, op):
+        """Record the start of a request
+
+        @return: the start time, to pass to finished()
+        """
+        with self._lock:
+            self.in_flight[op] = self.in_flight.get(op, 0) + 1
+        return time.time()
+
+    def finished(self, op, start, error=None):
+        """Record the completion of a request
+
+        @param start: the value started() returned
+        @param error: name of the exception it failed with, if it did
+        """
+        elapsed = time.time() - start
+        with self._lock:
+            self.in_flight[op] -= 1
+            histogram = self.latency.get(op)
+            if histogram is None:
+                histogram = self.latency[op] = LatencyHistogram()
+            histogram.record(elapsed)
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def watch_event(self):
+        with self._lock:
+            self.watch_events += 1
+
+    def snapshot(self):
+        """Return a dict of the current figures
+        """
+        with self._lock:
+            return dict(
+                latency=dict((op, histogram.snapshot())
+                             for op, histogram in self.latency.iteritems()),
+                in_flight=dict(self.in_flight),
+                errors=dict(self.errors),
+                watch_events=self.watch_events)
@@ -1,14 +1,38 @@
-def get_sync_strategy():
+def get_sync_strategy(name=None):
     """Detects the current async environment and returns a sync helper object
+
+    @param name: optionally pick a strategy explicitly: "gevent", "asyncio"
+                 or "threading"
     """
     import sys
 
-    if "gevent" in sys.modules:
+    if name is None:
+        if "gevent" in sys.modules:
+            name = "gevent"
+        elif _asyncio_loop_running(sys.modules):
+            name = "asyncio"
+        else:
+            name = "threading"
+
+    if name == "gevent":
         from kazoo.sync import sync_gevent
         return sync_gevent.GeventSyncStrategy()
 
-    else:
+    elif name == "asyncio":
+        from kazoo.sync import sync_asyncio
+        return sync_asyncio.AsyncioSyncStrategy()
+
+    elif name == "threading":
         from kazoo.sync import sync_threading
         return sync_threading.ThreadingSyncStrategy()
 
+    raise ValueError("unknown sync strategy '%s'" % name)
 
+
+def _asyncio_loop_running(modules):
+    """True if an asyncio (or trollius) loop is running in this thread
+    """
+    if "asyncio" not in modules and "trollius" not in modules:
+        return False
+    from kazoo.sync.sync_asyncio import running_loop
+    return running_loop() is not None
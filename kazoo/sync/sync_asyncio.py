@@ -0,0 +1,135 @@
+"""Sync strategy for asyncio event loops
+
+Results wrap an asyncio Future, so coroutines on the loop can `await` them
+(or `yield From(result.future)` under trollius) instead of blocking a thread
+in get(). Callbacks are handed to the loop with call_soon_threadsafe.
+"""
+import logging
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+try:
+    from threading import get_ident
+except ImportError:
+    from thread import get_ident
+
+from kazoo.sync.sync_threading import ThreadingSyncStrategy, TimeoutError,\
+    _AsyncResult as _ThreadingAsyncResult
+
+log = logging.getLogger(__name__)
+
+
+def running_loop():
+    """Return the event loop running in this thread, or None
+    """
+    get_running_loop = getattr(asyncio, "_get_running_loop", None)
+    if get_running_loop is not None:
+        return get_running_loop()
+
+    # trollius doesn't track the running loop, so take this thread's event
+    # loop if it is running, and running here
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        # no event loop set for this thread
+        return None
+    if not loop.is_running():
+        return None
+    thread_id = getattr(loop, "_thread_id", None)
+    if thread_id is not None and thread_id != get_ident():
+        return None
+    return loop
+
+
+class _AsyncResult(_ThreadingAsyncResult):
+    """An AsyncResult that is also awaitable on the strategy's loop
+
+    It may be set from any thread. Threads other than the loop's can still
+    block in get().
+    """
+    def __init__(self, sync):
+        _ThreadingAsyncResult.__init__(self)
+        self._sync = sync
+        self.future = asyncio.Future(loop=sync.loop)
+
+    def set(self, value=None):
+        _ThreadingAsyncResult.set(self, value)
+        self._sync.call_in_loop(self._resolve)
+
+    def set_exception(self, exception):
+        _ThreadingAsyncResult.set_exception(self, exception)
+        self._sync.call_in_loop(self._resolve)
+
+    def _run_link(self, callback):
+        # links run on the loop, like dispatched callbacks
+        self._sync.call_in_loop(_ThreadingAsyncResult._run_link, self,
+            callback)
+
+    def _resolve(self):
+        if self.future.done():
+            return
+        if self.successful():
+            self.future.set_result(self.value)
+        else:
+            self.future.set_exception(self.exception)
+
+    def get(self, block=True, timeout=None):
+        if block and not self.ready() and running_loop() is self._sync.loop:
+            raise RuntimeError("blocking get() on the event loop thread would "
+                               "deadlock; await the result instead")
+        try:
+            return _ThreadingAsyncResult.get(self, block, timeout)
+        except TimeoutError:
+            raise asyncio.TimeoutError()
+
+    def __iter__(self):
+        return iter(self.future)
+
+    __await__ = __iter__
+
+
+class AsyncioSyncStrategy(ThreadingSyncStrategy):
+    """Sync strategy for code running on an asyncio event loop
+
+    Blocking work (the pure-Python connection loop, sleeps) still runs on
+    threads; only results and callbacks are delivered on the loop.
+    """
+    name = "asyncio"
+    timeout_error = asyncio.TimeoutError
+
+    def __init__(self, loop=None):
+        """
+        @param loop: event loop to deliver on; defaults to the running loop
+                     or else asyncio's current event loop
+        """
+        if loop is None:
+            loop = running_loop() or asyncio.get_event_loop()
+        self.loop = loop
+
+    def async_result(self):
+        return _AsyncResult(self)
+
+    def call_in_loop(self, fun, *args):
+        """Run a function on the loop, directly if already on its thread
+        """
+        if running_loop() is self.loop:
+            fun(*args)
+        else:
+            self.loop.call_soon_threadsafe(fun, *args)
+
+    def dispatch_callback(self, fun, *args):
+        """Run a callback on the event loop without waiting for it
+
+        Safe to call from any thread. Callbacks run in dispatch order.
+        """
+        self.loop.call_soon_threadsafe(_run_callback, fun, args)
+
+
+def _run_callback(fun, args):
+    try:
+        fun(*args)
+    except Exception:
+        log.exception("Exception in kazoo callback")
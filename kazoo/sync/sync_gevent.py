@@ -1,11 +1,19 @@
+import ctypes
+import ctypes.util
 import fcntl
 import os
 import logging
+import struct
+import time
+from collections import deque
 
 import gevent
 import gevent.event
+import gevent.select
+import gevent.socket
 from gevent.timeout import Timeout
 
+from kazoo.stats import LatencyHistogram
 # get the unpatched thread module
 import kazoo.sync.util
 realthread = kazoo.sync.util.get_realthread()
@@ -22,36 +30,93 @@ def _pipe():
     return r, w
 
 
-#noinspection PyUnusedLocal
-def _pipe_read_callback(event, eventtype):
+def _eventfd():
+    """Return a non-blocking eventfd, or None if the platform has none
+    """
     try:
-        os.read(event.fd, 1)
-    except EnvironmentError:
-        pass
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        eventfd = libc.eventfd
+    except (OSError, AttributeError):
+        return None
+
+    fd = eventfd(0, 0)
+    if fd < 0:
+        return None
+    fcntl.fcntl(fd, fcntl.F_SETFL, os.O_NONBLOCK)
+    return fd
+
+
+class _Waker(object):
+    """Wakes the gevent hub from other OS threads
+
+    Wakeups are coalesced: once one is written, further wake() calls are
+    free until the hub drains it. Uses an eventfd where available, a pipe
+    otherwise.
+    """
+
+    _EVENTFD_TOKEN = struct.pack("@Q", 1)
+
+    def __init__(self):
+        fd = _eventfd()
+        if fd is not None:
+            self._read_fd = self._write_fd = fd
+            self._token = self._EVENTFD_TOKEN
+        else:
+            self._read_fd, self._write_fd = _pipe()
+            self._token = '\0'
+        self._pending = False
+
+    def fileno(self):
+        return self._read_fd
+
+    def wake(self):
+        if self._pending:
+            return
+        self._pending = True
+        try:
+            os.write(self._write_fd, self._token)
+        except EnvironmentError:
+            # full pipe: a wakeup is already waiting
+            pass
+
+    def drain(self):
+        # read before clearing the flag: cleared first, a wake() landing in
+        # between would have its byte swallowed by our read and leave the
+        # flag set with nothing to read, so no wakeup would ever be written
+        # again. a wake() skipped because the flag is still set has its
+        # work picked up by our caller.
+        try:
+            os.read(self._read_fd, 4096)
+        except EnvironmentError:
+            pass
+        self._pending = False
+
+    def close(self):
+        os.close(self._read_fd)
+        if self._write_fd != self._read_fd:
+            os.close(self._write_fd)
 
 
 class _AsyncResult(gevent.event.AsyncResult):
-    def __init__(self, pipe):
-        self._pipe = pipe
+    def __init__(self, sync):
+        self._sync = sync
         gevent.event.AsyncResult.__init__(self)
 
     def set_exception(self, exception):
-        gevent.event.AsyncResult.set_exception(self, exception)
-        os.write(self._pipe, '\0')
+        self._sync._call_in_hub(gevent.event.AsyncResult.set_exception,
+            self, exception)
 
     def set(self, value=None):
-        gevent.event.AsyncResult.set(self, value)
-        os.write(self._pipe, '\0')
+        self._sync._call_in_hub(gevent.event.AsyncResult.set, self, value)
 
 
 class _Event(gevent.event.Event):
-    def __init__(self, pipe):
-        self._pipe = pipe
+    def __init__(self, sync):
+        self._sync = sync
         gevent.event.Event.__init__(self)
 
     def set(self):
-        gevent.event.Event.set(self)
-        os.write(self._pipe, '\0')
+        self._sync._call_in_hub(gevent.event.Event.set, self)
 
 
 class GeventSyncStrategy(object):
@@ -60,24 +125,33 @@ class GeventSyncStrategy(object):
     timeout_error = Timeout
 
     def __init__(self):
-        self._pipe_read, self._pipe_write = _pipe()
+        # completions (AsyncResult and Event sets) made by other OS threads,
+        # waiting to be applied in the hub. They are applied in batches, with
+        # at most one wakeup written per batch.
+        self._completions = deque()
+        self._waker = _Waker()
 
         self._event = gevent.core.event(
             gevent.core.EV_READ | gevent.core.EV_PERSIST,
-        self._pipe_read, _pipe_read_callback)
+        self._waker.fileno(), self._wake_callback)
         self._event.add()
 
-        self._cb_fun = None
-        self._cb_args = None
+        # callbacks dispatched by the ZK thread, waiting to run on the gevent
+        # thread. deque appends and pops are atomic, so the ZK thread never
+        # waits on the greenlet.
+        self._callbacks = deque()
+
+        # time from dispatch_callback to the callback running, which is how
+        # long callbacks wait for the gevent thread. only the callback
+        # greenlet records into it.
+        self.dispatch_latency = LatencyHistogram()
 
         # this Event is waited on by a greenlet and set by an OS thread.
-        # it is set when a new callback is dispatched by zookeeper.
-        self._cb_event = _Event(self._pipe_write)
+        # it is set when the callback queue goes from empty to non-empty.
+        self._cb_event = _Event(self)
 
-        # this is a real (unpatched) Lock object that is waited on by the OS
-        # thread after it signals a callback to the greenlet. The greenlet
-        # acquires the lock and releases it when the callback is complete.
-        self._cb_lock = realthread.allocate_lock()
+        # completions made on the gevent thread itself are applied directly
+        self._thread_ident = realthread.get_ident()
 
         self._cb_greenlet = gevent.spawn(self._cb_thread)
 
@@ -95,53 +169,92 @@ class GeventSyncStrategy(object):
             except Exception:
                 pass
 
+        if getattr(self, "_waker", None):
+            try:
+                self._waker.close()
+            except Exception:
+                pass
+
+    #noinspection PyUnusedLocal
+    def _wake_callback(self, event, eventtype):
+        """Hub callback: apply every completion queued since the last wakeup
+        """
+        self._waker.drain()
+
+        completions = self._completions
+        while completions:
+            fun, args = completions.popleft()
+            try:
+                fun(*args)
+            except Exception:
+                log.exception("Exception completing kazoo result")
+
+    def _call_in_hub(self, fun, *args):
+        """Run a non-blocking function on the gevent thread
+
+        Called directly when already on the gevent thread. Otherwise it is
+        queued for the hub, which is woken only if no wakeup is pending.
+        """
+        if realthread.get_ident() == self._thread_ident:
+            fun(*args)
+        else:
+            self._completions.append((fun, args))
+            self._waker.wake()
+
     def _cb_thread(self):
         """Greenlet function that runs callbacks in the gevent loop
 
         1. Waits on a gevent-friendly Event which is set by the ZK callback thread
-        2. Runs the callback
-        3. Sets a condition variable which is being waited on by the ZK thread
+        2. Clears the Event, then runs every queued callback in order
         """
+        callbacks = self._callbacks
+        latency = self.dispatch_latency
 
         while True:
             self._cb_event.wait()
 
-            # this should not be able to block
-            with self._cb_lock:
-
-                fun = self._cb_fun
-                args = self._cb_args
-
+            # clear before draining: anything queued after this point either
+            # gets drained below or sets the event again
+            self._cb_event.clear()
 
+            while callbacks:
+                fun, args, dispatched = callbacks.popleft()
+                latency.record(time.time() - dispatched)
                 try:
                     fun(*args)
                 except Exception:
                     log.exception("Exception in kazoo callback")
 
-                self._cb_fun = None
-                self._cb_args = None
-                self._cb_event.clear()
-
     def async_result(self):
-        return _AsyncResult(self._pipe_write)
+        return _AsyncResult(self)
 
     def dispatch_callback(self, fun, *args):
         """Run a callback under gevent
 
-        This is called by an OS thread (not the gevent one) and it runs the
-        callback on the gevent thread. It returns after the callback finishes.
-
-        This method itself is not thread-safe: it cannot be called by more
-        than one thread at a time.
+        This is usually called by an OS thread (not the gevent one). The
+        callback is queued and run on the gevent thread, in dispatch order;
+        this method returns without waiting for it. It is safe to call from
+        several threads at once, including the gevent thread.
 
         @param fun: callable to run on gevent thread
         @param args: args to pass to function
         """
+        self._callbacks.append((fun, args, time.time()))
 
-        self._cb_fun = fun
-        self._cb_args = args
-        self._cb_event.set()
-        while self._cb_event.is_set():
-            with self._cb_lock:
-                pass
+        # only the first callback of a batch needs to wake the greenlet
+        if not self._cb_event.is_set():
+            self._cb_event.set()
+
+    def spawn(self, fun, *args):
+        """Run a function in a new greenlet
+        """
+        return gevent.spawn(fun, *args)
+
+    def sleep(self, seconds):
+        gevent.sleep(seconds)
+
+    def select(self, rlist, wlist, xlist, timeout=None):
+        return gevent.select.select(rlist, wlist, xlist, timeout)
 
+    def create_connection(self, address, timeout=None):
+        return gevent.socket.create_connection(address, timeout)
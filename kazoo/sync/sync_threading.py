@@ -1,4 +1,10 @@
+import logging
+import select
+import socket
 import threading
+import time
+
+log = logging.getLogger(__name__)
 
 # sentinal object
 _NONE = object()
@@ -18,6 +24,7 @@ class _AsyncResult(object):
         self.value = None
         self._exception = _NONE
         self._condition = threading.Condition()
+        self._links = []
 
     def ready(self):
         """Return true if and only if it holds a value or an exception"""
@@ -41,6 +48,8 @@ class _AsyncResult(object):
 
             self._condition.notify_all()
 
+        self._notify_links()
+
     def set_exception(self, exception):
         """Store the exception. Wake up the waiters.
         """
@@ -49,6 +58,32 @@ class _AsyncResult(object):
 
             self._condition.notify_all()
 
+        self._notify_links()
+
+    def rawlink(self, callback):
+        """Register a callback to call with this result once it is set
+
+        The callback runs in the thread that sets the result, or right away
+        if the result is already set.
+        """
+        with self._condition:
+            if self._exception is _NONE:
+                self._links.append(callback)
+                return
+        self._run_link(callback)
+
+    def _notify_links(self):
+        with self._condition:
+            links, self._links = self._links, []
+        for callback in links:
+            self._run_link(callback)
+
+    def _run_link(self, callback):
+        try:
+            callback(self)
+        except Exception:
+            log.exception("Exception in AsyncResult link")
+
     def get(self, block=True, timeout=None):
         """Return the stored value or raise the exception.
 
@@ -88,4 +123,21 @@ class ThreadingSyncStrategy(object):
 
         #directly run method in the current thread
         fun(*args)
+
+    def spawn(self, fun, *args):
+        """Run a function in a new daemon thread
+        """
+        thread = threading.Thread(target=fun, args=args)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def select(self, rlist, wlist, xlist, timeout=None):
+        return select.select(rlist, wlist, xlist, timeout)
+
+    def create_connection(self, address, timeout=None):
+        return socket.create_connection(address, timeout)
   
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""Benchmark callback handoff from an OS thread to the gevent loop
+
+Compares GeventSyncStrategy.dispatch_callback with the lock-step handoff it
+replaced, which passed one callback at a time and made the dispatching thread
+spin until the greenlet had run it. Run with:
+
+    python -m kazoo.sync.test.bench_dispatch [events]
+"""
+import sys
+import time
+
+import gevent
+import gevent.event
+
+from kazoo.sync.sync_gevent import GeventSyncStrategy, _Event, realthread
+
+DEFAULT_EVENTS = 100000
+
+
+class LockstepDispatcher(object):
+    """The previous GeventSyncStrategy handoff, kept for comparison
+    """
+
+    def __init__(self, sync):
+        self._cb_fun = None
+        self._cb_args = None
+        self._cb_event = _Event(sync)
+        self._cb_lock = realthread.allocate_lock()
+        self._cb_greenlet = gevent.spawn(self._cb_thread)
+
+    def _cb_thread(self):
+        while True:
+            self._cb_event.wait()
+            with self._cb_lock:
+                try:
+                    self._cb_fun(*self._cb_args)
+                except Exception:
+                    pass
+                self._cb_fun = None
+                self._cb_args = None
+                self._cb_event.clear()
+
+    def dispatch_callback(self, fun, *args):
+        self._cb_fun = fun
+        self._cb_args = args
+        self._cb_event.set()
+        while self._cb_event.is_set():
+            with self._cb_lock:
+                pass
+
+
+def _dispatch_all(dispatch_callback, fun, events):
+    for i in xrange(events):
+        dispatch_callback(fun, i)
+
+
+def measure(dispatch_callback, events):
+    """Return callbacks per second delivered from an OS thread
+    """
+    done = gevent.event.Event()
+    count = [0]
+
+    def callback(i):
+        count[0] += 1
+        if count[0] == events:
+            done.set()
+
+    start = time.time()
+    realthread.start_new_thread(_dispatch_all,
+        (dispatch_callback, callback, events))
+    done.wait()
+    return events / (time.time() - start)
+
+
+def main(events=DEFAULT_EVENTS):
+    sync = GeventSyncStrategy()
+    lockstep = LockstepDispatcher(sync)
+
+    before = measure(lockstep.dispatch_callback, events)
+    after = measure(sync.dispatch_callback, events)
+
+    print "lock-step handoff: %10.0f events/sec" % before
+    print "queued handoff:    %10.0f events/sec" % after
+    print "speedup:           %10.1fx" % (after / before)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -1,3 +1,5 @@
+import sys
+import select
 import unittest
 import time
 import threading
@@ -42,16 +44,27 @@ class SyncStrategyTests(unittest.TestCase):
         else:
             self.fail("Expected exception")
 
+    def test_async_result_many(self):
+        """Set many AsyncResults from another OS thread in one burst
+        """
+        async_results = [self.sync.async_result() for _ in range(1000)]
+
+        realthread.start_new_thread(thread_set_async_results,
+            (async_results,))
+
+        for i, async_result in enumerate(async_results):
+            self.assertEqual(async_result.get(timeout=10), i)
+
     def test_dispatch_callback(self):
         """Dispatch many callbacks serially from another OS thread
         """
 
         # goal with this test is to ensure that a series of callbacks are
-        # called in sequence and never in parallel. That is, dispatch_callback
-        # doesn't return until the callback completes execution. The way the
-        # test is currently written could still potentially pass even if this
-        # condition does not hold, due to a race. Doing many dispatches seems
-        # to flush this out, but it is not ideal.
+        # called in sequence and never in parallel, in the order they were
+        # dispatched. The way the test is currently written could still
+        # potentially pass even if this condition does not hold, due to a
+        # race. Doing many dispatches seems to flush this out, but it is not
+        # ideal.
 
         callbacks = 1000
         results = []
@@ -73,12 +86,162 @@ class SyncStrategyTests(unittest.TestCase):
         done.wait(10)
         self.assertEqual(results, range(callbacks))
 
+class AsyncioSyncStrategyTests(SyncStrategyTests):
+    """Runs the strategy tests against an asyncio loop in another thread
+
+    Under Python 2 these run with trollius.
+    """
+    def setUp(self):
+        try:
+            from kazoo.sync.sync_asyncio import asyncio, AsyncioSyncStrategy
+        except ImportError:
+            raise unittest.SkipTest("asyncio or trollius is not installed")
+        self.asyncio = asyncio
+
+        self.loop = asyncio.new_event_loop()
+        def run_loop():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_forever()
+        self.loop_thread = threading.Thread(target=run_loop)
+        self.loop_thread.start()
+        self.sync = AsyncioSyncStrategy(self.loop)
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        del self.sync
+
+    def test_async_result_future(self):
+        """Resolve the awaitable future from another OS thread
+        """
+        async_result = self.sync.async_result()
+        done = threading.Event()
+        values = []
+
+        def on_done(future):
+            values.append(future.result())
+            done.set()
+
+        self.loop.call_soon_threadsafe(
+            lambda: async_result.future.add_done_callback(on_done))
+
+        realthread.start_new_thread(thread_set_async_result,
+            (async_result, "hats"))
+
+        done.wait(10)
+        self.assertEqual(values, ["hats"])
+
+    def test_async_result_timeout(self):
+        async_result = self.sync.async_result()
+        self.assertRaises(self.sync.timeout_error, async_result.get,
+            timeout=0.01)
+
+    def _call_in_loop(self, fun):
+        """Call fun on the loop's thread and return its result or exception
+        """
+        done = threading.Event()
+        results = []
+        def call():
+            try:
+                results.append(fun())
+            except Exception, e:
+                results.append(e)
+            done.set()
+        self.loop.call_soon_threadsafe(call)
+        done.wait(10)
+        return results[0]
+
+    def test_running_loop(self):
+        from kazoo.sync.sync_asyncio import running_loop
+        self.assertTrue(self._call_in_loop(running_loop) is self.loop)
+        self.assertTrue(self._call_in_loop(
+            lambda: kazoo.sync._asyncio_loop_running(sys.modules)))
+
+        # the loop is only running in its own thread
+        results = []
+        def other_thread():
+            self.asyncio.set_event_loop(self.loop)
+            results.append(running_loop())
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [None])
+
+    def test_blocking_get_on_loop(self):
+        async_result = self.sync.async_result()
+        error = self._call_in_loop(lambda: async_result.get(timeout=1))
+        self.assertTrue(isinstance(error, RuntimeError))
+
+class GeventWakerTests(unittest.TestCase):
+    def setUp(self):
+        try:
+            from kazoo.sync.sync_gevent import _Waker
+        except ImportError:
+            raise unittest.SkipTest("gevent is not installed")
+        self.waker = _Waker()
+
+    def tearDown(self):
+        self.waker.close()
+
+    def test_wake_while_draining(self):
+        """Never lose a wakeup to a wake() racing with drain()
+        """
+        waker = self.waker
+        count = 100000
+        items = []
+
+        def produce():
+            for i in xrange(count):
+                items.append(i)
+                waker.wake()
+
+        realthread.start_new_thread(produce, ())
+
+        consumed = 0
+        while consumed < count:
+            readable, _, _ = select.select([waker.fileno()], [], [], 5)
+            self.assertTrue(readable,
+                "lost wakeup with %d items waiting" % (len(items) - consumed))
+            waker.drain()
+            consumed = len(items)
+
+    def test_wake_during_read(self):
+        """A wake() landing just before drain() reads is not lost
+        """
+        import kazoo.sync.sync_gevent as sync_gevent
+        waker = self.waker
+        real_os = sync_gevent.os
+
+        class RacingOs(object):
+            def __getattr__(self, name):
+                return getattr(real_os, name)
+
+            def read(self, fd, n):
+                waker.wake()
+                return real_os.read(fd, n)
+
+        waker.wake()
+        sync_gevent.os = RacingOs()
+        try:
+            waker.drain()
+        finally:
+            sync_gevent.os = real_os
+
+        # a pending wakeup must have a byte waiting for it
+        readable, _, _ = select.select([waker.fileno()], [], [], 0)
+        self.assertTrue(readable or not waker._pending)
+
 def thread_set_async_result(async_result, value=None, exception=None):
     if exception:
         async_result.set_exception(exception)
     else:
         async_result.set(value)
 
+def thread_set_async_results(async_results):
+    for i, async_result in enumerate(async_results):
+        async_result.set(i)
+
 def thread_dispatch_callbacks(sync, fun, count=1):
     for i in range(count):
         sync.dispatch_callback(fun, i)
@@ -33,6 +33,15 @@ def until_timeout(timeout, value=None):
             raise Exception("timed out before success!")
         yield value
 
+def wait_for(condition, timeout=5):
+    """Poll condition until it returns true, or raise once timeout seconds
+    have passed
+    """
+    for _ in until_timeout(timeout):
+        if condition():
+            return
+        time.sleep(0.01)
+
 
 
 class KazooTestCase(unittest.TestCase):
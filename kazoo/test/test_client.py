@@ -1,10 +1,19 @@
+import os
+import shutil
+import tempfile
 import threading
+import time
 import uuid
 
-from kazoo.client import KazooState, make_digest_acl
+from kazoo.client import KazooClient, KazooState, make_digest_acl
 from kazoo.zkclient import EventType
-from kazoo.test import KazooTestCase
-from kazoo.exceptions import NoNodeException, NoAuthException
+from kazoo.recipe.lock import ZooLock
+from kazoo.recipe.party import ZooParty
+from kazoo.session import FileSessionStore
+from kazoo.watch import WatchType
+from kazoo.test import KazooTestCase, until_timeout, wait_for
+from kazoo.exceptions import NoNodeException, NoAuthException,\
+    NodeExistsException, RuntimeInconsistencyException, RolledBackException
 
 class KazooClientTests(KazooTestCase):
 
@@ -82,6 +91,332 @@ class KazooClientTests(KazooTestCase):
         self.assertTrue(client.exists("/1/2/3/4"))
         self.assertTrue(zk.exists(namespace + "/1/2/3/4"))
 
+    def test_ensure_path_known(self):
+        client = self.client
+        client.connect()
+        zk = client.zk
+
+        client.ensure_path("/1/2/3")
+
+        # known paths cost no round trips
+        def fail(*args, **kwargs):
+            self.fail("ensure_path went to ZooKeeper")
+        zk.create, real_create = fail, zk.create
+        zk.exists, real_exists = fail, zk.exists
+        try:
+            client.ensure_path("/1/2/3")
+            client.ensure_path("/1/2")
+        finally:
+            zk.create = real_create
+            zk.exists = real_exists
+
+        # deleting forgets the path and its descendants
+        client.delete("/1/2/3")
+        client.delete("/1/2")
+        client.ensure_path("/1/2/3")
+        self.assertTrue(client.exists("/1/2/3"))
+
+        # paths deleted behind our back are recreated by makepath
+        zk.delete(self.namespace + "/1/2/3")
+        zk.delete(self.namespace + "/1/2")
+        client.create("/1/2/3/4", "", makepath=True)
+        self.assertTrue(client.exists("/1/2/3/4"))
+
+        # a missing parent is forgotten with its descendants
+        client.ensure_path("/1/2/5/6")
+        zk.delete(self.namespace + "/1/2/5/6")
+        zk.delete(self.namespace + "/1/2/5")
+        self.assertRaises(NoNodeException, client.create, "/1/2/5/7", "")
+        client.ensure_path("/1/2/5/6")
+        self.assertTrue(client.exists("/1/2/5/6"))
+
+    def test_watch_registry(self):
+        client = self.client
+        client.connect()
+        client.create("/w", "1")
+
+        events = []
+        event = threading.Event()
+        def watch_one(e):
+            events.append(("one", e.path))
+            event.set()
+        def watch_two(e):
+            events.append(("two", e.path))
+
+        client.get("/w", watch=watch_one)
+        client.exists("/w", watch=watch_two)
+        client.get("/w", watch=watch_two)
+        client.get_children("/w", watch=watch_one)
+
+        # one server watch per path and type
+        self.assertEqual(len(client.watches), 2)
+        self.assertEqual(client.watches.subscriber_count, 3)
+
+        self.assertTrue(client.remove_watch("/w", watch_one, WatchType.CHILD))
+        self.assertEqual(client.watches.subscriber_count, 2)
+
+        client.set("/w", "2")
+        event.wait(5)
+        for _ in until_timeout(5):
+            if len(events) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(sorted(events), [("one", "/w"), ("two", "/w")])
+        self.assertEqual(len(client.watches), 1)
+
+        # a failed request sets no watch
+        self.assertRaises(NoNodeException, client.get, "/missing",
+            watch_one)
+        self.assertEqual(len(client.watches), 1)
+
+        # the watch is set again for others that joined a failed request
+        path = client.namespace_path("/m")
+        strip = len(self.namespace)
+        dispatch = client.watches.subscribe(path, WatchType.DATA, watch_one,
+            strip)
+        client.watches.subscribe(path, WatchType.DATA, watch_two, strip)
+        client._watch_failed(path, WatchType.DATA, watch_one, strip,
+            dispatch)
+        del events[:]
+        client.create("/m", "")
+        for _ in until_timeout(5):
+            if events:
+                break
+            time.sleep(0.01)
+        self.assertEqual(events, [("two", "/m")])
+
+    def test_data_cache(self):
+        client = KazooClient(self.hosts, namespace=self.namespace,
+                             data_cache_size=2)
+        client.connect()
+        try:
+            cache = client.data_cache
+            client.create("/a", "1", makepath=True)
+            client.create("/b", "2")
+            client.create("/c", "3")
+
+            self.assertEqual(client.get("/a")[0], "1")
+            self.assertEqual(client.get("/a")[0], "1")
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            # our own writes are visible straight away
+            client.set("/a", "4")
+            self.assertEqual(client.get("/a")[0], "4")
+            self.assertEqual(cache.misses, 2)
+
+            # other writers are picked up through the watch
+            self.client.connect()
+            self.client.set("/a", "5")
+            for _ in until_timeout(5):
+                if client.get("/a")[0] == "5":
+                    break
+                time.sleep(0.01)
+
+            # least recently used entries are evicted
+            client.get("/b")
+            client.get("/c")
+            self.assertEqual(len(cache), 2)
+            misses = cache.misses
+            client.get("/a")
+            self.assertEqual(cache.misses, misses + 1)
+
+            # reloads share the pending watch of their node
+            self.assertEqual(len(client.watches), 3)
+            self.assertEqual(client.watches.subscriber_count, 3)
+        finally:
+            client.close()
+
+    def test_data_cache_recursive_delete(self):
+        client = KazooClient(self.hosts, namespace=self.namespace,
+                             data_cache_size=10)
+        client.connect()
+        try:
+            client.create("/a", "1", makepath=True)
+            client.create("/a/b", "2")
+            self.assertEqual(client.get("/a/b")[0], "2")
+
+            client.recursive_delete("/a")
+            self.assertRaises(NoNodeException, client.get, "/a/b")
+            self.assertRaises(NoNodeException, client.get, "/a")
+        finally:
+            client.close()
+
+    def test_session_store(self):
+        self.client.connect()
+        directory = tempfile.mkdtemp()
+        try:
+            store = FileSessionStore(os.path.join(directory, "session"))
+            client = KazooClient(self.hosts, session_store=store)
+            client.connect()
+            session_id = client.client_id[0]
+            path = self.namespace + "-session"
+            client.create(path, "", ephemeral=True)
+
+            # a restarted process resumes the session
+            resumed = KazooClient(self.hosts, session_store=store)
+            resumed.connect()
+            self.assertEqual(resumed.client_id[0], session_id)
+            self.assertTrue(resumed.exists(path))
+
+            # once it has expired, the next process starts a new one
+            client_id = resumed.client_id
+            resumed.close()
+            client.zk.close()
+            self.assertFalse(self.client.zk.exists(path))
+            store.save(client_id)
+
+            fresh = KazooClient(self.hosts, session_store=store)
+            fresh.connect(5)
+            self.assertEqual(fresh.state, KazooState.CONNECTED)
+            self.assertNotEqual(fresh.client_id[0], session_id)
+            for _ in until_timeout(5):
+                if store.load() == fresh.client_id:
+                    break
+                time.sleep(0.05)
+            fresh.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_session_store_reconnect(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = FileSessionStore(os.path.join(directory, "session"))
+            client = KazooClient(self.hosts, session_store=store)
+            client.connect()
+            resumed = KazooClient(self.hosts, session_store=store)
+            resumed.connect()
+            session_id = resumed.client_id[0]
+
+            # ending the session from the other handle expires it
+            client.close()
+            wait_for(lambda: resumed.state == KazooState.LOST)
+
+            # reconnecting starts a new session rather than resuming the
+            # dead one again
+            resumed.connect(5)
+            self.assertEqual(resumed.state, KazooState.CONNECTED)
+            self.assertNotEqual(resumed.client_id[0], session_id)
+            resumed.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_session_store_recipes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = FileSessionStore(os.path.join(directory, "session"))
+            client = KazooClient(self.hosts, namespace=self.namespace,
+                                 session_store=store)
+            client.connect()
+            self.assertTrue(ZooLock(client, "/lock",
+                                    identifier="worker-1").acquire())
+            ZooParty(client, "/party", identifier="worker-1").join()
+
+            # a restarted process adopts the nodes it left
+            resumed = KazooClient(self.hosts, namespace=self.namespace,
+                                  session_store=store)
+            resumed.connect()
+            lock = ZooLock(resumed, "/lock", identifier="worker-1")
+            self.assertTrue(lock.acquire(timeout=5))
+            self.assertEqual(len(lock.get_contenders()), 1)
+
+            party = ZooParty(resumed, "/party", "new data",
+                             identifier="worker-1")
+            party.join()
+            self.assertEqual(party.get_participants(), ["new data"])
+
+            resumed.close()
+            client.zk.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_stale_recipe_nodes(self):
+        old = KazooClient(self.hosts, namespace=self.namespace)
+        old.connect()
+        self.assertTrue(ZooLock(old, "/lock", identifier="worker-1").acquire())
+        ZooParty(old, "/party", "old data", identifier="worker-1").join()
+
+        # a process that didn't resume the session replaces the nodes of
+        # the old one, rather than adopting nodes that go with it
+        client = self.client
+        client.connect()
+        lock = ZooLock(client, "/lock", identifier="worker-1")
+        self.assertTrue(lock.acquire(timeout=5))
+        party = ZooParty(client, "/party", "new data", identifier="worker-1")
+        party.join()
+
+        old.close()
+        self.assertEqual(len(lock.get_contenders()), 1)
+        self.assertEqual(party.get_participants(), ["new data"])
+
+    def test_chroot(self):
+        client = self.client
+        client.connect()
+
+        view = client.chroot("/tenant")
+        self.assertTrue(view.zk is client.zk)
+        self.assertEqual(view.state, KazooState.CONNECTED)
+
+        view.create("/node", "hello")
+        self.assertEqual(client.get("/tenant/node")[0], "hello")
+        self.assertEqual(view.get_children("/"), ["node"])
+
+        nested = view.chroot("/node")
+        self.assertEqual(nested.namespace, self.namespace + "/tenant/node")
+        self.assertEqual(nested.get("/")[0], "hello")
+
+        # the root client, a view and a nested view watch the same node,
+        # sharing one server watch. each gets the path in its own terms.
+        events = {}
+        condition = threading.Condition()
+        def make_watch(name):
+            def watch(watched_event):
+                with condition:
+                    events[name] = watched_event
+                    condition.notify_all()
+            return watch
+        client.exists("/tenant/node", watch=make_watch("root"))
+        view.exists("/node", watch=make_watch("view"))
+        nested.exists("/", watch=make_watch("nested"))
+        self.assertEqual(len(client.watches), 1)
+
+        view.delete("/node")
+        with condition:
+            for _ in until_timeout(5):
+                if len(events) == 3:
+                    break
+                condition.wait(0.1)
+        self.assertEqual(events["root"].path, "/tenant/node")
+        self.assertEqual(events["view"].path, "/node")
+        self.assertEqual(events["nested"].path, "/")
+        self.assertEqual(events["view"].type, EventType.DELETED)
+
+        # closing a view leaves the shared connection open
+        view.close()
+        self.assertTrue(client.exists("/tenant"))
+
+    def test_stats(self):
+        client = self.client
+        client.connect()
+
+        client.create("/node", "hello")
+        client.get("/node")
+        client.exists("/missing")
+        self.assertRaises(NoNodeException, client.get, "/missing")
+
+        event = threading.Event()
+        client.exists("/node", watch=lambda watched_event: event.set())
+        client.delete("/node")
+        event.wait(5)
+
+        stats = client.stats()
+        self.assertEqual(stats['latency']['get']['count'], 2)
+        self.assertEqual(stats['latency']['exists']['count'], 2)
+        self.assertTrue(stats['latency']['create']['max'] > 0)
+        self.assertEqual(stats['in_flight']['get'], 0)
+        # a missing node is not an error for exists()
+        self.assertEqual(stats['errors'], {'NoNodeException': 1})
+        self.assertEqual(stats['watch_events'], 1)
+
     def test_state_listener(self):
 
         states = []
@@ -147,3 +482,140 @@ class KazooClientTests(KazooTestCase):
         eve.add_auth("digest", "badbad:bad")
 
         self.assertRaises(NoAuthException, eve.get, "/1/2")
+
+    def test_get_many(self):
+        self.client.connect()
+
+        paths = ["/%d" % i for i in range(50)]
+        for i, path in enumerate(paths):
+            self.client.create(path, str(i))
+        missing = "/" + uuid.uuid4().hex
+
+        results = self.client.get_many(paths + [missing], max_in_flight=8)
+
+        self.assertEqual(len(results), 51)
+        for i, path in enumerate(paths):
+            self.assertEqual(results[path][0], str(i))
+        self.assertTrue(isinstance(results[missing], NoNodeException))
+
+        results = self.client.exists_many([paths[0], missing])
+        self.assertTrue(results[paths[0]])
+        self.assertIsNone(results[missing])
+
+        self.client.create("/0/a", "")
+        self.client.create("/0/b", "")
+        results = self.client.get_children_many(["/0", "/1"])
+        self.assertEqual(sorted(results["/0"]), ["a", "b"])
+        self.assertEqual(results["/1"], [])
+
+    def test_recursive_delete(self):
+        self.client.connect()
+
+        for a in range(3):
+            for b in range(4):
+                self.client.create("/r/%d/%d/leaf" % (a, b), "",
+                    makepath=True)
+        self.client.create("/keep", "")
+
+        progress = []
+        self.client.recursive_delete("/r", max_in_flight=4,
+            progress=lambda deleted, total: progress.append((deleted, total)))
+
+        self.assertIsNone(self.client.exists("/r"))
+        self.assertTrue(self.client.exists("/keep"))
+        self.assertEqual(progress[-1], (28, 28))
+        self.assertEqual(len(progress), 4)
+
+        # deleting a missing tree is a no-op
+        self.client.recursive_delete("/r")
+
+    def test_recursive_delete_changes(self):
+        self.client.connect()
+        for a in range(3):
+            self.client.create("/r/%d/leaf" % a, "", makepath=True)
+
+        progress = []
+        def changes(deleted, total):
+            if not progress:
+                # meanwhile someone deletes one node and adds to another
+                self.client.delete("/r/1")
+                self.client.create("/r/0/new", "")
+            progress.append((deleted, total))
+        self.client.recursive_delete("/r", progress=changes)
+
+        self.assertIsNone(self.client.exists("/r"))
+        # only the nodes we deleted are counted
+        self.assertEqual(progress, [(3, 7), (4, 6), (5, 7), (6, 7), (7, 7)])
+
+
+class PythonEngineKazooClientTests(KazooClientTests):
+    """Runs the same client tests over the pure-Python connection engine
+    """
+
+    def _get_client(self):
+        return KazooClient(self.hosts, namespace=self.namespace,
+            engine="python")
+
+    def test_transaction(self):
+        self.client.connect()
+        self.client.create("/old", "")
+
+        t = self.client.transaction()
+        t.create("/1", "one")
+        t.create("/1/2", "two")
+        t.set("/1", "uno")
+        t.check("/1", 1)
+        t.delete("/old")
+        results = t.commit()
+
+        self.assertEqual(results[:2], ["/1", "/1/2"])
+        self.assertEqual(results[2]["version"], 1)
+        self.assertEqual(results[3:], [True, True])
+        self.assertEqual(self.client.get("/1")[0], "uno")
+        self.assertIsNone(self.client.exists("/old"))
+
+        self.assertRaises(ValueError, t.create, "/3", "")
+
+    def test_transaction_failure(self):
+        self.client.connect()
+        self.client.create("/1", "")
+
+        t = self.client.transaction()
+        t.create("/2", "")
+        t.create("/1", "")
+        t.check("/2", 5)
+        results = t.commit_async().get()
+
+        self.assertTrue(isinstance(results[0], RolledBackException))
+        self.assertTrue(isinstance(results[1], NodeExistsException))
+        self.assertTrue(isinstance(results[2], RuntimeInconsistencyException))
+        self.assertIsNone(self.client.exists("/2"))
+
+    def test_transaction_context(self):
+        self.client.connect()
+
+        with self.client.transaction() as t:
+            t.create("/1", "")
+            t.create("/2", "")
+        self.assertTrue(t.committed)
+        self.assertTrue(self.client.exists("/2"))
+
+        try:
+            with self.client.transaction() as t:
+                t.create("/3", "")
+                raise KeyError("hats")
+        except KeyError:
+            pass
+        self.assertFalse(t.committed)
+        self.assertIsNone(self.client.exists("/3"))
+
+        self.client.create("/4", "")
+        try:
+            with self.client.transaction() as t:
+                t.create("/5", "")
+                t.create("/4", "")
+        except NodeExistsException:
+            pass
+        else:
+            self.fail("Expected NodeExistsException")
+        self.assertIsNone(self.client.exists("/5"))
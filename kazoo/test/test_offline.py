@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+
+from kazoo import protocol
+from kazoo.offline import OfflineQueue
+from kazoo.sync import get_sync_strategy
+from kazoo.test import until_timeout
+
+class FakeBinding(object):
+    def __init__(self):
+        self.sent = []
+
+    def aget(self, handle, path, watcher, callback):
+        self.sent.append(path)
+        callback(handle, protocol.OK, path, {})
+        return protocol.OK
+
+    def client_id(self, handle):
+        return (1, "passwd")
+
+class OfflineQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.binding = FakeBinding()
+        self.results = []
+
+    def _queue(self, **kwargs):
+        return OfflineQueue(self.binding, get_sync_strategy("threading"),
+                            **kwargs)
+
+    def _get(self, queue, path):
+        def callback(handle, code, *args):
+            self.results.append((path, code))
+        queue.aget(0, path, None, callback)
+
+    def test_passthrough(self):
+        queue = self._queue()
+        self._get(queue, "/a")
+        self.assertEqual(self.binding.sent, ["/a"])
+        self.assertEqual(self.results, [("/a", protocol.OK)])
+        self.assertEqual(queue.client_id(0), (1, "passwd"))
+
+    def test_resume_in_order(self):
+        queue = self._queue()
+        queue.suspend()
+        for path in ("/a", "/b", "/c"):
+            self._get(queue, path)
+        self.assertEqual(self.binding.sent, [])
+        self.assertEqual(len(queue), 3)
+
+        queue.resume()
+        self.assertEqual(self.binding.sent, ["/a", "/b", "/c"])
+        self.assertEqual(len(queue), 0)
+
+        self._get(queue, "/d")
+        self.assertEqual(self.binding.sent[-1], "/d")
+
+    def test_fail_all(self):
+        queue = self._queue()
+        queue.suspend()
+        self._get(queue, "/a")
+        queue.fail_all()
+        self.assertEqual(self.results, [("/a", protocol.SESSIONEXPIRED)])
+        self.assertEqual(self.binding.sent, [])
+
+    def test_max_size(self):
+        queue = self._queue(max_size=1)
+        queue.suspend()
+        self._get(queue, "/a")
+        self._get(queue, "/b")
+        self.assertEqual(self.results, [("/b", protocol.CONNECTIONLOSS)])
+
+        queue.resume()
+        self.assertEqual(self.binding.sent, ["/a"])
+
+    def test_max_age(self):
+        queue = self._queue(max_age=0.05)
+        queue.suspend()
+        self._get(queue, "/a")
+        for _ in until_timeout(5):
+            if self.results:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.results, [("/a", protocol.CONNECTIONLOSS)])
+
+        queue.resume()
+        self.assertEqual(self.binding.sent, [])
+
+    def test_session_events(self):
+        queue = self._queue()
+        # session events arrive on the binding's callback thread, here
+        queue.session_event(protocol.CONNECTING_STATE)
+        self.assertTrue(queue.suspended)
+
+        # which would never get to send what it queued itself
+        self._get(queue, "/a")
+        self.assertEqual(self.results, [("/a", protocol.CONNECTIONLOSS)])
+
+        thread = threading.Thread(target=self._get, args=(queue, "/b"))
+        thread.start()
+        thread.join()
+        self.assertEqual(len(queue), 1)
+
+        queue.session_event(protocol.CONNECTED_STATE)
+        self.assertFalse(queue.suspended)
+        self.assertEqual(self.binding.sent, ["/b"])
+
+        queue.session_event(protocol.CONNECTING_STATE)
+        thread = threading.Thread(target=self._get, args=(queue, "/c"))
+        thread.start()
+        thread.join()
+        queue.session_event(protocol.EXPIRED_SESSION_STATE)
+        self.assertEqual(self.results[-1], ("/c", protocol.SESSIONEXPIRED))
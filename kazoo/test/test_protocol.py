@@ -0,0 +1,64 @@
+import unittest
+
+from kazoo import protocol
+from kazoo.protocol import Reader, Writer, frame, Create, GetData,\
+    GetChildren, WatcherEvent
+
+
+class ProtocolTests(unittest.TestCase):
+
+    def test_frame_create(self):
+        acl = {"perms": 31, "scheme": "world", "id": "anyone"}
+        data = frame(7, Create("/a", "val", [acl], protocol.EPHEMERAL))
+
+        r = Reader(data)
+        self.assertEqual(r.read_int(), len(data) - 4)
+        self.assertEqual(r.read_int(), 7)
+        self.assertEqual(r.read_int(), Create.type)
+        self.assertEqual(r.read_string(), "/a")
+        self.assertEqual(r.read_buffer(), "val")
+        self.assertEqual(r.read_int(), 1)
+        self.assertEqual(r.read_int(), 31)
+        self.assertEqual(r.read_string(), "world")
+        self.assertEqual(r.read_string(), "anyone")
+        self.assertEqual(r.read_int(), protocol.EPHEMERAL)
+        self.assertEqual(r.offset, len(data))
+
+    def test_null_buffer(self):
+        w = Writer()
+        w.write_buffer(None)
+        w.write_vector(None, w.write_string)
+        r = Reader(w.getvalue())
+        self.assertIsNone(r.read_buffer())
+        self.assertIsNone(r.read_vector(r.read_string))
+
+    def test_get_data_reply(self):
+        w = Writer()
+        w.write_buffer("hats")
+        for field in protocol.STAT_FIELDS:
+            if field in ("version", "cversion", "aversion", "dataLength",
+                         "numChildren"):
+                w.write_int(4)
+            else:
+                w.write_long(2 ** 40)
+
+        data, stat = GetData.deserialize(Reader(w.getvalue()))
+        self.assertEqual(data, "hats")
+        self.assertEqual(stat["version"], 4)
+        self.assertEqual(stat["mzxid"], 2 ** 40)
+        self.assertEqual(set(stat), set(protocol.STAT_FIELDS))
+
+    def test_children_reply(self):
+        w = Writer()
+        w.write_vector(["a", "b"], w.write_string)
+        children, = GetChildren.deserialize(Reader(w.getvalue()))
+        self.assertEqual(children, ["a", "b"])
+
+    def test_watcher_event(self):
+        w = Writer()
+        w.write_int(protocol.CHILD_EVENT)
+        w.write_int(protocol.CONNECTED_STATE)
+        w.write_string("/a/b")
+        event = WatcherEvent.deserialize(Reader(w.getvalue()))
+        self.assertEqual(event, (protocol.CHILD_EVENT,
+                                 protocol.CONNECTED_STATE, "/a/b"))
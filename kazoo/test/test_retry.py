@@ -0,0 +1,218 @@
+import time
+import unittest
+
+from kazoo.exceptions import ConnectionLossException, CircuitOpenException
+from kazoo.retry import KazooRetry, ForceRetryError, RetryBudget, \
+    CircuitBreaker, BackoffTimer
+
+class KazooRetryTests(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.calls = 0
+
+    def _fail(self, times):
+        def func():
+            self.calls += 1
+            if self.calls <= times:
+                raise ForceRetryError()
+            return "done"
+        return func
+
+    def _retry(self, **kwargs):
+        kwargs.setdefault("sleep_func", self.sleeps.append)
+        return KazooRetry(**kwargs)
+
+    def test_backoff(self):
+        retry = self._retry(delay=0.1, backoff=2, max_delay=0.5, jitter=0)
+        self.assertEqual(retry(self._fail(5)), "done")
+        self.assertEqual(self.sleeps, [0.1, 0.2, 0.4, 0.5, 0.5])
+
+    def test_jitter(self):
+        retry = self._retry(delay=1, backoff=1, jitter=0.5)
+        retry(self._fail(50))
+        self.assertTrue(all(0.5 <= sleep <= 1 for sleep in self.sleeps))
+        self.assertTrue(len(set(self.sleeps)) > 1)
+
+    def test_max_tries(self):
+        retry = self._retry(max_tries=3)
+        self.assertRaises(ForceRetryError, retry, self._fail(5))
+        self.assertEqual(self.calls, 3)
+
+    def test_deadline(self):
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            time.sleep(seconds)
+
+        retry = self._retry(delay=0.04, jitter=0, deadline=0.1,
+                            sleep_func=sleep)
+        self.assertRaises(ForceRetryError, retry, self._fail(5))
+        # 0.04 fits before the deadline, 0.08 more does not
+        self.assertEqual(self.sleeps, [0.04])
+
+    def test_within(self):
+        retry = self._retry(deadline=10)
+        self.assertEqual(retry.within(5).deadline, 5)
+        self.assertEqual(retry.within(20).deadline, 10)
+        self.assertEqual(retry.deadline, 10)
+
+        # no time left means a single try
+        self.assertRaises(ForceRetryError, retry.within(-1), self._fail(5))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_wait_connected(self):
+        class Client(object):
+            connected = False
+            waits = []
+            def wait_connected(self, timeout):
+                self.waits.append(timeout)
+                return True
+
+        retry = self._retry(wait_connected=True)
+        retry.client = client = Client()
+        retry(self._fail(2))
+        self.assertEqual(client.waits, [None, None])
+        self.assertEqual(self.sleeps, [])
+
+    def test_backoff_timer(self):
+        class Sync(object):
+            sleeps = []
+            spawned = []
+            def sleep(self, seconds):
+                self.sleeps.append(seconds)
+            def spawn(self, func):
+                self.spawned.append(func)
+            def dispatch_callback(self, func):
+                func()
+
+        sync = Sync()
+        retry = self._retry(delay=0.1, backoff=2, max_delay=0.3, jitter=0)
+        timer = BackoffTimer(retry, sync)
+        calls = []
+        def func():
+            calls.append(None)
+
+        self.assertTrue(timer.schedule(func))
+        # one call is scheduled at a time
+        self.assertFalse(timer.schedule(func))
+        sync.spawned.pop()()
+        self.assertEqual(len(calls), 1)
+
+        for _ in range(3):
+            timer.schedule(func)
+            sync.spawned.pop()()
+        timer.reset()
+        timer.schedule(func)
+        sync.spawned.pop()()
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(sync.sleeps, [0.1, 0.2, 0.3, 0.3, 0.1])
+
+    def test_budget(self):
+        budget = RetryBudget(rate=0.001, burst=3)
+        retry = self._retry(budget=budget)
+        self.assertRaises(ForceRetryError, retry, self._fail(5))
+        self.assertEqual(self.calls, 4)
+
+        stats = budget.stats()
+        self.assertEqual(stats['granted'], 3)
+        self.assertEqual(stats['denied'], 1)
+
+    def test_budget_refill(self):
+        budget = RetryBudget(rate=100, burst=1)
+        self.assertTrue(budget.acquire())
+        self.assertFalse(budget.acquire())
+        time.sleep(0.05)
+        self.assertTrue(budget.acquire())
+
+    def test_with_client_shares_budget(self):
+        class Client(object):
+            retry_budget = RetryBudget(1)
+            circuit_breaker = CircuitBreaker()
+            class zk(object):
+                @staticmethod
+                def get_sync_strategy():
+                    return None
+
+        retry = self._retry().with_client(Client())
+        self.assertTrue(retry.budget is Client.retry_budget)
+        self.assertTrue(retry.breaker is Client.circuit_breaker)
+
+class CircuitBreakerTests(unittest.TestCase):
+    def _call(self, breaker, succeed):
+        def func():
+            if not succeed:
+                raise ConnectionLossException()
+        retry = KazooRetry(max_tries=1, breaker=breaker)
+        try:
+            retry(func)
+        except ConnectionLossException:
+            pass
+
+    def test_opens_on_error_rate(self):
+        breaker = CircuitBreaker(failure_threshold=0.5, min_calls=4)
+        self._call(breaker, True)
+        self._call(breaker, False)
+        self._call(breaker, True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self._call(breaker, False)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        retry = KazooRetry(breaker=breaker)
+        self.assertRaises(CircuitOpenException, retry, lambda: None)
+
+        stats = breaker.stats()
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['failures'], 2)
+
+    def test_half_open(self):
+        breaker = CircuitBreaker(min_calls=1, reset_timeout=0.05)
+        self._call(breaker, False)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        # one probe at a time
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record(False)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.06)
+        self._call(breaker, True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.opened, 2)
+
+    def test_other_errors_are_not_failures(self):
+        def func():
+            raise ValueError()
+        breaker = CircuitBreaker(min_calls=1)
+        retry = KazooRetry(breaker=breaker)
+        self.assertRaises(ValueError, retry, func)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()['failures'], 0)
+
+    def test_forced_retries_are_not_failures(self):
+        def func():
+            raise ForceRetryError()
+        breaker = CircuitBreaker(min_calls=1)
+        retry = KazooRetry(max_tries=3, delay=0, breaker=breaker)
+        self.assertRaises(ForceRetryError, retry, func)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()['failures'], 0)
+
+    def test_interrupted_probe(self):
+        breaker = CircuitBreaker(min_calls=1, reset_timeout=0.05)
+        self._call(breaker, False)
+        time.sleep(0.06)
+
+        def func():
+            raise KeyboardInterrupt()
+        retry = KazooRetry(breaker=breaker)
+        self.assertRaises(KeyboardInterrupt, retry, func)
+
+        # the probe slot was given back
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self._call(breaker, True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from kazoo.session import FileSessionStore
+
+class FileSessionStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "session")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        store = FileSessionStore(self.path)
+        self.assertEqual(store.load(), None)
+
+        store.save((1234, "\x00\xffpasswd"))
+        self.assertEqual(FileSessionStore(self.path).load(),
+                         (1234, "\x00\xffpasswd"))
+        self.assertEqual(os.stat(self.path).st_mode & 0777, 0600)
+        # no temporary files are left behind
+        self.assertEqual(os.listdir(self.directory), ["session"])
+
+        store.clear()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(store.load(), None)
+
+    def test_unreadable(self):
+        with open(self.path, "w") as f:
+            f.write("{torn")
+        self.assertEqual(FileSessionStore(self.path).load(), None)
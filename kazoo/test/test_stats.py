@@ -0,0 +1,27 @@
+import unittest
+
+from kazoo.stats import LatencyHistogram
+
+class LatencyHistogramTests(unittest.TestCase):
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.percentile(0.5), None)
+        self.assertEqual(histogram.snapshot()['mean'], None)
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for _ in xrange(90):
+            histogram.record(0.001)
+        for _ in xrange(10):
+            histogram.record(0.5)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertTrue(0.001 <= histogram.percentile(0.5) < 0.002)
+        self.assertTrue(0.5 <= histogram.percentile(0.99) < 1)
+        self.assertEqual(histogram.snapshot()['max'], 0.5)
+
+    def test_overflow(self):
+        histogram = LatencyHistogram()
+        histogram.record(100)
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertEqual(histogram.percentile(0.5), 100)
@@ -0,0 +1,51 @@
+import unittest
+
+from kazoo.watch import WatchRegistry, WatchType
+from kazoo.zkclient import WatchedEvent, EventType
+
+class WatchRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = WatchRegistry()
+        self.events = []
+
+    def _watch(self, name):
+        def watch(event):
+            self.events.append((name, event.path))
+        return watch
+
+    def test_failed_alone(self):
+        one = self._watch("one")
+        dispatch = self.registry.subscribe("/a", WatchType.DATA, one)
+        self.assertFalse(self.registry.failed("/a", WatchType.DATA, one,
+            dispatch=dispatch))
+        self.assertEqual(len(self.registry), 0)
+
+    def test_failed_with_subscribers(self):
+        one, two = self._watch("one"), self._watch("two")
+        dispatch = self.registry.subscribe("/a", WatchType.DATA, one)
+        self.assertEqual(
+            self.registry.subscribe("/a", WatchType.DATA, two), None)
+
+        # two still waits on the server watch dispatch was to set
+        self.assertTrue(self.registry.failed("/a", WatchType.DATA, one,
+            dispatch=dispatch))
+        self.assertEqual(self.registry.subscriber_count, 1)
+
+        dispatch(WatchedEvent(EventType.CHANGED, None, "/a"))
+        self.assertEqual(self.events, [("two", "/a")])
+
+    def test_failed_joined(self):
+        one, two = self._watch("one"), self._watch("two")
+        self.registry.subscribe("/a", WatchType.DATA, one)
+        self.registry.subscribe("/a", WatchType.DATA, two)
+
+        # the server watch was set by another request
+        self.assertFalse(self.registry.failed("/a", WatchType.DATA, two))
+        self.assertEqual(len(self.registry), 1)
+        self.assertEqual(self.registry.subscriber_count, 1)
+
+    def test_discard(self):
+        one = self._watch("one")
+        dispatch = self.registry.subscribe("/a", WatchType.CHILD, one)
+        self.registry.discard(dispatch)
+        self.assertEqual(len(self.registry), 0)
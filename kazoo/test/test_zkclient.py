@@ -1,6 +1,11 @@
 import uuid
 import threading
+import unittest
 
+from kazoo.client import KazooClient
+from kazoo.zkclient import _ZkpythonBinding
+from kazoo.exceptions import SessionExpiredException, NoNodeException,\
+    ZooKeeperException
 from kazoo.test import KazooTestCase
 
 class ZooKeeperClientTests(KazooTestCase):
@@ -112,4 +117,65 @@ class ZooKeeperClientTests(KazooTestCase):
         self.assertIsNone(exists)
 
 
+class PythonEngineZooKeeperClientTests(ZooKeeperClientTests):
+    """Runs the same client tests over the pure-Python connection engine
+    """
 
+    def _get_client(self):
+        return KazooClient(self.hosts, namespace=self.namespace,
+            engine="python")
+
+    def test_closed_connection(self):
+        self.client.connect()
+        handle = self.zk._handle
+        self.zk.close()
+
+        # requests on the closed connection fail with a ZooKeeper error
+        self.zk._handle = handle
+        self.assertRaises(SessionExpiredException, self.zk.exists, "/")
+
+        self.zk._handle = None
+        self.client.connect()
+
+
+class FakeZookeeper(object):
+    """Stands in for the zkpython module
+    """
+    OK = 0
+
+    class ZooKeeperException(Exception):
+        pass
+
+    class NoNodeException(ZooKeeperException):
+        pass
+
+    class UnknownException(ZooKeeperException):
+        pass
+
+    def aget(self, handle, path, completion):
+        raise self.NoNodeException("no node")
+
+    def adelete(self, handle, path, version, completion):
+        raise self.UnknownException("hats")
+
+    def aexists(self, handle, path, watcher, completion):
+        return self.OK
+
+
+class ZkpythonBindingTests(unittest.TestCase):
+    def setUp(self):
+        self.binding = _ZkpythonBinding(FakeZookeeper())
+
+    def test_constants(self):
+        self.assertEqual(self.binding.OK, 0)
+        self.assertEqual(self.binding.aexists(0, "/", None, None), 0)
+
+    def test_exceptions(self):
+        self.assertRaises(NoNodeException, self.binding.aget, 0, "/", None)
+        try:
+            self.binding.adelete(0, "/", -1, None)
+        except ZooKeeperException, e:
+            self.assertEqual(type(e), ZooKeeperException)
+            self.assertEqual(e.args, ("hats",))
+        else:
+            self.fail("Expected ZooKeeperException")
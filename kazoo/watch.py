@@ -0,0 +1,170 @@
+"""Client-side registry that shares server watches between subscribers
+"""
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class WatchType(object):
+    # set by get and exists; fired by creation, change and deletion
+    DATA = "data"
+    # set by get_children; fired by child changes and deletion
+    CHILD = "child"
+
+
+class _WatchEntry(object):
+    """Subscribers of one server watch
+    """
+    __slots__ = ('subscribers', 'fired')
+
+    def __init__(self):
+        # (callback, length of the namespace to strip from event paths)
+        self.subscribers = []
+        # a retried request may have set the server watch twice
+        self.fired = False
+
+
+class WatchRegistry(object):
+    """Registers one server watch per (path, watch type)
+
+    The first subscriber to a path and type gets an entry whose dispatcher
+    must be sent as the watch with its request. Later subscribers join the
+    entry and send no watch. When the server watch fires, the entry is
+    dropped and the event is passed to every subscriber, each once.
+
+    Paths are full paths from the root of ZooKeeper. Clients and their
+    chroot views share a registry, so each subscriber gives the length of
+    its namespace, which is stripped from the paths of the events it gets.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of live server watches
+        """
+        return len(self._entries)
+
+    @property
+    def subscriber_count(self):
+        """Number of subscribers across all live server watches
+        """
+        with self._lock:
+            return sum(len(entry.subscribers)
+                       for entry in self._entries.itervalues())
+
+    def subscribe(self, path, watch_type, callback, strip=0):
+        """Subscribe a callback to the next event for a path
+
+        @param path: path of node
+        @param watch_type: a WatchType
+        @param callback: called with the WatchedEvent
+        @param strip: length of the namespace to strip from event paths
+        @return the function to send as the request's watch, or None if a
+                server watch is already set
+        """
+        key = (path, watch_type)
+        subscriber = (callback, strip)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if subscriber not in entry.subscribers:
+                    entry.subscribers.append(subscriber)
+                return None
+
+            entry = self._entries[key] = _WatchEntry()
+            entry.subscribers.append(subscriber)
+
+        def dispatch(event):
+            self._fire(key, entry, event)
+        dispatch.key = key
+        dispatch.entry = entry
+        return dispatch
+
+    def unsubscribe(self, path, callback, watch_type=None, strip=0):
+        """Remove a callback from a path's watches
+
+        The server watch stays set, but the callback is not called when it
+        fires.
+
+        @param watch_type: a WatchType, or None for both
+        @param strip: the strip the callback was subscribed with
+        @return True if the callback was subscribed
+        """
+        subscriber = (callback, strip)
+        watch_types = (watch_type,) if watch_type else (WatchType.DATA,
+                                                        WatchType.CHILD)
+        found = False
+        with self._lock:
+            for watch_type in watch_types:
+                entry = self._entries.get((path, watch_type))
+                if entry is not None and subscriber in entry.subscribers:
+                    entry.subscribers.remove(subscriber)
+                    found = True
+        return found
+
+    def failed(self, path, watch_type, callback, strip=0, dispatch=None):
+        """Remove the subscriber of a request that failed
+
+        A failed request sets no watch, so its callback is not called.
+        Others may have joined the entry of a request that sent the
+        dispatcher; the entry is kept for them, and only dropped if none
+        did.
+
+        @param strip: the strip the callback was subscribed with
+        @param dispatch: the function returned by subscribe(), if the
+                         request sent it
+        @return True if subscribers are left waiting on dispatch, which
+                must be sent with another request to set the server watch
+        """
+        key = (path, watch_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            subscriber = (callback, strip)
+            if subscriber in entry.subscribers:
+                entry.subscribers.remove(subscriber)
+            if dispatch is None or entry is not dispatch.entry:
+                # the server watch of the entry is set
+                return False
+            if entry.subscribers:
+                return True
+            del self._entries[key]
+            return False
+
+    def discard(self, dispatch):
+        """Drop the entry of a dispatcher whose server watch can't be set
+        """
+        key = dispatch.key
+        with self._lock:
+            if self._entries.get(key) is dispatch.entry:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop every entry, once the server watches are gone with the
+        session
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _fire(self, key, entry, event):
+        with self._lock:
+            if entry.fired:
+                return
+            entry.fired = True
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            subscribers = list(entry.subscribers)
+
+        for callback, strip in subscribers:
+            subscriber_event = event
+            if strip and event.path:
+                subscriber_event = event._replace(
+                    path=event.path[strip:] or '/')
+            try:
+                callback(subscriber_event)
+            except Exception:
+                log.exception("Error in watch callback")
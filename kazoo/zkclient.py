@@ -1,48 +1,54 @@
 #!/usr/bin/env python
 
+import os
+import sys
 from functools import partial
 from collections import namedtuple
 
-import zookeeper
-
-from zookeeper import SystemErrorException, RuntimeInconsistencyException,\
-    DataInconsistencyException, ConnectionLossException,\
-    MarshallingErrorException,UnimplementedException,OperationTimeoutException,\
-    BadArgumentsException,ApiErrorException, NoNodeException, NoAuthException,\
-    BadVersionException,NoChildrenForEphemeralsException,NodeExistsException,\
-    InvalidACLException, AuthFailedException, NotEmptyException,\
-    SessionExpiredException, InvalidCallbackException
-
 from kazoo.sync import get_sync_strategy
-
-ZK_OPEN_ACL_UNSAFE = {"perms": zookeeper.PERM_ALL, "scheme": "world",
+from kazoo import exceptions
+from kazoo.exceptions import SystemErrorException,\
+    RuntimeInconsistencyException, DataInconsistencyException,\
+    ConnectionLossException, MarshallingErrorException,\
+    UnimplementedException, OperationTimeoutException, BadArgumentsException,\
+    ApiErrorException, NoNodeException, NoAuthException, BadVersionException,\
+    NoChildrenForEphemeralsException, NodeExistsException,\
+    InvalidACLException, AuthFailedException, NotEmptyException,\
+    SessionExpiredException, InvalidCallbackException, ZooKeeperException,\
+    RolledBackException
+from kazoo.offline import OfflineQueue
+from kazoo.stats import ClientStats
+from kazoo.protocol import Create, Delete, SetData, CheckVersion, ErrorResult
+from kazoo import protocol
+
+ZK_OPEN_ACL_UNSAFE = {"perms": protocol.PERM_ALL, "scheme": "world",
                        "id": "anyone"}
 
 
 class AclPermission(object):
-    READ = zookeeper.PERM_READ
-    WRITE = zookeeper.PERM_WRITE
-    CREATE = zookeeper.PERM_CREATE
-    DELETE = zookeeper.PERM_DELETE
-    ADMIN = zookeeper.PERM_ADMIN
-    ALL = zookeeper.PERM_ALL
+    READ = protocol.PERM_READ
+    WRITE = protocol.PERM_WRITE
+    CREATE = protocol.PERM_CREATE
+    DELETE = protocol.PERM_DELETE
+    ADMIN = protocol.PERM_ADMIN
+    ALL = protocol.PERM_ALL
 
 
 class KeeperState(object):
-    ASSOCIATING = zookeeper.ASSOCIATING_STATE
-    AUTH_FAILED = zookeeper.AUTH_FAILED_STATE
-    CONNECTED = zookeeper.CONNECTED_STATE
-    CONNECTING = zookeeper.CONNECTING_STATE
-    EXPIRED_SESSION = zookeeper.EXPIRED_SESSION_STATE
+    ASSOCIATING = protocol.ASSOCIATING_STATE
+    AUTH_FAILED = protocol.AUTH_FAILED_STATE
+    CONNECTED = protocol.CONNECTED_STATE
+    CONNECTING = protocol.CONNECTING_STATE
+    EXPIRED_SESSION = protocol.EXPIRED_SESSION_STATE
 
 
 class EventType(object):
-    NOTWATCHING = zookeeper.NOTWATCHING_EVENT
-    SESSION = zookeeper.SESSION_EVENT
-    CREATED = zookeeper.CREATED_EVENT
-    DELETED = zookeeper.DELETED_EVENT
-    CHANGED = zookeeper.CHANGED_EVENT
-    CHILD = zookeeper.CHILD_EVENT
+    NOTWATCHING = protocol.NOTWATCHING_EVENT
+    SESSION = protocol.SESSION_EVENT
+    CREATED = protocol.CREATED_EVENT
+    DELETED = protocol.DELETED_EVENT
+    CHANGED = protocol.CHANGED_EVENT
+    CHILD = protocol.CHILD_EVENT
 
 
 class WatchedEvent(namedtuple('WatchedEvent', ('type', 'state', 'path'))):
@@ -63,7 +69,24 @@ class ZooKeeperClient(object):
 
     DEFAULT_TIMEOUT = 10.0
 
-    def __init__(self, hosts, watcher=None, timeout=None, client_id=None):
+    def __init__(self, hosts, watcher=None, timeout=None, client_id=None,
+                 engine=None, sync_strategy=None, offline_queue_size=None,
+                 offline_queue_age=None):
+        """
+        @param hosts: comma-separated host:port list
+        @param watcher: optional callback for session events
+        @param timeout: session timeout in seconds
+        @param client_id: optional (session_id, passwd) to resume. If the
+                          session has expired, a new one is started.
+        @param engine: "zkpython" (default) for the C binding or "python"
+                       for the pure-Python connection engine
+        @param sync_strategy: sync strategy object or name ("gevent",
+                              "asyncio", "threading"); detected if not given
+        @param offline_queue_size: if set, hold up to this many requests
+                                   while suspended, see OfflineQueue
+        @param offline_queue_age: seconds a request may be held, or None
+                                  for no limit
+        """
         self._hosts = hosts
         self._watcher = watcher
         self._provided_client_id = client_id
@@ -73,12 +96,26 @@ class ZooKeeperClient(object):
         # ZK uses milliseconds
         self._timeout = int(timeout * 1000)
 
-        self._sync = get_sync_strategy()
+        if sync_strategy is None or isinstance(sync_strategy, basestring):
+            self._sync = get_sync_strategy(sync_strategy)
+        else:
+            self._sync = sync_strategy
+        self._zookeeper = get_binding(engine, self._sync)
+
+        self.offline_queue = None
+        if offline_queue_size:
+            self.offline_queue = self._zookeeper = OfflineQueue(
+                self._zookeeper, self._sync, offline_queue_size,
+                offline_queue_age)
+
+        self._stats = ClientStats()
 
         self._handle = None
         self._connected = False
         self._connected_async_result = self._sync.async_result()
         self._connection_timed_out = False
+        # whether the connection being made resumes _provided_client_id
+        self._resuming = False
 
     @property
     def connected(self):
@@ -87,14 +124,56 @@ class ZooKeeperClient(object):
     @property
     def client_id(self):
         if self._handle is not None:
-            return zookeeper.client_id(self._handle)
+            return self._zookeeper.client_id(self._handle)
         return None
 
     def get_sync_strategy(self):
         return self._sync
 
+    def stats(self):
+        """Return a snapshot of request latencies per operation, requests in
+        flight, errors by exception class and watch events delivered
+
+        @return: dict, see ClientStats.snapshot()
+        """
+        stats = self._stats.snapshot()
+        dispatch_latency = getattr(self._sync, 'dispatch_latency', None)
+        if dispatch_latency is not None:
+            stats['dispatch_latency'] = dispatch_latency.snapshot()
+        return stats
+
+    def _request(self, op, request, callback, *args):
+        """Send a request through the binding, recording its latency
+
+        @param op: operation name the request is recorded under
+        @param request: binding function, called as request(handle, *args,
+                        completion)
+        @param callback: completion callback to pass the result on to
+        """
+        stats = self._stats
+        start = stats.started(op)
+
+        def completion(handle, code, *result):
+            error = None
+            if code != protocol.OK and not (code == protocol.NONODE and
+                                             op == 'exists'):
+                error = _ERR_TO_EXCEPTION.get(code, Exception).__name__
+            stats.finished(op, start, error)
+            callback(handle, code, *result)
+
+        try:
+            request(self._handle, *(args + (completion,)))
+        except Exception, e:
+            stats.finished(op, start, type(e).__name__)
+            raise
+
     def _wrap_session_callback(self, func):
         def wrapper(handle, type, state, path):
+            if self.offline_queue is not None and \
+               type == protocol.SESSION_EVENT:
+                # before the event is dispatched, so requests made until
+                # listeners hear of it are held or sent as they should be
+                self.offline_queue.session_event(state)
 
             event = WatchedEvent(type, state, path)
             self._sync.dispatch_callback(func, event)
@@ -104,17 +183,35 @@ class ZooKeeperClient(object):
         def wrapper(handle, type, state, path):
 
             # don't send session events to all watchers
-            if state != zookeeper.SESSION_EVENT:
+            if state != protocol.SESSION_EVENT:
+                self._stats.watch_event()
                 event = WatchedEvent(type, state, path)
                 self._sync.dispatch_callback(func, event)
         return wrapper
 
     def _session_callback(self, event):
-        if event.state == zookeeper.CONNECTED_STATE:
+        if event.state == protocol.CONNECTED_STATE:
             self._connected = True
-        elif event.state == zookeeper.CONNECTING_STATE:
+        elif event.state == protocol.CONNECTING_STATE:
             self._connected = False
 
+        if event.state in (protocol.CONNECTED_STATE,
+                           protocol.EXPIRED_SESSION_STATE):
+            # the session we were given is only ever resumed once
+            self._provided_client_id = None
+            resuming, self._resuming = self._resuming, False
+            if resuming and event.state == protocol.EXPIRED_SESSION_STATE:
+                # the session we were asked to resume is gone. start a new
+                # one instead, as if we had never been given it
+                self._zookeeper.close(self._handle)
+                self._handle = None
+                self.connect_async()
+                return
+
+        if self._watcher:
+            # before waking connect(), so its caller sees the new state
+            self._watcher(event)
+
         if not self._connected_async_result.ready():
             #close the connection if we already timed out
             if self._connection_timed_out and self._connected:
@@ -122,9 +219,6 @@ class ZooKeeperClient(object):
             else:
                 self._connected_async_result.set()
 
-        if self._watcher:
-            self._watcher(event)
-
     def connect_async(self):
         """Asynchronously initiate connection to ZK
 
@@ -132,12 +226,19 @@ class ZooKeeperClient(object):
         @rtype AsyncResult
         """
 
+        if self._connected_async_result.ready():
+            # a previous connection was made or failed, wait for this one
+            self._connected_async_result = self._sync.async_result()
+            self._connection_timed_out = False
+
         cb = self._wrap_session_callback(self._session_callback)
+        self._resuming = bool(self._provided_client_id)
         if self._provided_client_id:
-            self._handle = zookeeper.init(self._hosts, cb, self._timeout,
-                self._provided_client_id)
+            self._handle = self._zookeeper.init(self._hosts, cb,
+                self._timeout, self._provided_client_id)
         else:
-            self._handle = zookeeper.init(self._hosts, cb, self._timeout)
+            self._handle = self._zookeeper.init(self._hosts, cb,
+                self._timeout)
 
         return self._connected_async_result
 
@@ -156,11 +257,15 @@ class ZooKeeperClient(object):
     def close(self):
         """Disconnect from ZooKeeper
         """
-        if self._connected:
-            code = zookeeper.close(self._handle)
+        if self.offline_queue is not None:
+            self.offline_queue.fail_all(protocol.CONNECTIONLOSS)
+        # close the handle even while it is reconnecting, or the engine keeps
+        # trying forever
+        if self._handle is not None:
+            code = self._zookeeper.close(self._handle)
             self._handle = None
             self._connected = False
-            if code != zookeeper.OK:
+            if code != protocol.OK:
                 raise err_to_exception(code)
 
     def add_auth_async(self, scheme, credential):
@@ -174,7 +279,8 @@ class ZooKeeperClient(object):
         async_result = self._sync.async_result()
         callback = partial(_generic_callback, async_result)
 
-        zookeeper.add_auth(self._handle, scheme, credential, callback)
+        self._request('add_auth', self._zookeeper.add_auth, callback, scheme,
+            credential)
         return async_result
 
     def add_auth(self, scheme, credential):
@@ -198,16 +304,17 @@ class ZooKeeperClient(object):
         """
         flags = 0
         if ephemeral:
-            flags |= zookeeper.EPHEMERAL
+            flags |= protocol.EPHEMERAL
         if sequence:
-            flags |= zookeeper.SEQUENCE
+            flags |= protocol.SEQUENCE
         if acl is None:
             acl = (ZK_OPEN_ACL_UNSAFE,)
 
         async_result = self._sync.async_result()
         callback = partial(_generic_callback, async_result)
 
-        zookeeper.acreate(self._handle, path, value, list(acl), flags, callback)
+        self._request('create', self._zookeeper.acreate, callback, path, value,
+            list(acl), flags)
         return async_result
 
     def create(self, path, value, acl=None, ephemeral=False, sequence=False):
@@ -233,7 +340,8 @@ class ZooKeeperClient(object):
         callback = partial(_exists_callback, async_result)
         watch_callback = self._wrap_watch_callback(watch) if watch else None
 
-        zookeeper.aexists(self._handle, path, watch_callback, callback)
+        self._request('exists', self._zookeeper.aexists, callback, path,
+            watch_callback)
         return async_result
 
     def exists(self, path, watch=None):
@@ -257,7 +365,8 @@ class ZooKeeperClient(object):
         callback = partial(_generic_callback, async_result)
         watch_callback = self._wrap_watch_callback(watch) if watch else None
 
-        zookeeper.aget(self._handle, path, watch_callback, callback)
+        self._request('get', self._zookeeper.aget, callback, path,
+            watch_callback)
         return async_result
 
     def get(self, path, watch=None):
@@ -281,7 +390,8 @@ class ZooKeeperClient(object):
         callback = partial(_generic_callback, async_result)
         watch_callback = self._wrap_watch_callback(watch) if watch else None
 
-        zookeeper.aget_children(self._handle, path, watch_callback, callback)
+        self._request('get_children', self._zookeeper.aget_children,
+            callback, path, watch_callback)
         return async_result
 
     def get_children(self, path, watch=None):
@@ -309,7 +419,8 @@ class ZooKeeperClient(object):
         async_result = self._sync.async_result()
         callback = partial(_generic_callback, async_result)
 
-        zookeeper.aset(self._handle, path, data, version, callback)
+        self._request('set', self._zookeeper.aset, callback, path, data,
+            version)
         return async_result
 
     def set(self, path, data, version=-1):
@@ -337,7 +448,8 @@ class ZooKeeperClient(object):
         async_result = self._sync.async_result()
         callback = partial(_generic_callback, async_result)
 
-        zookeeper.adelete(self._handle, path, version, callback)
+        self._request('delete', self._zookeeper.adelete, callback, path,
+            version)
         return async_result
 
     def delete(self, path, version=-1):
@@ -348,9 +460,231 @@ class ZooKeeperClient(object):
         """
         self.delete_async(path, version).get()
 
+    def transaction(self):
+        """Create a transaction to commit several operations atomically
+
+        @return: a TransactionRequest
+        """
+        return TransactionRequest(self)
+
+    def multi_async(self, operations):
+        """Asynchronously apply a list of operations in one transaction
+
+        Requires the "python" engine; zkpython has no multi support.
+
+        @param operations: kazoo.protocol Create, Delete, SetData and
+                           CheckVersion requests
+        @return: AsyncResult set with the list of per-operation results,
+                 see TransactionRequest
+        @rtype AsyncResult
+        """
+        return self._multi_async(operations)
+
+    def _multi_async(self, operations, unnamespace_path=None):
+        async_result = self._sync.async_result()
+
+        amulti = getattr(self._zookeeper, "amulti", None)
+        if amulti is None:
+            async_result.set_exception(err_to_exception(protocol.UNIMPLEMENTED,
+                "transactions require the 'python' engine"))
+            return async_result
+
+        callback = partial(_transaction_callback, async_result,
+            [op.type == Create.type for op in operations], unnamespace_path)
+
+        self._request('multi', amulti, callback, list(operations))
+        return async_result
+
+    def multi(self, operations):
+        """Apply a list of operations in one transaction
+
+        @param operations: kazoo.protocol Create, Delete, SetData and
+                           CheckVersion requests
+        @return: list of per-operation results, see TransactionRequest
+        """
+        return self.multi_async(operations).get()
+
+
+class TransactionRequest(object):
+    """Operations to be committed atomically with ZooKeeper's multi op
+
+    Build it up with create(), delete(), set() and check(), then commit()
+    it in a single round trip. Used as a context manager, it commits on
+    exit unless an exception was raised, and raises the failing
+    operation's error if the commit fails.
+
+    Committing returns one result per operation: the created path for
+    create(), the new stat for set() and True for delete() and check(). If
+    any operation fails, none are applied and every result is an exception
+    instance: the failing operation's real error, RolledBackException for
+    the operations before it and RuntimeInconsistencyException for those
+    after.
+    """
+
+    def __init__(self, client, default_acl=None):
+        """
+        @type client ZooKeeperClient
+        """
+        self.client = client
+        self.default_acl = default_acl
+        self.operations = []
+        self.committed = False
+
+    def create(self, path, value, acl=None, ephemeral=False, sequence=False):
+        """Add a node creation to the transaction
+
+        @param path: path of node
+        @param value: initial value of node
+        @param acl: permissions for node
+        @param ephemeral: boolean indicating whether node is ephemeral (tied to this session)
+        @param sequence: boolean indicating whether path is suffixed with a unique index
+        """
+        flags = 0
+        if ephemeral:
+            flags |= protocol.EPHEMERAL
+        if sequence:
+            flags |= protocol.SEQUENCE
+        if acl is None:
+            acl = self.default_acl or (ZK_OPEN_ACL_UNSAFE,)
+        self._add(Create(self._namespace_path(path), value, list(acl), flags))
+
+    def delete(self, path, version=-1):
+        """Add a node deletion to the transaction
+
+        @param path: path of node to delete
+        @param version: version of node to delete, or -1 for any
+        """
+        self._add(Delete(self._namespace_path(path), version))
+
+    def set(self, path, data, version=-1):
+        """Add a node value update to the transaction
+
+        @param path: path of node to set
+        @param data: new data value
+        @param version: version of node being updated, or -1
+        """
+        self._add(SetData(self._namespace_path(path), data, version))
+
+    def check(self, path, version):
+        """Add a version check to the transaction
+
+        The transaction fails with BadVersionException unless the node is at
+        this version when it is applied.
+
+        @param path: path of node to check
+        @param version: expected version of the node
+        """
+        self._add(CheckVersion(self._namespace_path(path), version))
+
+    def commit_async(self):
+        """Asynchronously commit the transaction
+
+        @return: AsyncResult set with the list of per-operation results
+        @rtype AsyncResult
+        """
+        self._check_uncommitted()
+        self.committed = True
+        return self.client._multi_async(self.operations,
+            self._unnamespace_path)
+
+    def commit(self):
+        """Commit the transaction
+
+        @return: list of per-operation results
+        """
+        return self.commit_async().get()
+
+    def _add(self, operation):
+        self._check_uncommitted()
+        self.operations.append(operation)
+
+    def _check_uncommitted(self):
+        if self.committed:
+            raise ValueError("transaction already committed")
+
+    def _namespace_path(self, path):
+        return path
+
+    def _unnamespace_path(self, path):
+        return path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            for result in self.commit():
+                if isinstance(result, Exception) and \
+                   not isinstance(result, RolledBackException):
+                    raise result
+
+
+def get_binding(engine, sync):
+    """Return the module-like object that talks to ZooKeeper for an engine
+
+    @param engine: "zkpython" or None for the C binding, "python" for the
+                   pure-Python connection engine
+    @param sync: sync strategy the engine should run on
+    """
+    if engine is None or engine == "zkpython":
+        return _zkpython_binding()
+    if engine == "python":
+        from kazoo.connection import PythonBinding
+        return PythonBinding(sync)
+    raise ValueError("unknown ZooKeeper engine '%s'" % engine)
+
+
+_zkpython = None
+
+def _zkpython_binding():
+    """Import zkpython on first use, so the python engine runs without it
+    """
+    global _zkpython
+    if _zkpython is None:
+        import zookeeper
+
+        # ZK C client likes to spew log info to STDERR. disable that unless
+        # an env is present.
+        if not "KAZOO_LOG_ENABLED" in os.environ:
+            zookeeper.set_log_stream(open('/dev/null'))
+
+        _zkpython = _ZkpythonBinding(zookeeper)
+    return _zkpython
+
+
+class _ZkpythonBinding(object):
+    """The zkpython module, raising kazoo's exceptions instead of its own
+    """
+
+    def __init__(self, zookeeper):
+        self._zookeeper = zookeeper
+        # zkpython exception class -> kazoo's of the same name
+        self._exceptions = {}
+        for name, exc in vars(exceptions).iteritems():
+            if isinstance(exc, type) and \
+               issubclass(exc, ZooKeeperException) and \
+               hasattr(zookeeper, name):
+                self._exceptions[getattr(zookeeper, name)] = exc
+
+    def __getattr__(self, name):
+        func = getattr(self._zookeeper, name)
+        if not callable(func):
+            return func
+
+        def call(*args):
+            try:
+                return func(*args)
+            except self._zookeeper.ZooKeeperException, e:
+                exc = self._exceptions.get(type(e), ZooKeeperException)
+                raise exc(*e.args), None, sys.exc_info()[2]
+
+        # only look each function up once
+        setattr(self, name, call)
+        return call
+
 
 def _generic_callback(async_result, handle, code, *args):
-    if code != zookeeper.OK:
+    if code != protocol.OK:
         exc = err_to_exception(code)
         async_result.set_exception(exc)
     else:
@@ -364,8 +698,26 @@ def _generic_callback(async_result, handle, code, *args):
         async_result.set(result)
 
 
+def _transaction_callback(async_result, creates, unnamespace_path, handle,
+                          code, results=None):
+    if code != protocol.OK:
+        async_result.set_exception(err_to_exception(code))
+        return
+
+    for i, result in enumerate(results):
+        if isinstance(result, ErrorResult):
+            if result.code == protocol.OK:
+                results[i] = RolledBackException()
+            else:
+                results[i] = err_to_exception(result.code)
+        elif creates[i] and unnamespace_path:
+            results[i] = unnamespace_path(result)
+
+    async_result.set(results)
+
+
 def _exists_callback(async_result, handle, code, stat):
-    if code not in (zookeeper.OK, zookeeper.NONODE):
+    if code not in (protocol.OK, protocol.NONODE):
         exc = err_to_exception(code)
         async_result.set_exception(exc)
     else:
@@ -374,34 +726,35 @@ def _exists_callback(async_result, handle, code, stat):
 
 # this dictionary is a port of err_to_exception() from zkpython zookeeper.c
 _ERR_TO_EXCEPTION = {
-    zookeeper.SYSTEMERROR: SystemErrorException,
-    zookeeper.RUNTIMEINCONSISTENCY: RuntimeInconsistencyException,
-    zookeeper.DATAINCONSISTENCY: DataInconsistencyException,
-    zookeeper.CONNECTIONLOSS: ConnectionLossException,
-    zookeeper.MARSHALLINGERROR: MarshallingErrorException,
-    zookeeper.UNIMPLEMENTED: UnimplementedException,
-    zookeeper.OPERATIONTIMEOUT: OperationTimeoutException,
-    zookeeper.BADARGUMENTS: BadArgumentsException,
-    zookeeper.APIERROR: ApiErrorException,
-    zookeeper.NONODE: NoNodeException,
-    zookeeper.NOAUTH: NoAuthException,
-    zookeeper.BADVERSION: BadVersionException,
-    zookeeper.NOCHILDRENFOREPHEMERALS: NoChildrenForEphemeralsException,
-    zookeeper.NODEEXISTS: NodeExistsException,
-    zookeeper.INVALIDACL: InvalidACLException,
-    zookeeper.AUTHFAILED: AuthFailedException,
-    zookeeper.NOTEMPTY: NotEmptyException,
-    zookeeper.SESSIONEXPIRED: SessionExpiredException,
-    zookeeper.INVALIDCALLBACK: InvalidCallbackException,
+    protocol.SYSTEMERROR: SystemErrorException,
+    protocol.RUNTIMEINCONSISTENCY: RuntimeInconsistencyException,
+    protocol.DATAINCONSISTENCY: DataInconsistencyException,
+    protocol.CONNECTIONLOSS: ConnectionLossException,
+    protocol.MARSHALLINGERROR: MarshallingErrorException,
+    protocol.UNIMPLEMENTED: UnimplementedException,
+    protocol.OPERATIONTIMEOUT: OperationTimeoutException,
+    protocol.BADARGUMENTS: BadArgumentsException,
+    protocol.APIERROR: ApiErrorException,
+    protocol.NONODE: NoNodeException,
+    protocol.NOAUTH: NoAuthException,
+    protocol.BADVERSION: BadVersionException,
+    protocol.NOCHILDRENFOREPHEMERALS: NoChildrenForEphemeralsException,
+    protocol.NODEEXISTS: NodeExistsException,
+    protocol.INVALIDACL: InvalidACLException,
+    protocol.AUTHFAILED: AuthFailedException,
+    protocol.NOTEMPTY: NotEmptyException,
+    protocol.SESSIONEXPIRED: SessionExpiredException,
+    protocol.INVALIDCALLBACK: InvalidCallbackException,
+    # the python engine fails requests on a closed or expired connection
+    # with these, which zkpython has no exceptions for
+    protocol.INVALIDSTATE: SessionExpiredException,
+    protocol.CLOSING: ConnectionLossException,
 }
 
 def err_to_exception(error_code, msg=None):
     """Return an exception object for a Zookeeper error code
     """
-    try:
-        zkmsg = zookeeper.zerror(error_code)
-    except Exception:
-        zkmsg = ""
+    zkmsg = protocol.zerror(error_code)
 
     if msg:
         if zkmsg:
@@ -413,7 +766,7 @@ def err_to_exception(error_code, msg=None):
     if exc is None:
 
         # double check that it isn't an ok resonse
-        if error_code == zookeeper.OK:
+        if error_code == protocol.OK:
             return None
 
         # otherwise generic exception